@@ -1,7 +1,6 @@
 # AnalyzerAgent - Compares tenant complaints to legal information
 import os
 from typing import Dict, List
-from langchain_nvidia_ai_endpoints import ChatNVIDIA
 
 try:
     from nemoguardrails import LLMRails, RailsConfig
@@ -16,11 +15,23 @@ try:
 except ImportError:
     MOCK_MODE = False
 
+from .prompt_builder import build_analyzer_prompt, build_fused_prompt, DEFAULT_VIOLATION_TOKEN_BUDGET
+from .prompt_templates import ANALYZER_TEMPLATE, FUSED_TEMPLATE, prompt_text
+from .local_guardrails import LocalGuardrails
+from .cancellation import CancelToken
+from .data_sources import Jurisdiction
+from .endpoint_guard import get_endpoint_guard, DEFAULT_CALL_TIMEOUT, LLMTimeoutError, LLMUnavailableError
+from .model_router import ModelRouter, MAIN_TIER
+
 class AnalyzerAgent:
-    def __init__(self):
+    def __init__(self, violation_token_budget: int = DEFAULT_VIOLATION_TOKEN_BUDGET):
         # Give the agent a name
         self.name = "AnalyzerAgent"
         
+        # Max tokens of violation history we put in the prompt
+        self.violation_token_budget = violation_token_budget
+        self.last_prompt_metrics = {}
+        
         # Get API key from environment
         api_key = os.getenv("NVIDIA_API_KEY")
         
@@ -32,19 +43,27 @@ class AnalyzerAgent:
         else:
             self.mock_mode = False
         
-        # Initialize NVIDIA LLM only if we have API key
+        # Initialize NVIDIA LLMs only if we have API key
+        # Simple complaints go to the fast tier, everything else to the 70B model
         if not self.mock_mode:
-            self.llm = ChatNVIDIA(
-                model="meta/llama-3.1-70b-instruct",
+            self.router = ModelRouter(
                 api_key=api_key,
                 temperature=0.1  # Low temperature for consistent legal analysis
             )
+            # NeMo Guardrails can't be handed a per-call timeout - its client gets the full call budget
+            self.llm = self.router.get_llm(MAIN_TIER, DEFAULT_CALL_TIMEOUT)
+        
+        # Shared rate limiter + circuit breaker for the NVIDIA endpoint
+        self.endpoint_guard = get_endpoint_guard("nvidia")
         
-        # Initialize NeMo Guardrails for safety
+        # Local pattern-based rails handle the clear cases without any LLM calls
+        config_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), "config")
+        self.local_rails = LocalGuardrails(config_path)
+        
+        # Initialize NeMo Guardrails for safety (only used for ambiguous inputs)
         self.guardrails = None
         if GUARDRAILS_AVAILABLE:
             try:
-                config_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), "config")
                 rails_config = RailsConfig.from_path(config_path)
                 self.guardrails = LLMRails(rails_config, llm=self.llm)
                 print(f"{self.name} initialized with NVIDIA LLM + NeMo Guardrails!")
@@ -54,9 +73,16 @@ class AnalyzerAgent:
         else:
             print(f"{self.name} initialized with NVIDIA LLM!")
     
-    def analyze_complaint(self, user_complaint, scraped_laws, violations_data):
+    def analyze_complaint(self, user_complaint, scraped_laws, violations_data,
+                          complaint_category=None, category_confidence=0.0, tenant_info=None,
+                          cancel_token: CancelToken = None, jurisdiction: Jurisdiction = None):
         """
         Uses NVIDIA LLM to analyze complaint against real legal data
+        complaint_category/category_confidence (from the workflow) pick the model tier
+        Passing tenant_info switches to fused mode: the same call also writes the complaint
+        letter, returned as "letter_content" (missing if the model didn't produce one)
+        cancel_token: the run's deadline - past it we answer with the fallback analysis
+        jurisdiction: whose law the prompt asks about (NYC if not given)
         """
         # Check if we're in mock mode
         if self.mock_mode:
@@ -68,36 +94,58 @@ class AnalyzerAgent:
         
         print(f"\n{self.name} analyzing complaint with NVIDIA AI...")
         
-        # Build the prompt for the LLM with JSON structure request
-        prompt = f"""You are a legal document analyst specializing in NYC tenant law.
-            Analyze this tenant complaint and identify which NYC housing laws apply.
-
-            TENANT COMPLAINT: {user_complaint}
-
-            BUILDING VIOLATION HISTORY: {violations_data[:3] if violations_data else "No violation history"}
-            
-            Based on your knowledge of NYC tenant law, identify the specific laws that apply to this complaint.
-            Include statute numbers when possible (e.g., NYC Admin Code §27-2009)
-
-            Respond in JSON format with these exact fields:
-            {{
-                "is_legitimate": "Yes" or "No",
-                "applicable_laws": ["list", "of", "statute", "numbers"],
-                "case_strength": "Weak" or "Moderate" or "Strong",
-                "evidence_needed": ["list", "of", "evidence", "to", "collect"],
-                "recommended_actions": ["list", "of", "actions", "to", "take"]
-            }}
-
-            Provide factual information only. Do not give legal advice."""
-
-        # Call NVIDIA LLM with or without guardrails
-        if self.guardrails:
-            # Use NeMo Guardrails for safe AI interaction
-            response_content = self.guardrails.generate(messages=[{"role": "user", "content": prompt}])
-            response = type('Response', (), {'content': response_content})()
+        # Build a compact prompt - only salient violation fields, within a token budget
+        template = FUSED_TEMPLATE if tenant_info is not None else ANALYZER_TEMPLATE
+        if tenant_info is not None:
+            prompt, prompt_metrics = build_fused_prompt(user_complaint, violations_data, tenant_info,
+                                                        self.violation_token_budget, jurisdiction)
         else:
-            # Direct LLM call
-            response = self.llm.invoke(prompt)
+            prompt, prompt_metrics = build_analyzer_prompt(user_complaint, violations_data,
+                                                           self.violation_token_budget, jurisdiction)
+        self.last_prompt_metrics = prompt_metrics
+        print(f"Prompt size: ~{prompt_metrics['prompt_tokens']} tokens "
+              f"({prompt_metrics['violations_used']}/{prompt_metrics['violations_in']} violations)")
+
+        # Run the input rails locally first - most complaints are clearly on topic
+        rail_check = self.local_rails.check_input(user_complaint)
+        if rail_check["action"] == "block":
+            print(f"🛡️ Input blocked by {rail_check['rail']}")
+            return {
+                "analysis": rail_check["message"],
+                "source": "Local Guardrails",
+                "blocked_by": rail_check["rail"],
+                "prompt_metrics": prompt_metrics
+            }
+        
+        tier = self.router.route(complaint_category, category_confidence)
+        source = self.router.get_label(tier)
+        
+        # Call NVIDIA LLM - only escalate to NeMo Guardrails when the local rails can't decide
+        # The endpoint guard fails fast when we're rate limited or the endpoint is down
+        try:
+            if self.guardrails and rail_check["action"] == "escalate":
+                print(f"🛡️ Escalating to NeMo Guardrails ({rail_check['rail']} was ambiguous)")
+                response_content = self.endpoint_guard.call(
+                    lambda timeout: self.guardrails.generate(messages=[{"role": "user", "content": prompt_text(prompt)}]),
+                    cancel_token=cancel_token
+                )
+                response = type('Response', (), {'content': response_content})()
+            else:
+                # Direct LLM call, then local output rails (advice language + disclaimer)
+                response = self.endpoint_guard.call(lambda timeout: self.router.invoke(tier, prompt, timeout),
+                                                    cancel_token=cancel_token)
+                template.record_usage(response)
+                response = type('Response', (), {
+                    'content': self.local_rails.apply_output(response.content, rail_check["message"])
+                })()
+        except LLMTimeoutError as e:
+            print(f"⏱️ Analysis out of time ({e}) - using fallback analysis")
+            if cancel_token is not None:
+                cancel_token.note("analysis: fallback (LLM out of time)")
+            return self.fallback_analysis(user_complaint, prompt_metrics, reason="LLM out of time")
+        except LLMUnavailableError as e:
+            print(f"⚠️ NVIDIA endpoint unavailable ({e}) - using fallback analysis")
+            return self.fallback_analysis(user_complaint, prompt_metrics)
         
         # Parse the structured response
         try:
@@ -107,18 +155,27 @@ class AnalyzerAgent:
             # Extract JSON from response (in case there's extra text)
             json_match = re.search(r'\{.*\}', response.content, re.DOTALL)
             if json_match:
-                parsed_data = json.loads(json_match.group())
+                # strict=False - models often put raw newlines inside the letter string
+                parsed_data = json.loads(json_match.group(), strict=False)
                 
                 # Return structured analysis
-                return {
+                result = {
                     "is_legitimate": parsed_data.get("is_legitimate", "Unknown"),
                     "applicable_laws": parsed_data.get("applicable_laws", []),
                     "case_strength": parsed_data.get("case_strength", "Unknown"),
                     "evidence_needed": parsed_data.get("evidence_needed", []),
                     "recommended_actions": parsed_data.get("recommended_actions", []),
                     "analysis": response.content,  # Keep raw response for fallback
-                    "source": "NVIDIA Llama 3.1 70B"
+                    "source": source,
+                    "model_tier": tier,
+                    "prompt_metrics": prompt_metrics
                 }
+                if tenant_info is not None and parsed_data.get("letter"):
+                    # Split the letter back out so the raw analysis text is just the analysis
+                    result["letter_content"] = parsed_data.pop("letter")
+                    result["analysis"] = (response.content[:json_match.start()] + json.dumps(parsed_data, indent=2)
+                                          + response.content[json_match.end():])
+                return result
             else:
                 raise ValueError("No JSON found in response")
                 
@@ -129,10 +186,25 @@ class AnalyzerAgent:
             # Fallback to original format
             return {
                 "analysis": response.content,
-                "source": "NVIDIA Llama 3.1 70B",
-                "parsing_error": str(e)
+                "source": source,
+                "model_tier": tier,
+                "parsing_error": str(e),
+                "prompt_metrics": prompt_metrics
             }
 
+    def fallback_analysis(self, user_complaint, prompt_metrics=None, reason="NVIDIA endpoint unavailable"):
+        """Canned analysis used when the LLM can't be reached in time"""
+        from .mock_responses import MockNVIDIAResponses
+        result = MockNVIDIAResponses.mock_analyzer_response(user_complaint, simulate_delay=False)
+        result["analysis"] = self.local_rails.apply_output(
+            "AI analysis is temporarily unavailable. The laws and steps below are general guidance "
+            "for this type of complaint."
+        )
+        result["source"] = f"Fallback ({reason})"
+        result["fallback"] = reason
+        result["prompt_metrics"] = prompt_metrics or {}
+        return result
+
 # Test the agent
 if __name__ == "__main__":
     agent = AnalyzerAgent()
@@ -0,0 +1,81 @@
+# Cancellation - A per-run deadline and cancel flag that every node and agent call checks
+#
+# One CancelToken is made per workflow run and handed down through the graph
+# config to the agents. Network calls size their timeouts from what's left of
+# the deadline, and once the run is cancelled or out of time the remaining
+# steps take their local fallbacks (no violations, canned analysis, template
+# letter) instead of starting new calls. What was cut short is noted on the
+# token so the result can say it's partial.
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+# Default deadline for a whole run in seconds (unset or 0 = no deadline)
+DEFAULT_RUN_DEADLINE = float(os.getenv("RIGHTSGUARD_RUN_DEADLINE", "0")) or None
+
+
+class CancelToken:
+    """Deadline + cancel flag for one workflow run, safe to share between threads"""
+
+    def __init__(self, deadline_seconds: float = None):
+        self.deadline_seconds = deadline_seconds
+        self.started = time.monotonic()
+        self.deadline = self.started + deadline_seconds if deadline_seconds else None
+        self.event = threading.Event()
+        self.reason = None
+        self.degraded: List[str] = []  # steps that were skipped or replaced by a fallback
+        self.lock = threading.Lock()
+
+    def cancel(self, reason: str = "cancelled"):
+        """Stop the run - calls in flight are abandoned, later steps use their fallbacks"""
+        with self.lock:
+            if self.reason is None:
+                self.reason = reason
+        self.event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        """Someone called cancel() (the user went away) - not just out of time"""
+        return self.event.is_set()
+
+    @property
+    def expired(self) -> bool:
+        return self.deadline is not None and time.monotonic() >= self.deadline
+
+    @property
+    def stopped(self) -> bool:
+        return self.cancelled or self.expired
+
+    def remaining(self) -> Optional[float]:
+        """Seconds left before the deadline (None if there isn't one)"""
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.monotonic())
+
+    def timeout(self, limit: float) -> float:
+        """A call's own timeout, cut down to what's left of the run"""
+        if self.stopped:
+            return 0.0
+        remaining = self.remaining()
+        return limit if remaining is None else min(limit, remaining)
+
+    def wait(self, seconds: float) -> bool:
+        """Sleep up to seconds, waking early on cancel() - True if the run was stopped"""
+        return self.event.wait(seconds) or self.expired
+
+    def note(self, what: str):
+        with self.lock:
+            self.degraded.append(what)
+
+    def get_status(self) -> Dict:
+        with self.lock:
+            return {
+                "deadline_seconds": self.deadline_seconds,
+                "elapsed_seconds": round(time.monotonic() - self.started, 3),
+                "cancelled": self.cancelled,
+                "expired": self.expired,
+                "reason": self.reason or ("deadline" if self.expired else None),
+                "partial": bool(self.degraded),
+                "degraded": list(self.degraded)
+            }
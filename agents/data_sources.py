@@ -0,0 +1,271 @@
+# Data Sources - Pluggable open-data violation sources, one or more per city
+#
+# A source declares everything the scraper needs to use a dataset: its
+# endpoint, how its rows map onto the HPD-style fields the agents read (field
+# projection), how it turns a tenant's address into a query, which
+# jurisdiction it serves, and how long answers may be cached. A jurisdiction
+# holds the city-specific wording for the prompts (which law, which code to
+# cite). Adding a city is a Jurisdiction plus a DataSource - subclass
+# DataSource and override fetch() for anything that isn't a Socrata dataset.
+#
+# The NYC HPD source sends the query the scraper always sent ($q = the
+# address as typed, 5 rows), so recorded traffic still replays.
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+
+import requests
+
+# Serve a cached answer for this long before asking the source again (seconds)
+DEFAULT_CACHE_TTL = float(os.getenv("RIGHTSGUARD_SOURCE_CACHE_TTL", "3600"))
+DEFAULT_CACHE_SIZE = int(os.getenv("RIGHTSGUARD_SOURCE_CACHE_SIZE", "2000"))
+# If a refresh fails, an expired answer younger than this is still better than nothing
+DEFAULT_STALE_IF_ERROR = float(os.getenv("RIGHTSGUARD_SOURCE_STALE_IF_ERROR", "86400"))
+
+
+class Jurisdiction:
+    """A city we can analyze complaints for, and how to talk about its law"""
+
+    def __init__(self, key: str, name: str, short_name: str, law_name: str, statute_example: str,
+                 address_pattern: str, data_owner: str, info_urls: Dict[str, str] = None):
+        self.key = key
+        self.name = name
+        self.short_name = short_name            # "NYC" in "NYC housing laws"
+        self.law_name = law_name                # "NYC tenant law"
+        self.statute_example = statute_example  # cited as an example in the analyzer prompt
+        self.address_pattern = re.compile(address_pattern, re.IGNORECASE)  # matched against the city/state part
+        self.data_owner = data_owner            # credited under the violations in the UI
+        self.info_urls = info_urls or {}
+
+    def matches(self, address: str) -> bool:
+        return bool(self.address_pattern.search(locality(address)))
+
+
+# Checked in order - NYC first, it's where most of our tenants are
+JURISDICTIONS = {
+    "nyc": Jurisdiction(
+        "nyc", "New York City", "NYC", "NYC tenant law", "NYC Admin Code §27-2009",
+        r"\b(new york|nyc|manhattan|brooklyn|bronx|queens|staten island|ny)\b",
+        "NYC Department of Housing Preservation & Development",
+        {'main': 'https://www.nyc.gov/site/rentguidelinesboard/tenants/tenants-rights.page',
+         'complaints': 'https://www.nyc.gov/site/hpd/services-and-information/tenants.page'}
+    ),
+    "chicago": Jurisdiction(
+        "chicago", "Chicago", "Chicago", "Chicago tenant law (RLTO)", "Chicago Municipal Code §5-12-110",
+        r"\b(chicago|il)\b", "City of Chicago Department of Buildings",
+        {'main': 'https://www.chicago.gov/city/en/depts/doh/provdrs/renters.html'}
+    )
+}
+
+# Addresses that don't name a city we know are treated as NYC, like before there were others
+DEFAULT_JURISDICTION = "nyc"
+
+
+def get_jurisdiction(key: str = None) -> Jurisdiction:
+    return JURISDICTIONS.get(key) or JURISDICTIONS[DEFAULT_JURISDICTION]
+
+
+def detect_jurisdiction(address: str) -> Jurisdiction:
+    """First jurisdiction whose pattern matches the address (NYC if none do)"""
+    for jurisdiction in JURISDICTIONS.values():
+        if jurisdiction.matches(address):
+            return jurisdiction
+    return get_jurisdiction()
+
+
+def locality(address: str) -> str:
+    """'500 Chicago Ave, Brooklyn, NY 11225' -> 'Brooklyn, NY 11225' (street names say nothing about the city)"""
+    street, comma, rest = (address or '').partition(',')
+    return rest if comma else street
+
+
+def collapse_whitespace(address: str) -> str:
+    """The address as typed, minus stray spaces (what the NYC source has always searched for)"""
+    return re.sub(r'\s+', ' ', address or '').strip()
+
+
+def street_address(address: str) -> str:
+    """'1234 w madison st, Chicago, IL 60607' -> '1234 W MADISON ST' (datasets store uppercase streets)"""
+    return collapse_whitespace((address or '').split(',')[0]).upper()
+
+
+class SourceCache:
+    """Small LRU of query -> rows, each answer kept fresh for ttl seconds"""
+
+    def __init__(self, max_entries: int, ttl: float, stale_if_error: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.stale_if_error = stale_if_error
+        self.entries = OrderedDict()  # query -> (fetched_at, rows)
+        self.lock = threading.Lock()
+
+    def get(self, query: str, allow_stale: bool = False) -> Optional[List[Dict]]:
+        with self.lock:
+            entry = self.entries.get(query)
+            if entry is None:
+                return None
+            age = time.time() - entry[0]
+            if age > (self.ttl + self.stale_if_error if allow_stale else self.ttl):
+                return None
+            self.entries.move_to_end(query)
+            return entry[1]
+
+    def put(self, query: str, rows: List[Dict]):
+        if self.max_entries <= 0 or self.ttl <= 0:
+            return
+        with self.lock:
+            self.entries[query] = (time.time(), rows)
+            self.entries.move_to_end(query)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+
+class DataSource:
+    """One Socrata violations dataset - subclass and override fetch() for other kinds of API"""
+
+    def __init__(self, name: str, jurisdiction: str, url: str, field_map: Dict[str, str],
+                 normalize_address: Callable[[str], str] = collapse_whitespace, limit: int = 5,
+                 timeout: float = 10, cache_ttl: float = DEFAULT_CACHE_TTL, cache_size: int = DEFAULT_CACHE_SIZE,
+                 stale_if_error: float = DEFAULT_STALE_IF_ERROR, label: str = None):
+        """
+        field_map: the source's field -> the HPD field name the agents read (see records.VIOLATION_FIELDS)
+        normalize_address: tenant address -> the search text sent to the source (also the cache key)
+        cache_ttl/stale_if_error: refresh policy - 0 turns caching off
+        """
+        self.name = name
+        self.jurisdiction = jurisdiction
+        self.url = url
+        self.field_map = field_map
+        self.normalize_address = normalize_address
+        self.limit = limit
+        self.timeout = timeout
+        self.label = label or name
+        self.cache = SourceCache(cache_size, cache_ttl, stale_if_error)
+        self.stats = {"queries": 0, "cache_hits": 0, "fetches": 0, "errors": 0, "stale_served": 0,
+                      "fetch_ms_total": 0.0, "fetch_ms_max": 0.0}
+        self.lock = threading.Lock()
+
+    def _count(self, key: str, amount: float = 1):
+        with self.lock:
+            self.stats[key] += amount
+
+    def build_params(self, query: str) -> Dict:
+        return {'$q': query, '$limit': self.limit}
+
+    def project(self, row: Dict) -> Dict:
+        """Rename the fields we use to their HPD names and drop the rest"""
+        return {field: row[source_field] for source_field, field in self.field_map.items()
+                if row.get(source_field) is not None}
+
+    def fetch(self, query: str, timeout: float) -> List[Dict]:
+        """Raw rows for a query - raise on failure so a stale answer can be served instead"""
+        response = requests.get(self.url, params=self.build_params(query), timeout=timeout)
+        if response.status_code != 200:
+            raise Exception(f"API error: {response.status_code}")
+        return response.json()
+
+    def query(self, address: str, timeout: float = None) -> List[Dict]:
+        """Projected violation rows for an address, from the cache when it's fresh"""
+        self._count("queries")
+        query = self.normalize_address(address)
+        rows = self.cache.get(query)
+        if rows is not None:
+            self._count("cache_hits")
+            return rows
+
+        started = time.perf_counter()
+        try:
+            rows = [self.project(row) for row in self.fetch(query, self.timeout if timeout is None else timeout)]
+        except Exception as e:
+            self._count("errors")
+            stale = self.cache.get(query, allow_stale=True)
+            print(f"Error calling {self.label}: {e}" + (" - using an older answer" if stale is not None else ""))
+            if stale is not None:
+                self._count("stale_served")
+                return stale
+            return []
+        finally:
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            with self.lock:
+                self.stats["fetches"] += 1
+                self.stats["fetch_ms_total"] += elapsed_ms
+                self.stats["fetch_ms_max"] = max(self.stats["fetch_ms_max"], elapsed_ms)
+
+        print(f"{self.label} returned {len(rows)} violations")
+        self.cache.put(query, rows)
+        return rows
+
+    def get_metrics(self) -> Dict:
+        with self.lock:
+            stats = dict(self.stats)
+        stats["hit_rate"] = round(stats["cache_hits"] / stats["queries"], 3) if stats["queries"] else 0.0
+        stats["avg_fetch_ms"] = round(stats["fetch_ms_total"] / stats["fetches"], 1) if stats["fetches"] else 0.0
+        stats["fetch_ms_total"] = round(stats["fetch_ms_total"], 1)
+        stats["fetch_ms_max"] = round(stats["fetch_ms_max"], 1)
+        stats["jurisdiction"] = self.jurisdiction
+        return stats
+
+
+# HPD field names pass straight through
+HPD_FIELDS = ['violationid', 'violationtype', 'inspectiondate', 'class', 'currentstatus', 'novdescription',
+              'boroid', 'block', 'lot', 'bbl']
+
+DATA_SOURCES: Dict[str, DataSource] = {}
+
+
+def register_source(source: DataSource) -> DataSource:
+    """Add (or replace) a source - the scraper queries every registered source for its jurisdiction"""
+    DATA_SOURCES[source.name] = source
+    return source
+
+
+register_source(DataSource(
+    "nyc_hpd_violations", "nyc", "https://data.cityofnewyork.us/resource/wvxf-dwi5.json",
+    {field: field for field in HPD_FIELDS}, label="NYC HPD violations API"
+))
+register_source(DataSource(
+    "chicago_building_violations", "chicago", "https://data.cityofchicago.org/resource/22u3-xenr.json",
+    {'id': 'violationid', 'violation_code': 'violationtype', 'violation_date': 'inspectiondate',
+     'violation_status': 'currentstatus', 'violation_description': 'novdescription'},
+    normalize_address=street_address, label="Chicago building violations API"
+))
+
+
+def enabled_sources() -> List[DataSource]:
+    """Registered sources, limited to RIGHTSGUARD_DATA_SOURCES (comma-separated names) if it's set"""
+    names = [name.strip() for name in os.getenv("RIGHTSGUARD_DATA_SOURCES", "").split(",") if name.strip()]
+    if not names:
+        return list(DATA_SOURCES.values())
+    return [DATA_SOURCES[name] for name in names if name in DATA_SOURCES]
+
+
+def sources_for(jurisdiction: str) -> List[DataSource]:
+    return [source for source in enabled_sources() if source.jurisdiction == jurisdiction]
+
+
+def find_source_by_url(url: str) -> Optional[DataSource]:
+    return next((source for source in DATA_SOURCES.values() if source.url == url), None)
+
+
+def get_all_source_metrics() -> Dict:
+    return {name: source.get_metrics() for name, source in DATA_SOURCES.items()}
+
+
+# Quick check (no network - fetch is swapped for a fake)
+if __name__ == "__main__":
+    for address in ["123 Main St, Brooklyn, NY", "1234 w Madison St, Chicago, IL 60607", "55 Elm St",
+                    "500 Chicago Ave, Brooklyn, NY", "1 New York Ave, Chicago, IL"]:
+        jurisdiction = detect_jurisdiction(address)
+        print(f"{address!r} -> {jurisdiction.name}: {[s.name for s in sources_for(jurisdiction.key)]}")
+
+    source = DATA_SOURCES["chicago_building_violations"]
+    calls = []
+    source.fetch = lambda query, timeout: calls.append(query) or [
+        {"id": "1", "violation_code": "CN190019", "violation_date": "2024-01-05T00:00:00.000",
+         "violation_status": "OPEN", "violation_description": "ARRANGE PREMISES SO THAT HEAT IS SUPPLIED"}]
+    print(source.query("1234 w Madison St, Chicago, IL"))
+    print(source.query("1234 W MADISON ST,  Chicago"))
+    print(calls, source.get_metrics())
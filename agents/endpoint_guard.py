@@ -0,0 +1,367 @@
+# EndpointGuard - Rate limiting and circuit breaking for NVIDIA LLM calls
+#
+# All agents that talk to the same NVIDIA endpoint share one guard:
+# - an adaptive token bucket that backs off on 429 / Retry-After and slowly
+#   speeds back up after successful calls
+# - a circuit breaker that stops calling an endpoint that keeps failing, so
+#   requests fail fast to the mock/template fallbacks instead of hanging
+# - a time budget per call (cut to the run's deadline when there is one). The
+#   budget is handed to the call as its HTTP timeout, so the request itself
+#   stops; we stop waiting at the budget or on cancel, and the request is left
+#   to wind down in the background
+# - a cap on calls in flight, abandoned ones included, so heavy cancelling
+#   can't pile up background threads and NVIDIA requests
+import os
+import re
+import threading
+import time
+from typing import Any, Callable, Dict
+
+from .cancellation import CancelToken
+
+# Default limits (override with environment variables)
+DEFAULT_RATE_PER_MINUTE = float(os.getenv("NVIDIA_RATE_LIMIT_RPM", "60"))
+DEFAULT_BURST = int(os.getenv("NVIDIA_RATE_LIMIT_BURST", "10"))
+DEFAULT_ACQUIRE_TIMEOUT = float(os.getenv("NVIDIA_RATE_LIMIT_WAIT", "5"))
+DEFAULT_FAILURE_THRESHOLD = int(os.getenv("NVIDIA_BREAKER_FAILURES", "5"))
+DEFAULT_RESET_TIMEOUT = float(os.getenv("NVIDIA_BREAKER_RESET", "30"))
+DEFAULT_CALL_TIMEOUT = float(os.getenv("NVIDIA_CALL_TIMEOUT", "60"))
+DEFAULT_MAX_IN_FLIGHT = int(os.getenv("NVIDIA_MAX_IN_FLIGHT", "16"))
+
+
+class LLMUnavailableError(Exception):
+    """The endpoint can't take this call right now - use a fallback"""
+    pass
+
+
+class LLMTimeoutError(LLMUnavailableError):
+    """The call missed its time budget or the run was cancelled - use a fallback"""
+    pass
+
+
+class PassThroughError(Exception):
+    """
+    A call failure that says nothing about the endpoint (like a playback miss) - raised to
+    the caller as is, so it isn't hidden behind a fallback or counted by the breaker
+    """
+    pass
+
+
+def get_status_code(error: Exception):
+    """HTTP status from a ChatNVIDIA error (it raises plain Exceptions like '[429] Too Many Requests')"""
+    response = getattr(error, 'response', None)
+    if response is not None and getattr(response, 'status_code', None):
+        return response.status_code
+    match = re.search(r'\[(\d{3})\]', str(error))
+    return int(match.group(1)) if match else None
+
+
+def get_retry_after(error: Exception):
+    """Seconds the server asked us to wait, if it told us"""
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None) or {}
+    value = headers.get('Retry-After')
+    if value is None:
+        match = re.search(r'retry[- ]after\D{0,5}(\d+(\.\d+)?)', str(error), re.IGNORECASE)
+        value = match.group(1) if match else None
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+class AdaptiveTokenBucket:
+    """
+    Token bucket whose refill rate drops when the endpoint says we're too fast
+    (multiplicative decrease) and creeps back up while calls succeed (additive increase)
+    """
+
+    def __init__(self, rate_per_minute: float = DEFAULT_RATE_PER_MINUTE, burst: int = DEFAULT_BURST):
+        self.max_rate = rate_per_minute / 60.0
+        self.min_rate = self.max_rate / 20
+        self.rate = self.max_rate
+        self.capacity = burst
+        self.tokens = float(burst)
+        self.last_refill = time.monotonic()
+        self.blocked_until = 0.0
+        self.lock = threading.Lock()
+        self.stats = {"acquired": 0, "timed_out": 0, "rate_limited": 0}
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.last_refill) * self.rate)
+        self.last_refill = now
+
+    def acquire(self, timeout: float = DEFAULT_ACQUIRE_TIMEOUT) -> bool:
+        """Wait for a token for up to timeout seconds"""
+        deadline = time.monotonic() + timeout
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self._refill(now)
+                if now >= self.blocked_until and self.tokens >= 1:
+                    self.tokens -= 1
+                    self.stats["acquired"] += 1
+                    return True
+                # How long until we could have a token
+                wait = max(self.blocked_until - now, (1 - self.tokens) / self.rate)
+            if now + wait > deadline:
+                with self.lock:
+                    self.stats["timed_out"] += 1
+                return False
+            time.sleep(min(wait, 0.25))
+
+    def on_rate_limited(self, retry_after: float = None):
+        """Got a 429: slow down, and pause entirely if the server said for how long"""
+        with self.lock:
+            self.stats["rate_limited"] += 1
+            self.rate = max(self.min_rate, self.rate / 2)
+            self.tokens = 0
+            pause = retry_after if retry_after is not None else 1 / self.rate
+            self.blocked_until = max(self.blocked_until, time.monotonic() + pause)
+
+    def on_success(self):
+        """A call went through: speed back up a little (5% of the max rate per call)"""
+        with self.lock:
+            self.rate = min(self.max_rate, self.rate + self.max_rate * 0.05)
+
+    def get_metrics(self) -> Dict:
+        with self.lock:
+            self._refill(time.monotonic())
+            return dict(self.stats,
+                        rate_per_minute=round(self.rate * 60, 2),
+                        max_rate_per_minute=round(self.max_rate * 60, 2),
+                        tokens=round(self.tokens, 2),
+                        paused_for=round(max(0.0, self.blocked_until - time.monotonic()), 2))
+
+
+class CircuitBreaker:
+    """closed -> (too many failures) -> open -> (reset timeout) -> half_open -> closed or open"""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = DEFAULT_FAILURE_THRESHOLD,
+                 reset_timeout: float = DEFAULT_RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trial_in_flight = False
+        self.lock = threading.Lock()
+        self.stats = {"times_opened": 0, "fast_failed": 0}
+
+    def allow(self) -> bool:
+        with self.lock:
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self.trial_in_flight = False
+
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.HALF_OPEN and not self.trial_in_flight:
+                # Let exactly one call through to test the endpoint
+                self.trial_in_flight = True
+                return True
+
+            self.stats["fast_failed"] += 1
+            return False
+
+    def release_trial(self):
+        """The half-open trial call never reached the endpoint"""
+        with self.lock:
+            self.trial_in_flight = False
+
+    def record_success(self):
+        with self.lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self.trial_in_flight = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    self.stats["times_opened"] += 1
+                    print(f"⚡ Circuit breaker OPEN after {self.failures} failures - using fallbacks "
+                          f"for {self.reset_timeout:.0f}s")
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+                self.trial_in_flight = False
+
+    def get_metrics(self) -> Dict:
+        with self.lock:
+            return dict(self.stats, state=self.state, consecutive_failures=self.failures)
+
+
+class EndpointGuard:
+    """Rate limiter + circuit breaker around calls to one LLM endpoint"""
+
+    def __init__(self, name: str, max_in_flight: int = DEFAULT_MAX_IN_FLIGHT):
+        self.name = name
+        self.bucket = AdaptiveTokenBucket()
+        self.breaker = CircuitBreaker()
+        self.max_in_flight = max_in_flight
+        self.slots = threading.BoundedSemaphore(max_in_flight)
+        self.stats = {"calls": 0, "succeeded": 0, "failed": 0, "timed_out": 0, "no_slot": 0,
+                      "in_flight": 0, "abandoned_in_flight": 0}
+        self.lock = threading.Lock()
+
+    def _count(self, key: str, amount: int = 1):
+        with self.lock:
+            self.stats[key] += amount
+
+    def call(self, fn: Callable[[float], Any], acquire_timeout: float = DEFAULT_ACQUIRE_TIMEOUT,
+             cancel_token: CancelToken = None, call_timeout: float = DEFAULT_CALL_TIMEOUT) -> Any:
+        """
+        Run fn(timeout) if the endpoint is healthy and we have capacity, else raise LLMUnavailableError
+        fn gets the seconds it has and should use them as its HTTP timeout
+        Raises LLMTimeoutError if fn takes longer than call_timeout (or what's left of the run)
+        """
+        self._count("calls")
+        if cancel_token is not None:
+            if cancel_token.stopped:
+                self._count("timed_out")
+                raise LLMTimeoutError(f"{self.name} call skipped - run {cancel_token.reason or 'deadline passed'}")
+            acquire_timeout = cancel_token.timeout(acquire_timeout)
+            call_timeout = cancel_token.timeout(call_timeout)
+        if not self.breaker.allow():
+            raise LLMUnavailableError(f"{self.name} circuit is open")
+        if not self.slots.acquire(timeout=acquire_timeout):
+            self.breaker.release_trial()
+            self._count("no_slot")
+            raise LLMUnavailableError(f"{self.name} has {self.max_in_flight} calls in flight - "
+                                      f"none finished within {acquire_timeout:.1f}s")
+        if not self.bucket.acquire(acquire_timeout):
+            # Not the endpoint's fault - give back the half-open trial if we had it
+            self.slots.release()
+            self.breaker.release_trial()
+            raise LLMUnavailableError(f"{self.name} rate limit - no capacity within {acquire_timeout:.0f}s")
+
+        # Run the call on its own thread so we can stop waiting for it on cancel. It holds
+        # its slot (and still counts for the breaker) until its own HTTP timeout ends it
+        outcome = {}
+        done = threading.Event()
+
+        def run():
+            self._count("in_flight")
+            cpu_started = time.thread_time()
+            try:
+                outcome["result"] = self._call_and_record(lambda: fn(call_timeout))
+            except (LLMUnavailableError, PassThroughError) as e:
+                outcome["error"] = e
+            finally:
+                # For the run profiler: building the request and parsing the answer is the caller's CPU
+                threading.current_thread().cpu_seconds = time.thread_time() - cpu_started
+                with self.lock:
+                    self.stats["in_flight"] -= 1
+                    if outcome.get("abandoned"):
+                        self.stats["abandoned_in_flight"] -= 1
+                    done.set()
+                self.slots.release()
+
+        worker = threading.Thread(target=run, name=f"{self.name}-call", daemon=True)
+        worker.profile_parent = threading.get_ident()
+        worker.start()
+        give_up_at = time.monotonic() + call_timeout
+        while not done.wait(min(0.1, max(0.0, give_up_at - time.monotonic()))):
+            if time.monotonic() >= give_up_at or (cancel_token is not None and cancel_token.cancelled):
+                with self.lock:
+                    if done.is_set():
+                        break  # finished just now after all
+                    outcome["abandoned"] = True
+                    self.stats["abandoned_in_flight"] += 1
+                    self.stats["timed_out"] += 1
+                why = (f"run {cancel_token.reason}" if cancel_token is not None and cancel_token.cancelled
+                       else f"no answer within {call_timeout:.1f}s")
+                raise LLMTimeoutError(f"{self.name} call abandoned - {why}")
+
+        if "error" in outcome:
+            raise outcome["error"]
+        return outcome["result"]
+
+    def _call_and_record(self, fn: Callable[[], Any]) -> Any:
+        try:
+            result = fn()
+        except PassThroughError:
+            self._count("failed")
+            raise
+        except Exception as e:
+            self._count("failed")
+            status = get_status_code(e)
+            if status == 429:
+                self.bucket.on_rate_limited(get_retry_after(e))
+            # Client errors other than 429 are our bug, not an unhealthy endpoint
+            if status is None or status == 429 or status >= 500:
+                self.breaker.record_failure()
+            raise LLMUnavailableError(f"{self.name} call failed: {e}") from e
+
+        self._count("succeeded")
+        self.bucket.on_success()
+        self.breaker.record_success()
+        return result
+
+    def get_metrics(self) -> Dict:
+        with self.lock:
+            stats = dict(self.stats)
+        return dict(stats, rate_limiter=self.bucket.get_metrics(), circuit_breaker=self.breaker.get_metrics())
+
+
+# One guard per endpoint, shared by every agent in the process
+_guards = {}
+_guards_lock = threading.Lock()
+
+
+def get_endpoint_guard(endpoint: str = "nvidia") -> EndpointGuard:
+    with _guards_lock:
+        if endpoint not in _guards:
+            _guards[endpoint] = EndpointGuard(endpoint)
+        return _guards[endpoint]
+
+
+def get_all_guard_metrics() -> Dict:
+    with _guards_lock:
+        guards = dict(_guards)
+    return {name: guard.get_metrics() for name, guard in guards.items()}
+
+
+# Quick check with a flaky fake endpoint
+if __name__ == "__main__":
+    guard = EndpointGuard("test")
+    guard.breaker.reset_timeout = 0.5
+
+    def rate_limited(timeout):
+        raise Exception("[429] Too Many Requests\nRetry-After: 0.2")
+
+    def down(timeout):
+        raise Exception("[503] Service Unavailable")
+
+    for fn in [lambda timeout: "ok", rate_limited, down, down, down, down, down, lambda timeout: "ok"]:
+        try:
+            print(guard.call(fn, acquire_timeout=3))
+        except LLMUnavailableError as e:
+            print(f"fallback: {e}")
+
+    time.sleep(0.6)
+    print(guard.call(lambda timeout: "recovered"))
+
+    # A slow endpoint: four callers at once, two slots - abandoned calls keep theirs until the
+    # request's own timeout ends it, so the other two are turned away instead of piling up
+    small = EndpointGuard("slow", max_in_flight=2)
+
+    def slow_caller():
+        try:
+            small.call(lambda timeout: time.sleep(timeout * 1.5), acquire_timeout=0.1, call_timeout=0.2)
+        except LLMUnavailableError as e:
+            print(f"fallback: {e}")
+
+    callers = [threading.Thread(target=slow_caller) for _ in range(4)]
+    for caller in callers:
+        caller.start()
+    for caller in callers:
+        caller.join()
+    print(small.get_metrics())
+    time.sleep(0.2)
+    print(small.call(lambda timeout: "slot free again"), guard.get_metrics())
@@ -1,10 +1,18 @@
 # LetterAgent - Generates formal legal complaint letters
 import os
 from typing import Dict
-from langchain_nvidia_ai_endpoints import ChatNVIDIA
+
+from .cancellation import CancelToken
+from .data_sources import Jurisdiction
+from .endpoint_guard import get_endpoint_guard, LLMTimeoutError, LLMUnavailableError
+from .letter_cache import LetterCache, DEFAULT_CACHE_DIR
+from .model_router import ModelRouter
+from .prompt_builder import build_letter_prompt
+from .prompt_templates import LETTER_TEMPLATE
+from .mock_responses import MockNVIDIAResponses
 
 class LetterAgent:
-    def __init__(self):
+    def __init__(self, cache_dir: str = DEFAULT_CACHE_DIR):
         # Give the agent a name
         self.name = "LetterAgent"
         
@@ -13,52 +21,72 @@ class LetterAgent:
         if not api_key:
             raise ValueError("NVIDIA_API_KEY not found in environment variables")
         
-        # Initialize NVIDIA LLM - this is our connection to the AI
-        self.llm = ChatNVIDIA(
-            model="meta/llama-3.1-70b-instruct",
+        # Initialize NVIDIA LLMs - simple complaints get the fast tier, the rest the 70B model
+        self.router = ModelRouter(
             api_key=api_key,
             temperature=0.2  # Slightly higher for more natural letter writing
         )
         
+        # Shared with the AnalyzerAgent - same NVIDIA endpoint, same limits
+        self.endpoint_guard = get_endpoint_guard("nvidia")
+        
+        # Repeat and edit-and-resubmit requests reuse earlier letters
+        self.cache = LetterCache(cache_dir)
+        
         print(f"{self.name} initialized with NVIDIA LLM!")
     
-    def generate_complaint_letter(self, analysis_data: Dict, tenant_info: Dict) -> Dict:
+    def generate_complaint_letter(self, analysis_data: Dict, tenant_info: Dict,
+                                  complaint_category: str = None, category_confidence: float = 0.0,
+                                  cancel_token: CancelToken = None, jurisdiction: Jurisdiction = None) -> Dict:
         """
         Uses NVIDIA LLM to generate formal complaint letter
+        complaint_category/category_confidence (from the workflow) pick the model tier
+        cancel_token: the run's deadline - if the LLM can't answer within it we fill in the template
+        jurisdiction: whose laws the letter cites (NYC if not given)
         """
+        # Same analysis as before? Reuse that letter (with the tenant details swapped in if they changed)
+        cache_scope = ((jurisdiction.key if jurisdiction else ""), LETTER_TEMPLATE.label)
+        cached_letter = self.cache.get(analysis_data, tenant_info, *cache_scope)
+        if cached_letter:
+            print(f"\n{self.name} reusing cached complaint letter ({cached_letter['cached']})")
+            return cached_letter
+        
         print(f"\n{self.name} generating complaint letter with NVIDIA AI...")
         
-        # Build the prompt for letter generation
-        prompt = f"""You are a professional legal document writer specializing in tenant rights.
-
-Generate a formal complaint letter using the EXACT information provided below. Do NOT use placeholders like [Your Name] or [Your Address]. Use the actual names and addresses provided.
-
-ANALYSIS: {analysis_data.get('analysis', 'No analysis provided')}
-
-TENANT INFORMATION (USE THESE EXACT VALUES):
-- Tenant Name: {tenant_info.get('name', 'Tenant Name')}
-- Property Address: {tenant_info.get('address', 'Property Address')}
-- Landlord/Company: {tenant_info.get('landlord', 'Landlord Name')}
-- Today's Date: {tenant_info.get('date', 'Date of Issue')}
+        # Fixed instructions in the system message, just this analysis and tenant in the user message
+        prompt, _ = build_letter_prompt(analysis_data, tenant_info, jurisdiction)
 
-LETTER FORMAT REQUIREMENTS:
-1. Start with the tenant's name and property address (not placeholders)
-2. Address the letter to the specific landlord/company name provided
-3. Use today's date as provided
-4. Include a clear "Re:" subject line about the specific property address
-5. Reference relevant NYC laws and statutes from the analysis
-6. Request specific remedial action with a 10-day deadline
-7. End with the tenant's actual name
-
-CRITICAL: Replace ALL placeholder text with the actual information provided above. Do not include any text in brackets like [Name] or [Address]."""
-
-        # Call NVIDIA LLM to generate the letter
-        response = self.llm.invoke(prompt)
+        # Call NVIDIA LLM to generate the letter (fails fast if the endpoint is unhealthy)
+        tier = self.router.route(complaint_category, category_confidence)
+        try:
+            response = self.endpoint_guard.call(lambda timeout: self.router.invoke(tier, prompt, timeout),
+                                                cancel_token=cancel_token)
+        except LLMTimeoutError as e:
+            print(f"⏱️ Letter out of time ({e}) - using letter template")
+            if cancel_token is not None:
+                cancel_token.note("letter: template (LLM out of time)")
+            return self.template_letter(analysis_data, tenant_info, reason="LLM out of time")
+        except LLMUnavailableError as e:
+            print(f"⚠️ NVIDIA endpoint unavailable ({e}) - using letter template")
+            return self.template_letter(analysis_data, tenant_info)
+        LETTER_TEMPLATE.record_usage(response)
         
-        # Return the generated letter
-        return {
+        # Return the generated letter (template fallbacks above are never cached)
+        letter = {
             "letter_content": response.content,
-            "generated_by": "NVIDIA Llama 3.1 70B",
+            "generated_by": self.router.get_label(tier),
+            "model_tier": tier,
+            "letter_type": "Tenant Complaint Letter"
+        }
+        self.cache.put(analysis_data, tenant_info, letter, *cache_scope)
+        return letter
+
+    def template_letter(self, analysis_data: Dict, tenant_info: Dict, reason: str = "NVIDIA endpoint unavailable") -> Dict:
+        """Fill in the standard letter template without calling the LLM"""
+        letter = MockNVIDIAResponses.mock_letter_response(analysis_data, tenant_info, simulate_delay=False)
+        return {
+            "letter_content": letter["letter_content"],
+            "generated_by": f"Letter Template ({reason})",
             "letter_type": "Tenant Complaint Letter"
         }
 
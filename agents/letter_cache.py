@@ -0,0 +1,245 @@
+# LetterCache - Reuses generated complaint letters instead of calling the LLM again
+#
+# Letters are stored under a hash of the structured analysis, the jurisdiction
+# and the letter template version (a new template never serves old letters).
+# If the same analysis comes back with the same tenant details, the letter is
+# returned as is. If it's the same property and only the other details changed
+# (a typo fixed in the landlord name, a new date), the old values are swapped
+# for the new ones in the cached text - unless any piece of an old value is
+# still left in the letter afterwards, so one tenant's details never end up in
+# another tenant's letter.
+#
+# Two tiers: a small in-memory LRU in front of one JSON file per analysis on
+# disk. The disk tier is capped by entry count and age, least recently used
+# files go first.
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+# Tenant details that appear verbatim in the letter and can be substituted
+TENANT_FIELDS = ['name', 'address', 'landlord', 'date']
+
+# Analysis fields that decide what the letter says
+ANALYSIS_FIELDS = ['is_legitimate', 'applicable_laws', 'case_strength', 'evidence_needed', 'recommended_actions']
+
+DEFAULT_CACHE_DIR = os.getenv("RIGHTSGUARD_LETTER_CACHE_DIR", "letter_cache")
+DEFAULT_MEMORY_ENTRIES = 128
+DEFAULT_DISK_ENTRIES = int(os.getenv("RIGHTSGUARD_LETTER_CACHE_SIZE", "1000"))
+DEFAULT_MAX_AGE_DAYS = float(os.getenv("RIGHTSGUARD_LETTER_CACHE_DAYS", "30"))
+
+
+def cache_enabled() -> bool:
+    """RIGHTSGUARD_LETTER_CACHE=0 turns the cache off (load tests measure real letter generation)"""
+    return os.getenv("RIGHTSGUARD_LETTER_CACHE", "1").lower() not in ("0", "false", "no")
+
+
+def analysis_key(analysis_data: Dict, jurisdiction: str = "", template: str = "") -> str:
+    """Content hash of the parts of the analysis the letter is written from, plus whose law and which prompt"""
+    if 'is_legitimate' in analysis_data:
+        content = {field: analysis_data.get(field) for field in ANALYSIS_FIELDS}
+    else:
+        # Unstructured analysis - the raw text is all we have
+        content = {'analysis': analysis_data.get('analysis', '')}
+    content['jurisdiction'] = jurisdiction or ''
+    content['template'] = template or ''
+    encoded = json.dumps(content, sort_keys=True, default=str).encode('utf-8')
+    return hashlib.sha256(encoded).hexdigest()[:32]
+
+
+def tenant_fields(tenant_info: Dict) -> Dict:
+    return {field: str(tenant_info.get(field) or '').strip() for field in TENANT_FIELDS}
+
+
+def substitute_fields(letter: str, old_fields: Dict, new_fields: Dict) -> Optional[str]:
+    """
+    Swap old tenant details for new ones in a letter
+    Returns None when a changed value can't be found in the text (not safe to reuse)
+    """
+    changed = [field for field in TENANT_FIELDS if old_fields.get(field) != new_fields.get(field)]
+
+    # Longest values first so "123 Main St, Apt 4" is replaced before "123 Main St"
+    changed.sort(key=lambda field: -len(old_fields.get(field) or ''))
+    placeholders = {}
+    for i, field in enumerate(changed):
+        old_value = old_fields.get(field)
+        # Whole words only, so a short name like "Al" doesn't rewrite "Also"
+        pattern = re.compile(r'(?<!\w)' + re.escape(old_value or '') + r'(?!\w)')
+        if not old_value or not pattern.search(letter):
+            return None
+        # Two-step swap so a new value that contains another field's old value isn't replaced twice
+        placeholder = f"\x00{i}\x00"
+        letter = pattern.sub(placeholder, letter)
+        placeholders[placeholder] = new_fields.get(field, '')
+
+    # Any word of an old value still in the text (a first name on its own, "Street" for "St")
+    # means the letter still carries the other tenant's details
+    for field in changed:
+        new_words = set(re.findall(r'\w+', new_fields.get(field) or '', re.IGNORECASE))
+        for word in set(re.findall(r'\w+', old_fields.get(field) or '')) - new_words:
+            if re.search(r'(?<!\w)' + re.escape(word) + r'(?!\w)', letter, re.IGNORECASE):
+                return None
+
+    for placeholder, new_value in placeholders.items():
+        letter = letter.replace(placeholder, new_value)
+    return letter
+
+
+class LetterCache:
+    """Content-addressed letter cache with a memory LRU and an on-disk tier"""
+
+    def __init__(self, cache_dir: str = DEFAULT_CACHE_DIR, memory_entries: int = DEFAULT_MEMORY_ENTRIES,
+                 disk_entries: int = DEFAULT_DISK_ENTRIES, max_age_days: float = DEFAULT_MAX_AGE_DAYS,
+                 enabled: bool = None):
+        self.name = "LetterCache"
+        self.enabled = cache_enabled() if enabled is None else enabled
+        self.cache_dir = cache_dir
+        self.memory_entries = memory_entries
+        self.disk_entries = disk_entries
+        self.max_age = max_age_days * 86400
+        self.memory = OrderedDict()  # analysis key -> entry
+        self.lock = threading.Lock()
+        self.stats = {"hits": 0, "rewrites": 0, "misses": 0, "stores": 0, "evicted": 0}
+        if self.enabled:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def _remember(self, key: str, entry: Dict):
+        """Put an entry at the front of the memory LRU"""
+        self.memory[key] = entry
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.memory_entries:
+            self.memory.popitem(last=False)
+
+    def _load(self, key: str) -> Optional[Dict]:
+        """Memory first, then disk"""
+        with self.lock:
+            entry = self.memory.get(key)
+            if entry is not None:
+                self.memory.move_to_end(key)
+                return entry
+
+        path = self._path(key)
+        try:
+            if time.time() - os.path.getmtime(path) > self.max_age:
+                os.remove(path)
+                return None
+            with open(path, 'r') as f:
+                entry = json.load(f)
+            os.utime(path)  # mtime doubles as last-used time for eviction
+        except (OSError, json.JSONDecodeError):
+            return None
+
+        with self.lock:
+            self._remember(key, entry)
+        return entry
+
+    def get(self, analysis_data: Dict, tenant_info: Dict, jurisdiction: str = "", template: str = "") -> Optional[Dict]:
+        """
+        Cached letter for this analysis + tenant (a copy - callers may edit it)
+        Rewritten if it's the same property and only the other tenant details changed
+        """
+        if not self.enabled:
+            return None
+        key = analysis_key(analysis_data, jurisdiction, template)
+        entry = self._load(key)
+        new_fields = tenant_fields(tenant_info)
+
+        letter = None
+        if entry is not None:
+            if entry["tenant"] == new_fields:
+                letter = dict(entry["letter"], cached="hit")
+                self._count("hits")
+            elif entry["tenant"]["address"].lower() == new_fields["address"].lower():
+                content = substitute_fields(entry["letter"]["letter_content"], entry["tenant"], new_fields)
+                if content is not None:
+                    letter = dict(entry["letter"], letter_content=content, cached="rewrite")
+                    self._count("rewrites")
+
+        if letter is None:
+            self._count("misses")
+        return letter
+
+    def put(self, analysis_data: Dict, tenant_info: Dict, letter: Dict, jurisdiction: str = "", template: str = ""):
+        """Store a freshly generated letter (memory and disk) - a copy, so later edits to it don't leak in"""
+        if not self.enabled:
+            return
+        key = analysis_key(analysis_data, jurisdiction, template)
+        entry = {"tenant": tenant_fields(tenant_info), "letter": dict(letter), "created": time.time()}
+        with self.lock:
+            self._remember(key, entry)
+            self.stats["stores"] += 1
+
+        # Write to a temp file first so readers never see half a letter
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(entry, f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"⚠️ Could not write letter cache entry: {e}")
+            return
+        self.evict()
+
+    def evict(self) -> int:
+        """Drop expired files, then the least recently used until we're under the size cap"""
+        try:
+            files = [os.path.join(self.cache_dir, name) for name in os.listdir(self.cache_dir) if name.endswith('.json')]
+            files = [(os.path.getmtime(path), path) for path in files]
+        except OSError:
+            return 0
+
+        now = time.time()
+        files.sort()
+        expired = [path for mtime, path in files if now - mtime > self.max_age]
+        live = [path for mtime, path in files if now - mtime <= self.max_age]
+        overflow = live[:max(0, len(live) - self.disk_entries)]
+
+        removed = 0
+        for path in expired + overflow:
+            try:
+                os.remove(path)
+                removed += 1
+            except OSError:
+                pass  # another process got to it first
+        if removed:
+            self._count("evicted", removed)
+        return removed
+
+    def _count(self, key: str, amount: int = 1):
+        with self.lock:
+            self.stats[key] += amount
+
+    def get_metrics(self) -> Dict:
+        with self.lock:
+            metrics = dict(self.stats)
+            metrics["memory_entries"] = len(self.memory)
+        metrics["enabled"] = self.enabled
+        lookups = metrics["hits"] + metrics["rewrites"] + metrics["misses"]
+        metrics["hit_rate"] = round((metrics["hits"] + metrics["rewrites"]) / lookups, 3) if lookups else 0.0
+        return metrics
+
+
+# Quick check: store a letter, then look it up with a corrected landlord name
+if __name__ == "__main__":
+    import tempfile
+
+    cache = LetterCache(tempfile.mkdtemp(), disk_entries=2)
+    analysis = {"is_legitimate": "Yes", "applicable_laws": ["NYC Admin Code §27-2029"], "case_strength": "Strong"}
+    tenant = {"name": "John Doe", "address": "123 Main St", "landlord": "ABC Mgmt", "date": "January 15, 2024"}
+    cache.put(analysis, tenant, {"letter_content": "John Doe\n123 Main St\n\nDear ABC Mgmt,\n...\nThank you,\nJohn",
+                                 "generated_by": "NVIDIA Llama 3.1 70B"})
+
+    print(cache.get(analysis, tenant)["letter_content"])
+    print(cache.get(analysis, dict(tenant, landlord="ABC Management LLC"))["letter_content"])
+    print(cache.get(analysis, dict(tenant, name="Jane Roe")))  # "John" on its own would stay in - refused
+    print(cache.get(analysis, dict(tenant, address="9 Elm St")))  # another property - never rewritten
+    print(cache.get(dict(analysis, case_strength="Weak"), tenant))
+    print(cache.get_metrics())
@@ -0,0 +1,158 @@
+# LocalGuardrails - Fast pattern-based versions of the rails in config/guardrails_config.yaml
+import os
+import re
+import threading
+import time
+from typing import Dict
+
+# Default bot messages - same wording as the config file
+OFF_TOPIC_MESSAGE = ("I can only help with NYC tenant rights and housing law information. "
+                     "Please ask about landlord-tenant issues, lease violations, or housing conditions.")
+ADVICE_CLARIFICATION = ("I can provide information about NYC tenant rights, but I cannot give legal advice. "
+                        "For legal advice, please consult with a qualified attorney.")
+LEGAL_DISCLAIMER = ("Important: This is informational only and not legal advice. "
+                    "Consult with a qualified attorney for legal guidance specific to your situation.")
+
+# Words that tell us the input is about housing
+HOUSING_PATTERN = re.compile(
+    r"\b(landlord|tenant|apartment|apt|building|rent|lease|super(intendent)?|heat(ing)?|hot water|cold|"
+    r"mold|mould|leak|water|flood(ing)?|drip|pest|roach(es)?|mice|rats?|bugs?|entry|enter(ed|ing)?|notice|"
+    r"privacy|repairs?|broken|fix|maintenance|evict(ion)?|deposit|housing|hpd|311)\b",
+    re.IGNORECASE
+)
+
+# Topics the rails refuse (see "define user ask off topic")
+OFF_TOPIC_PATTERN = re.compile(
+    r"\b(criminal law|taxes|tax return|irs|medical|diagnos\w*|prescription|relationship|divorce|custody|"
+    r"immigration|stocks?|crypto\w*|invest(ing|ment)?)\b",
+    re.IGNORECASE
+)
+
+# Requests for legal advice (see "define user ask legal advice")
+ADVICE_REQUEST_PATTERN = re.compile(
+    r"\b(should i (sue|take .* to court)|what should i do legally|(can|will) you be my (lawyer|attorney)|"
+    r"give me legal advice|represent me)\b",
+    re.IGNORECASE
+)
+
+# Advice-style phrasing in the model output and its informational rewrite
+ADVICE_LANGUAGE_REWRITES = [
+    (re.compile(r"\byou should sue\b", re.IGNORECASE), "tenants in similar situations may consider legal action"),
+    (re.compile(r"\bI (advise|recommend) (that )?you\b", re.IGNORECASE), "one option is to"),
+    (re.compile(r"\bmy legal advice is\b", re.IGNORECASE), "for information,"),
+    (re.compile(r"\byou (must|should) (file|sue)\b", re.IGNORECASE), r"tenants may \2"),
+]
+
+
+def load_disclaimer(config_path: str) -> str:
+    """Read the disclaimer text from the rails config so both paths say the same thing"""
+    try:
+        with open(os.path.join(config_path, "guardrails_config.yaml"), 'r') as f:
+            config_text = f.read()
+        match = re.search(r'define bot add legal disclaimer\s*\n\s*"([^"]+)"', config_text)
+        if match:
+            return match.group(1)
+    except OSError:
+        pass
+    return LEGAL_DISCLAIMER
+
+
+class LocalGuardrails:
+    """
+    Runs the input and output rails locally with compiled patterns.
+    Only inputs that the patterns can't decide get escalated to the LLM-based rails.
+    """
+
+    INPUT_RAILS = ['check_topic_relevance', 'check_legal_advice_request']
+    OUTPUT_RAILS = ['check_advice_language', 'add_legal_disclaimer']
+
+    def __init__(self, config_path: str = None):
+        self.name = "LocalGuardrails"
+        self.disclaimer = load_disclaimer(config_path) if config_path else LEGAL_DISCLAIMER
+
+        # Per-rail counters: calls, total time, how often it fired or escalated
+        self.rail_stats = {
+            rail: {"calls": 0, "total_ms": 0.0, "triggered": 0, "escalated": 0}
+            for rail in self.INPUT_RAILS + self.OUTPUT_RAILS
+        }
+        self.lock = threading.Lock()  # every handler thread records into the same counters
+
+    def _record(self, rail: str, started: float, triggered: bool = False, escalated: bool = False):
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with self.lock:
+            stats = self.rail_stats[rail]
+            stats["calls"] += 1
+            stats["total_ms"] += elapsed_ms
+            stats["triggered"] += int(triggered)
+            stats["escalated"] += int(escalated)
+
+    def check_input(self, user_input: str) -> Dict:
+        """
+        Run the input rails
+        Returns action 'block', 'escalate' or 'allow', plus a note if advice was requested
+        """
+        # check_topic_relevance
+        started = time.perf_counter()
+        on_topic = bool(HOUSING_PATTERN.search(user_input))
+        off_topic = bool(OFF_TOPIC_PATTERN.search(user_input))
+
+        if off_topic and not on_topic:
+            self._record('check_topic_relevance', started, triggered=True)
+            return {"action": "block", "rail": "check_topic_relevance", "message": OFF_TOPIC_MESSAGE}
+
+        # Neither side matched, or both did - let the LLM rails decide
+        ambiguous = on_topic == off_topic
+        self._record('check_topic_relevance', started, escalated=ambiguous)
+
+        # check_legal_advice_request (never stops the flow, just adds a clarification)
+        started = time.perf_counter()
+        asks_advice = bool(ADVICE_REQUEST_PATTERN.search(user_input))
+        self._record('check_legal_advice_request', started, triggered=asks_advice)
+
+        return {
+            "action": "escalate" if ambiguous else "allow",
+            "rail": "check_topic_relevance" if ambiguous else None,
+            "message": ADVICE_CLARIFICATION if asks_advice else None
+        }
+
+    def apply_output(self, text: str, clarification: str = None) -> str:
+        """Run the output rails: rewrite advice language, then add the disclaimer"""
+        # check_advice_language
+        started = time.perf_counter()
+        rewritten = text
+        for pattern, replacement in ADVICE_LANGUAGE_REWRITES:
+            rewritten = pattern.sub(replacement, rewritten)
+        self._record('check_advice_language', started, triggered=rewritten != text)
+
+        # add_legal_disclaimer (deterministic, no LLM needed)
+        started = time.perf_counter()
+        if clarification:
+            rewritten = f"{clarification}\n\n{rewritten}"
+        if self.disclaimer not in rewritten:
+            rewritten = f"{rewritten}\n\n{self.disclaimer}"
+        self._record('add_legal_disclaimer', started, triggered=True)
+
+        return rewritten
+
+    def get_metrics(self) -> Dict:
+        """Per-rail timing counters with average latency"""
+        with self.lock:
+            metrics = {rail: dict(stats) for rail, stats in self.rail_stats.items()}
+        for stats in metrics.values():
+            stats["avg_ms"] = stats["total_ms"] / stats["calls"] if stats["calls"] else 0.0
+        return metrics
+
+
+# Quick check of the rails
+if __name__ == "__main__":
+    config_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "config")
+    rails = LocalGuardrails(config_dir)
+
+    for text in ["My landlord entered without notice",
+                 "Help with taxes please",
+                 "Should I sue my landlord over the heat?",
+                 "What do you think about this?"]:
+        print(f"{text!r} -> {rails.check_input(text)}")
+
+    print(rails.apply_output("You should sue. I recommend you call 311."))
+    print(rails.get_metrics())
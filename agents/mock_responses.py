@@ -6,9 +6,10 @@ class MockNVIDIAResponses:
     """Simulated responses that look like real NVIDIA LLM output"""
     
     @staticmethod
-    def mock_analyzer_response(complaint):
+    def mock_analyzer_response(complaint, simulate_delay=True):
         """Simulate AnalyzerAgent response"""
-        time.sleep(1)  # Simulate API delay
+        if simulate_delay:
+            time.sleep(1)  # Simulate API delay
         
         responses = {
             "entry": {
@@ -44,16 +45,17 @@ class MockNVIDIAResponses:
             return responses["default"]
     
     @staticmethod
-    def mock_letter_response(analysis, tenant_info):
+    def mock_letter_response(analysis, tenant_info, simulate_delay=True):
         """Simulate LetterAgent response"""
-        time.sleep(1)  # Simulate API delay
+        if simulate_delay:
+            time.sleep(1)  # Simulate API delay
         
         date = tenant_info.get("date", "January 15, 2024")
         name = tenant_info.get("name", "Tenant")
         landlord = tenant_info.get("landlord", "Landlord")
         address = tenant_info.get("address", "Property Address")
         
-        laws = analysis.get("applicable_laws", ["NYC Housing Code"])
+        laws = analysis.get("applicable_laws") or ["NYC Housing Code"]
         law_text = ", ".join(laws)
         
         letter = f"""
@@ -68,7 +70,7 @@ I am writing to formally notify you of serious violations of my tenant rights at
 
 The following issues constitute violations of {law_text}:
 
-{analysis.get('recommended_actions', ['Please address these issues immediately'])[0]}
+{(analysis.get('recommended_actions') or ['Please address these issues immediately'])[0]}
 
 This letter serves as formal notice of these violations. I request immediate action to remedy these issues within the timeframe required by law.
 
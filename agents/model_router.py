@@ -0,0 +1,143 @@
+# ModelRouter - Picks which NVIDIA model tier handles a complaint
+#
+# Most complaints are plain heat, pest or leak problems that the workflow
+# already categorizes confidently. Those go to a smaller, faster model; the
+# 70B model is kept for everything else. Tiers (model, endpoint, cost) and
+# which categories may use the fast one live in model_tiers.yaml.
+import math
+import os
+import threading
+import time
+from typing import Dict, List, Union
+
+import yaml
+from langchain_core.messages import BaseMessage
+from langchain_nvidia_ai_endpoints import ChatNVIDIA
+
+from .prompt_templates import estimate_tokens, prompt_text
+
+FAST_TIER = "fast"
+MAIN_TIER = "main"
+
+# Used when the tiers file is missing or has no main tier
+DEFAULT_TIERS = {
+    "routing": {"min_confidence": 0.75, "fast_categories": []},
+    MAIN_TIER: {
+        "model": "meta/llama-3.1-70b-instruct",
+        "label": "NVIDIA Llama 3.1 70B",
+        "cost_per_1k_tokens": 0.0
+    }
+}
+
+DEFAULT_TIERS_PATH = os.getenv(
+    "RIGHTSGUARD_MODEL_TIERS", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "model_tiers.yaml")
+)
+
+
+def load_model_tiers(tiers_path: str = DEFAULT_TIERS_PATH) -> Dict:
+    """Read the model tiers and routing settings from model_tiers.yaml"""
+    try:
+        with open(tiers_path, encoding="utf-8") as f:
+            tiers = yaml.safe_load(f) or {}
+    except (OSError, yaml.YAMLError) as e:
+        print(f"⚠️ Could not read model tiers ({e}) - using the 70B model for everything")
+        return DEFAULT_TIERS
+
+    if MAIN_TIER not in tiers:
+        return DEFAULT_TIERS
+    tiers.setdefault("routing", DEFAULT_TIERS["routing"])
+    return tiers
+
+
+# Per-tier usage across every agent in the process
+_tier_stats = {}
+_tier_stats_lock = threading.Lock()
+
+
+def _record_call(tier: str, latency: float, tokens: int, cost: float):
+    with _tier_stats_lock:
+        stats = _tier_stats.setdefault(tier, {"calls": 0, "total_latency": 0.0, "tokens": 0, "cost": 0.0})
+        stats["calls"] += 1
+        stats["total_latency"] += latency
+        stats["tokens"] += tokens
+        stats["cost"] += cost
+
+
+def get_tier_metrics() -> Dict:
+    with _tier_stats_lock:
+        return {
+            tier: {
+                "calls": stats["calls"],
+                "avg_latency": round(stats["total_latency"] / stats["calls"], 3),
+                "tokens": stats["tokens"],
+                "cost": round(stats["cost"], 6)
+            }
+            for tier, stats in _tier_stats.items()
+        }
+
+
+class ModelRouter:
+    """Routes each LLM call to the fast or main model tier"""
+
+    def __init__(self, api_key: str, temperature: float, tiers_path: str = DEFAULT_TIERS_PATH):
+        self.name = "ModelRouter"
+        self.api_key = api_key
+        self.temperature = temperature
+        self.tiers = load_model_tiers(tiers_path)
+        self.min_confidence = self.tiers["routing"].get("min_confidence", 0.75)
+        self.fast_categories = set(self.tiers["routing"].get("fast_categories") or [])
+        self.llms = {}
+
+    def route(self, category: str = None, confidence: float = 0.0) -> str:
+        """Fast tier only for confidently categorized, well-known complaint types"""
+        if FAST_TIER in self.tiers and category in self.fast_categories and confidence >= self.min_confidence:
+            tier = FAST_TIER
+        else:
+            tier = MAIN_TIER
+        print(f"🔀 Routing {category or 'uncategorized'} complaint (confidence {confidence:.2f}) "
+              f"to {self.get_label(tier)}")
+        return tier
+
+    def get_label(self, tier: str) -> str:
+        return self.tiers[tier].get("label", self.tiers[tier]["model"])
+
+    def get_llm(self, tier: str = MAIN_TIER, timeout: float = None) -> ChatNVIDIA:
+        """
+        One ChatNVIDIA client per tier (and HTTP timeout), created the first time it's needed
+        The timeout is rounded up to whole seconds so only a handful of clients ever exist
+        """
+        timeout = max(1, math.ceil(timeout)) if timeout is not None else None
+        key = (tier, timeout)
+        if key not in self.llms:
+            settings = self.tiers[tier]
+            kwargs = {"model": settings["model"], "api_key": self.api_key, "temperature": self.temperature}
+            if settings.get("base_url"):
+                kwargs["base_url"] = settings["base_url"]
+            if timeout is not None:
+                kwargs["timeout"] = timeout
+            self.llms[key] = ChatNVIDIA(**kwargs)
+        return self.llms[key]
+
+    def invoke(self, tier: str, prompt: Union[str, List[BaseMessage]], timeout: float = None):
+        """
+        Call the tier's model and log its latency, tokens and estimated cost
+        timeout: seconds before the HTTP request itself gives up (what the endpoint guard allows)
+        """
+        started = time.perf_counter()
+        response = self.get_llm(tier, timeout).invoke(prompt)
+        latency = time.perf_counter() - started
+
+        usage = getattr(response, "usage_metadata", None) or {}
+        tokens = usage.get("total_tokens") or estimate_tokens(prompt_text(prompt)) + estimate_tokens(response.content)
+        cost = tokens / 1000 * self.tiers[tier].get("cost_per_1k_tokens", 0.0)
+        _record_call(tier, latency, tokens, cost)
+        print(f"💰 {self.get_label(tier)}: {latency:.2f}s, {tokens} tokens, ~${cost:.5f}")
+        return response
+
+
+# Quick check of the routing rules (no API calls)
+if __name__ == "__main__":
+    router = ModelRouter(api_key="test", temperature=0.1)
+    for category, confidence in [("heating_issues", 1.0), ("pest_issues", 0.5), ("maintenance_issues", 1.0),
+                                 ("other_issues", 0.0)]:
+        router.route(category, confidence)
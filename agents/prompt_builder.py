@@ -0,0 +1,173 @@
+# Prompt building helpers - keeps the data we send to the LLM small and useful
+import re
+from typing import Dict, List, Tuple
+
+from langchain_core.messages import BaseMessage
+
+from .data_sources import Jurisdiction
+from .prompt_templates import ANALYZER_TEMPLATE, FUSED_TEMPLATE, LETTER_TEMPLATE, estimate_tokens
+
+# The only Socrata fields the analyzer actually needs from a violation row
+SALIENT_VIOLATION_FIELDS = ['inspectiondate', 'class', 'currentstatus', 'novdescription']
+
+# Default token budget for the violation history section of the prompt
+DEFAULT_VIOLATION_TOKEN_BUDGET = 400
+
+
+def project_violation(violation: Dict) -> Dict:
+    """Keep only the salient fields of a raw Socrata violation row"""
+    compact = {}
+    for field in SALIENT_VIOLATION_FIELDS:
+        value = violation.get(field)
+        if value:
+            compact[field] = str(value).strip()
+
+    # Dates come back as 2023-01-05T00:00:00.000 - the day is enough
+    if 'inspectiondate' in compact:
+        compact['inspectiondate'] = compact['inspectiondate'].split('T')[0]
+
+    return compact
+
+
+def _description_key(description: str) -> str:
+    """Normalize a description so near-identical violations collapse together"""
+    return re.sub(r'\s+', ' ', description.lower()).strip()
+
+
+def compact_violations(violations: List[Dict]) -> Tuple[List[Dict], int]:
+    """
+    Project violations to their salient fields and merge repeated descriptions
+    Returns the compact list and how many duplicates were merged
+    """
+    compacted = []
+    seen = {}  # description key -> index in compacted
+    duplicates = 0
+
+    for violation in violations or []:
+        compact = project_violation(violation)
+        if not compact:
+            continue
+
+        key = _description_key(compact.get('novdescription', ''))
+        if key and key in seen:
+            # Same violation written up again - just count it
+            compacted[seen[key]]['count'] += 1
+            duplicates += 1
+            continue
+
+        compact['count'] = 1
+        if key:
+            seen[key] = len(compacted)
+        compacted.append(compact)
+
+    return compacted, duplicates
+
+
+def format_violation_line(violation: Dict) -> str:
+    """Render one compact violation as a single prompt line"""
+    parts = [
+        violation.get('inspectiondate', 'unknown date'),
+        f"Class {violation['class']}" if 'class' in violation else None,
+        violation.get('currentstatus'),
+        violation.get('novdescription'),
+    ]
+    line = "- " + " | ".join(part for part in parts if part)
+    if violation.get('count', 1) > 1:
+        line += f" (x{violation['count']})"
+    return line
+
+
+def build_violation_section(violations: List[Dict], token_budget: int = DEFAULT_VIOLATION_TOKEN_BUDGET) -> Tuple[str, Dict]:
+    """
+    Build the BUILDING VIOLATION HISTORY text within a token budget
+    Returns the text and metrics about what was kept
+    """
+    compacted, duplicates = compact_violations(violations)
+
+    lines = []
+    used_tokens = 0
+    for violation in compacted:
+        line = format_violation_line(violation)
+        line_tokens = estimate_tokens(line)
+        if used_tokens + line_tokens > token_budget:
+            break
+        lines.append(line)
+        used_tokens += line_tokens
+
+    metrics = {
+        "violations_in": len(violations or []),
+        "violations_used": len(lines),
+        "duplicates_merged": duplicates,
+        "violation_tokens": used_tokens,
+    }
+
+    if not lines:
+        return "No violation history", metrics
+
+    omitted = len(compacted) - len(lines)
+    if omitted > 0:
+        lines.append(f"- ... {omitted} more violations omitted")
+
+    return "\n".join(lines), metrics
+
+
+def build_analyzer_prompt(user_complaint: str, violations_data: List[Dict],
+                          token_budget: int = DEFAULT_VIOLATION_TOKEN_BUDGET,
+                          jurisdiction: Jurisdiction = None) -> Tuple[List[BaseMessage], Dict]:
+    """Build the analyzer messages and report their size (jurisdiction defaults to NYC)"""
+    violation_section, metrics = build_violation_section(violations_data, token_budget)
+    messages, template_metrics = ANALYZER_TEMPLATE.compile(jurisdiction).render(
+        complaint=user_complaint, violations=violation_section
+    )
+    metrics.update(template_metrics)
+    return messages, metrics
+
+
+def _tenant_fields(tenant_info: Dict) -> Dict:
+    return {
+        "name": tenant_info.get('name', 'Tenant Name'),
+        "address": tenant_info.get('address', 'Property Address'),
+        "landlord": tenant_info.get('landlord', 'Landlord Name'),
+        "date": tenant_info.get('date', 'Date of Issue')
+    }
+
+
+def build_fused_prompt(user_complaint: str, violations_data: List[Dict], tenant_info: Dict,
+                       token_budget: int = DEFAULT_VIOLATION_TOKEN_BUDGET,
+                       jurisdiction: Jurisdiction = None) -> Tuple[List[BaseMessage], Dict]:
+    """
+    One prompt that asks for the analysis JSON and the complaint letter together,
+    so the workflow makes one LLM round trip instead of two
+    """
+    violation_section, metrics = build_violation_section(violations_data, token_budget)
+    messages, template_metrics = FUSED_TEMPLATE.compile(jurisdiction).render(
+        complaint=user_complaint, violations=violation_section, **_tenant_fields(tenant_info)
+    )
+    metrics.update(template_metrics)
+    return messages, metrics
+
+
+def build_letter_prompt(analysis_data: Dict, tenant_info: Dict,
+                        jurisdiction: Jurisdiction = None) -> Tuple[List[BaseMessage], Dict]:
+    """The letter agent's messages - the analysis and tenant details are the only per-request part"""
+    return LETTER_TEMPLATE.compile(jurisdiction).render(
+        analysis=analysis_data.get('analysis', 'No analysis provided'), **_tenant_fields(tenant_info)
+    )
+
+
+# Quick check with fake Socrata rows
+if __name__ == "__main__":
+    fake_rows = [
+        {"violationid": str(i), "boro": "BROOKLYN", "class": "C", "currentstatus": "VIOLATION OPEN",
+         "inspectiondate": "2024-01-0%dT00:00:00.000" % (i % 9 + 1),
+         "novdescription": "§ 27-2029 ADM CODE PROVIDE HEAT" if i % 2 else "§ 27-2017.4 ADM CODE ABATE THE NUISANCE CONSISTING OF MICE"}
+        for i in range(20)
+    ]
+    messages, metrics = build_analyzer_prompt("No heat for a week", fake_rows)
+    print(messages[1].content)
+    print(metrics)
+
+    fused_prompt, fused_metrics = build_fused_prompt("No heat for a week", fake_rows,
+                                                     {"name": "John Doe", "address": "123 Main St",
+                                                      "landlord": "ABC Management", "date": "January 15, 2024"})
+    print(fused_metrics)
@@ -0,0 +1,239 @@
+# Prompt Templates - Fixed instructions first, per-request details last
+#
+# Every LLM prompt is sent as two messages: a system message with the role,
+# instructions, output format and letter rules (the same for every request in
+# a jurisdiction) and a user message with just this request's complaint,
+# violations and tenant details. Endpoints with prefix (KV) caching can reuse
+# the system part instead of reading it again on every call.
+#
+# Templates are compiled once per jurisdiction - the system text is rendered
+# and its tokens counted up front, so a request only formats the short user
+# part. Each template has a version (bump it whenever its text changes), and
+# renders and token counts - estimated, plus what the endpoint reports - are
+# tracked per version, so the prompt-size effect of a change is measurable.
+import hashlib
+import re
+import threading
+from typing import Dict, List, Tuple, Union
+
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage
+
+from .data_sources import Jurisdiction, get_jurisdiction
+
+# Rough word-piece split: words, numbers and single punctuation marks
+_TOKEN_PATTERN = re.compile(r"[A-Za-z]+|\d+|[^\sA-Za-z\d]")
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Cheap local estimate of how many tokens a piece of text will use
+    Long words get split into ~4 character pieces like a BPE tokenizer would
+    """
+    if not text:
+        return 0
+
+    count = 0
+    for piece in _TOKEN_PATTERN.findall(text):
+        count += max(1, (len(piece) + 3) // 4) if piece.isalpha() else max(1, (len(piece) + 2) // 3)
+    return count
+
+
+def prompt_text(prompt: Union[str, List[BaseMessage]]) -> str:
+    """A prompt as plain text - messages joined in order (for token estimates, mocks and single-message APIs)"""
+    if isinstance(prompt, str):
+        return prompt
+    return "\n\n".join(str(message.content) for message in prompt)
+
+
+def letter_format_requirements(jurisdiction: Jurisdiction = None) -> str:
+    """Format rules for complaint letters, shared by the letter prompt and the fused prompt"""
+    jurisdiction = jurisdiction or get_jurisdiction()
+    return f"""LETTER FORMAT REQUIREMENTS:
+1. Start with the tenant's name and property address (not placeholders)
+2. Address the letter to the specific landlord/company name provided
+3. Use today's date as provided
+4. Include a clear "Re:" subject line about the specific property address
+5. Reference relevant {jurisdiction.short_name} laws and statutes from the analysis
+6. Request specific remedial action with a 10-day deadline
+7. End with the tenant's actual name"""
+
+
+ANALYSIS_JSON_FIELDS = """    "is_legitimate": "Yes" or "No",
+    "applicable_laws": ["list", "of", "statute", "numbers"],
+    "case_strength": "Weak" or "Moderate" or "Strong",
+    "evidence_needed": ["list", "of", "evidence", "to", "collect"],
+    "recommended_actions": ["list", "of", "actions", "to", "take"]"""
+
+# System parts use the jurisdiction's fields ({law_name}, {short_name}, {statute_example},
+# {letter_format}); user parts use the request's. Literal braces are doubled.
+ANALYZER_SYSTEM = """You are a legal document analyst specializing in {law_name}.
+Analyze the tenant complaint you are given and identify which {short_name} housing laws apply.
+The complaint comes with the building's violation history (date | class | status | description).
+
+Based on your knowledge of {law_name}, identify the specific laws that apply to the complaint.
+Include statute numbers when possible (e.g., {statute_example})
+
+Respond in JSON format with these exact fields:
+{{
+""" + ANALYSIS_JSON_FIELDS + """
+}}
+
+Provide factual information only. Do not give legal advice."""
+
+FUSED_SYSTEM = """You are a legal document analyst and writer specializing in {law_name}.
+Analyze the tenant complaint you are given, identify which {short_name} housing laws apply, and write
+the tenant's formal complaint letter to their landlord.
+The complaint comes with the building's violation history (date | class | status | description)
+and the tenant's details - use those exact values in the letter.
+
+Based on your knowledge of {law_name}, identify the specific laws that apply to the complaint.
+Include statute numbers when possible (e.g., {statute_example})
+
+{letter_format}
+Do not include any placeholder text in brackets like [Name] or [Address].
+
+Respond in JSON format with these exact fields:
+{{
+""" + ANALYSIS_JSON_FIELDS + """,
+    "letter": "the full complaint letter, with newlines escaped as \\n"
+}}
+
+Provide factual information only. Do not give legal advice."""
+
+LETTER_SYSTEM = """You are a professional legal document writer specializing in tenant rights.
+
+Generate a formal complaint letter from the analysis and tenant information you are given, using
+their EXACT values. Do NOT use placeholders like [Your Name] or [Your Address]. Use the actual
+names and addresses provided.
+
+{letter_format}
+
+CRITICAL: Replace ALL placeholder text with the actual information provided. Do not include any text in brackets like [Name] or [Address]."""
+
+COMPLAINT_USER = """TENANT COMPLAINT: {complaint}
+
+BUILDING VIOLATION HISTORY (date | class | status | description):
+{violations}"""
+
+TENANT_USER = """TENANT INFORMATION:
+- Tenant Name: {name}
+- Property Address: {address}
+- Landlord/Company: {landlord}
+- Today's Date: {date}"""
+
+FUSED_USER = COMPLAINT_USER + "\n\n" + TENANT_USER
+
+LETTER_USER = "ANALYSIS: {analysis}\n\n" + TENANT_USER
+
+
+class CompiledPrompt:
+    """A template's system message for one jurisdiction, rendered and measured once"""
+
+    def __init__(self, template: 'PromptTemplate', jurisdiction: Jurisdiction):
+        self.template = template
+        self.jurisdiction = jurisdiction.key
+        self.system = SystemMessage(content=template.system_template.format(
+            law_name=jurisdiction.law_name, short_name=jurisdiction.short_name,
+            statute_example=jurisdiction.statute_example,
+            letter_format=letter_format_requirements(jurisdiction)
+        ))
+        self.system_tokens = estimate_tokens(self.system.content)
+        # Same hash = same cacheable prefix, whichever worker or request sent it
+        self.prefix_hash = hashlib.sha256(self.system.content.encode('utf-8')).hexdigest()[:12]
+
+    def render(self, **fields) -> Tuple[List[BaseMessage], Dict]:
+        """[system, user] messages for one request, and their size"""
+        user_text = self.template.user_template.format(**fields)
+        user_tokens = estimate_tokens(user_text)
+        metrics = {
+            "template": self.template.label,
+            "prefix_hash": self.prefix_hash,
+            "system_tokens": self.system_tokens,
+            "user_tokens": user_tokens,
+            "prompt_chars": len(self.system.content) + len(user_text),
+            "prompt_tokens": self.system_tokens + user_tokens
+        }
+        self.template.count_render(metrics)
+        return [self.system, HumanMessage(content=user_text)], metrics
+
+
+class PromptTemplate:
+    """A versioned system/user prompt pair"""
+
+    def __init__(self, name: str, version: int, system_template: str, user_template: str):
+        self.name = name
+        self.version = version
+        self.label = f"{name}@v{version}"
+        self.system_template = system_template
+        self.user_template = user_template
+        self.compiled: Dict[str, CompiledPrompt] = {}
+        self.stats = {"renders": 0, "prompt_tokens": 0, "system_tokens": 0,
+                      "calls_measured": 0, "input_tokens": 0, "cached_input_tokens": 0}
+        self.lock = threading.Lock()
+
+    def compile(self, jurisdiction: Jurisdiction = None) -> CompiledPrompt:
+        jurisdiction = jurisdiction or get_jurisdiction()
+        compiled = self.compiled.get(jurisdiction.key)
+        if compiled is None:
+            compiled = self.compiled.setdefault(jurisdiction.key, CompiledPrompt(self, jurisdiction))
+        return compiled
+
+    def count_render(self, metrics: Dict):
+        with self.lock:
+            self.stats["renders"] += 1
+            self.stats["prompt_tokens"] += metrics["prompt_tokens"]
+            self.stats["system_tokens"] += metrics["system_tokens"]
+
+    def record_usage(self, response):
+        """What the endpoint says the prompt really cost, including any prefix-cache hit"""
+        usage = getattr(response, "usage_metadata", None) or {}
+        if not usage.get("input_tokens"):
+            return
+        with self.lock:
+            self.stats["calls_measured"] += 1
+            self.stats["input_tokens"] += usage["input_tokens"]
+            self.stats["cached_input_tokens"] += (usage.get("input_token_details") or {}).get("cache_read") or 0
+
+    def get_metrics(self) -> Dict:
+        with self.lock:
+            stats = dict(self.stats)
+        renders, measured = stats["renders"], stats["calls_measured"]
+        return {
+            "renders": renders,
+            "avg_prompt_tokens": round(stats["prompt_tokens"] / renders, 1) if renders else 0.0,
+            # Share of each prompt that is the fixed, cacheable prefix
+            "prefix_share": round(stats["system_tokens"] / stats["prompt_tokens"], 3) if stats["prompt_tokens"] else 0.0,
+            "calls_measured": measured,
+            "avg_input_tokens": round(stats["input_tokens"] / measured, 1) if measured else None,
+            "cached_input_share": round(stats["cached_input_tokens"] / stats["input_tokens"], 3)
+            if stats["input_tokens"] else None,
+            "system_tokens": {key: compiled.system_tokens for key, compiled in self.compiled.items()}
+        }
+
+
+# Bump a version whenever its template text changes (v1 was the old single-string layout)
+ANALYZER_TEMPLATE = PromptTemplate("analyzer", 2, ANALYZER_SYSTEM, COMPLAINT_USER)
+FUSED_TEMPLATE = PromptTemplate("fused", 2, FUSED_SYSTEM, FUSED_USER)
+LETTER_TEMPLATE = PromptTemplate("letter", 2, LETTER_SYSTEM, LETTER_USER)
+
+TEMPLATES = {template.name: template for template in (ANALYZER_TEMPLATE, FUSED_TEMPLATE, LETTER_TEMPLATE)}
+
+
+def get_template_metrics() -> Dict:
+    return {template.label: template.get_metrics() for template in TEMPLATES.values()}
+
+
+# Quick check - system parts are identical across requests, only the user part changes
+if __name__ == "__main__":
+    first, first_metrics = ANALYZER_TEMPLATE.compile().render(complaint="No heat for a week", violations="No violation history")
+    second, second_metrics = ANALYZER_TEMPLATE.compile().render(complaint="Mice in the kitchen",
+                                                                violations="- 2024-01-05 | Class B | OPEN | ROACHES")
+    print(first[0].content)
+    print("---")
+    print(first[1].content)
+    print(first[0] is second[0], first_metrics, second_metrics)
+    for template in TEMPLATES.values():
+        for key in ("nyc", "chicago"):
+            compiled = template.compile(get_jurisdiction(key))
+            print(f"{template.label} [{key}]: system prefix {compiled.system_tokens} tokens ({compiled.prefix_hash})")
+    print(get_template_metrics())
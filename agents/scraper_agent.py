@@ -1,6 +1,22 @@
 # Let's build this together step by step!
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
 import requests  # This lets us download web pages
 
+from .cancellation import CancelToken
+from .data_sources import DATA_SOURCES, get_all_source_metrics, get_jurisdiction, sources_for
+
+# Shared by every scraper - cities with more than one source query them side by side
+_source_pool = None
+
+
+def _get_source_pool() -> ThreadPoolExecutor:
+    global _source_pool
+    if _source_pool is None:
+        _source_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="rightsguard-source")
+    return _source_pool
+
 class WebScraperAgent:
     def __init__(self):
         """
@@ -10,11 +26,8 @@ class WebScraperAgent:
         # We'll need these later:
         self.name = "WebScraperAgent"
         
-        # URLs we know are good for NYC tenant info
-        self.nyc_urls = {
-            'main': 'https://www.nyc.gov/site/rentguidelinesboard/tenants/tenants-rights.page',
-            'complaints': 'https://www.nyc.gov/site/hpd/services-and-information/tenants.page'
-        }
+        # URLs we know are good for NYC tenant info (other cities' are on their Jurisdiction)
+        self.nyc_urls = get_jurisdiction("nyc").info_urls
         
         print(f"{self.name} initialized!")
     def get_webpage(self, url):
@@ -57,37 +70,36 @@ class WebScraperAgent:
 
         return relevant_info
     
-    def search_nyc_open_data(self, query):
+    def search_violations(self, address: str, jurisdiction: str,
+                          cancel_token: CancelToken = None) -> List[Dict]:
+        """
+        Ask every data source for this jurisdiction about the address (side by side if there are several)
+        Rows come back with HPD field names whatever the source, so the other agents don't care which city it is
+        cancel_token: each source gets what's left of the run's deadline as its timeout
+        """
+        sources = sources_for(jurisdiction)
+        timeout_for = (lambda source: cancel_token.timeout(source.timeout)) if cancel_token else (lambda source: None)
+        if len(sources) == 1:
+            # The usual case - no thread hop
+            return sources[0].query(address, timeout_for(sources[0]))
+
+        futures = [_get_source_pool().submit(source.query, address, timeout_for(source)) for source in sources]
+        rows = []
+        for future in futures:
+            rows.extend(future.result())
+        return rows
+    
+    def search_nyc_open_data(self, query, timeout=10):
         """
         Search NYC Open Data API for tenant-related information
         This gives us real violation data, not just laws
+        timeout: seconds to wait for the API
         """
-        try:
-            import json  # Need this for API responses
-
-            # NYC's housing violations dataset
-            url = "https://data.cityofnewyork.us/resource/wvxf-dwi5.json"
-
-            # Parameters for the API
-            params = {
-                '$q': query,      # Search query
-                '$limit': 5       # Only get 5 results for now
-            }
-
-            # Make the API call
-            response = requests.get(url, params=params, timeout=10)
-
-            if response.status_code == 200:
-                violations = response.json()
-                print(f"API returned {len(violations)} violations")
-                return violations
-            else:
-                print(f"API error: {response.status_code}")
-                return []
-
-        except Exception as e:
-            print(f"Error calling API: {e}")
-            return []
+        return DATA_SOURCES["nyc_hpd_violations"].query(query, timeout)
+    
+    def get_source_metrics(self) -> Dict:
+        """Per-source query counts, cache hit rate and fetch latency"""
+        return get_all_source_metrics()
 
 
 
@@ -1,6 +1,7 @@
 # RightsGuard - Streamlit UI for Multi-Agent Legal Rights Analyzer
 import streamlit as st
 import json
+import time
 from datetime import datetime
 from dotenv import load_dotenv
 import os
@@ -24,6 +25,13 @@ else:
         print("❌ Error accessing Streamlit secrets")
 
 from workflow import RightsGuardWorkflow
+from agents.data_sources import get_jurisdiction
+from job_queue import JobQueue, STATUS_CANCELLED, STATUS_COMPLETE, STATUS_FAILED
+from result_view import build_result_view, build_partial_view, result_hash
+from violation_table import normalize_violations, highlight_markdown, get_page, page_count, HIGHLIGHT_COUNT
+
+# Seconds without a poll from the page before its job is cancelled (the page polls every second)
+JOB_ABANDON_AFTER = 30
 
 # Page configuration
 st.set_page_config(
@@ -80,14 +88,69 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
+@st.cache_resource
+def get_job_queue():
+    """One background job queue (and one set of AI agents) per Streamlit server"""
+    # A job whose page stopped polling (tab closed, user navigated away) gets cancelled
+    return JobQueue(workflow_factory=RightsGuardWorkflow, abandon_after=JOB_ABANDON_AFTER)
+
 def init_session_state():
     """Initialize session state variables"""
-    if 'workflow' not in st.session_state:
-        st.session_state.workflow = None
     if 'result' not in st.session_state:
         st.session_state.result = None
+    if 'result_key' not in st.session_state:
+        st.session_state.result_key = None
+    if 'job_id' not in st.session_state:
+        # The job id is kept in the URL so a page refresh picks the job back up
+        st.session_state.job_id = st.query_params.get("job")
     if 'processing' not in st.session_state:
-        st.session_state.processing = False
+        st.session_state.processing = st.session_state.job_id is not None
+
+def follow_job():
+    """Show progress of the running job, or collect its result once it's done"""
+    job = get_job_queue().get(st.session_state.job_id)
+    
+    if job is None:
+        st.error("❌ Could not find that analysis - please submit it again")
+    elif job['status'] == STATUS_COMPLETE:
+        st.session_state.result = job['result']
+        st.session_state.result_key = result_hash(job['result'])
+        display_agent_status('complete')
+        total_time = sum(job['result'].get('timings', {}).values())
+        st.success(f"🎉 Analysis complete in {total_time:.1f}s!")
+    elif job['status'] == STATUS_FAILED:
+        st.error(f"❌ Processing failed: {job['error']}")
+    elif job['status'] == STATUS_CANCELLED:
+        st.warning(f"🛑 This analysis was cancelled ({job['error']}) - please submit it again")
+    else:
+        # Still queued or running - show the current stage and check again shortly
+        display_agent_status(job['stage'])
+        stage_messages = {
+            'scraping': "🔍 Researching building records and legal precedents...",
+            'analyzing': "🧠 Analyzing your complaint against NYC tenant law...",
+            'generating': "📝 Writing your complaint letter..."
+        }
+        if job['stage'] in stage_messages:
+            st.info(stage_messages[job['stage']])
+        else:
+            st.info(f"⏳ Waiting in line ({job.get('position', 0)} ahead of you)...")
+        
+        # Research results arrive before the AI stages finish - show them right away
+        partial = job.get('partial')
+        if partial:
+            partial_key = f"{job['id']}:partial"
+            partial_view = get_partial_view(partial_key, partial)
+            display_community_insights(partial_view['community'])
+            display_landlord_insights(partial_view['landlord'])
+            display_violations(partial['violations'], partial_key, partial.get('jurisdiction'))
+        time.sleep(1)
+        st.rerun()
+    
+    # Job is finished one way or another
+    st.session_state.job_id = None
+    st.session_state.processing = False
+    if "job" in st.query_params:
+        del st.query_params["job"]
 
 def display_agent_status(stage):
     """Display the status of each agent in the workflow"""
@@ -116,75 +179,92 @@ def display_agent_status(stage):
                     st.markdown(f'<div class="agent-status agent-pending">{agent_status}</div>', 
                               unsafe_allow_html=True)
 
-def display_community_insights(building_history, total_complaints):
+@st.cache_resource(max_entries=64, show_spinner=False)
+def get_result_view(result_key, _result):
+    """Format a result once - reruns for unrelated widget changes reuse the fragments"""
+    return build_result_view(_result)
+
+@st.cache_resource(max_entries=64, show_spinner=False)
+def get_partial_view(cache_key, _partial):
+    """Format the research results of a running job once"""
+    return build_partial_view(_partial)
+
+def display_community_insights(community_view):
     """Display community insights and building history"""
     st.markdown("### 🏢 Community Legal Memory")
+    st.markdown(community_view['html'], unsafe_allow_html=True)
     
-    if building_history:
-        risk_level = "HIGH" if len(building_history) >= 3 else "MODERATE" if len(building_history) >= 2 else "LOW"
-        risk_color = {"HIGH": "🔴", "MODERATE": "🟡", "LOW": "🟢"}[risk_level]
-        
-        st.markdown(f"""
-        <div class="community-insight">
-            <h4>{risk_color} Building Risk Level: {risk_level}</h4>
-            <p><strong>Previous Complaints:</strong> {len(building_history)}</p>
-            <p><strong>Community Database:</strong> {total_complaints} total complaints tracked</p>
-        </div>
-        """, unsafe_allow_html=True)
-        
-        # Show complaint categories if available
-        complaint_categories = {}
-        for complaint in building_history:
-            category = complaint.get('category', 'other_issues')
-            complaint_categories[category] = complaint_categories.get(category, 0) + 1
-        
-        if complaint_categories:
-            st.markdown("#### Issue Categories:")
-            category_names = {
-                'heating_issues': '🔥 Heating',
-                'mold_issues': '🦠 Mold', 
-                'water_issues': '💧 Water/Leaks',
-                'pest_issues': '🐛 Pests',
-                'privacy_violations': '🔒 Privacy',
-                'maintenance_issues': '🔧 Maintenance',
-                'other_issues': '❓ Other'
-            }
-            
-            cols = st.columns(min(len(complaint_categories), 4))
-            for i, (category, count) in enumerate(complaint_categories.items()):
-                with cols[i % 4]:
-                    display_name = category_names.get(category, category.replace('_', ' ').title())
-                    st.metric(display_name, count)
+    # How the building compares with its block and borough (needs the local HPD export)
+    neighborhood = community_view.get('neighborhood')
+    if neighborhood:
+        st.markdown("#### 📍 Compared with the Neighborhood")
+        if neighborhood['headline']:
+            st.info(neighborhood['headline'])
+        st.markdown(neighborhood['lines'])
+        st.caption(neighborhood['caption'])
+    
+    # Show complaint categories if available
+    categories = community_view['categories']
+    if categories:
+        st.markdown("#### Issue Categories:")
+        cols = st.columns(min(len(categories), 4))
+        for i, (display_name, count) in enumerate(categories):
+            with cols[i % 4]:
+                st.metric(display_name, count)
+    
+    # Show recent complaints from other tenants
+    if community_view['recent']:
+        st.markdown("#### Recent Community Complaints:")
+        st.markdown("\n\n".join(community_view['recent']))
+        st.markdown("*Anonymized complaints from other tenants*")
+
+def display_landlord_insights(landlord_view):
+    """Display complaint totals across every building the landlord owns"""
+    if not landlord_view:
+        return
+    
+    st.markdown("### 🏘️ Landlord Track Record")
+    st.markdown(landlord_view['html'], unsafe_allow_html=True)
+    
+    # Top issues across the whole portfolio
+    if landlord_view['categories']:
+        cols = st.columns(len(landlord_view['categories']))
+        for i, (display_name, count) in enumerate(landlord_view['categories']):
+            with cols[i]:
+                st.metric(display_name, count)
+
+# Violations per page in the expandable table
+VIOLATION_PAGE_SIZE = 50
+
+@st.cache_resource(max_entries=32, show_spinner=False)
+def load_violation_table(cache_key, _violations):
+    """Normalize a result's violations once - reruns reuse the same DataFrame"""
+    return normalize_violations(_violations)
+
+def display_violations(violations, cache_key, jurisdiction=None):
+    """Display official violations for the building (from its city's data sources)"""
+    if not violations:
+        return
+    
+    table = load_violation_table(cache_key, violations)
+    place = get_jurisdiction(jurisdiction)
+    
+    st.markdown("### 🏢 Building Violation History")
+    st.markdown(f"Found **{len(table)}** official {place.short_name} violations for this address:")
+    st.markdown(highlight_markdown(table))
+    
+    # Show additional violations one page at a time
+    if len(table) > HIGHLIGHT_COUNT:
+        additional_count = len(table) - HIGHLIGHT_COUNT
+        with st.expander(f"📋 Show {additional_count} more violations"):
+            pages = page_count(table, VIOLATION_PAGE_SIZE)
+            page = 1
+            if pages > 1:
+                page = st.number_input(f"Page (of {pages})", min_value=1, max_value=pages, value=1,
+                                       key=f"violation_page_{cache_key}")
+            st.dataframe(get_page(table, page, VIOLATION_PAGE_SIZE))
         
-        # Show recent complaints (but skip the most recent to avoid showing user's own)
-        if len(building_history) > 1:
-            st.markdown("#### Recent Community Complaints:")
-            for complaint in building_history[-3:-1]:  # Skip last one, show previous 2
-                date = complaint.get('date', 'Unknown date')
-                issue = complaint.get('complaint', 'No details')
-                category = complaint.get('category', 'other_issues')
-                
-                category_emoji = {
-                    'heating_issues': '🔥',
-                    'mold_issues': '🦠', 
-                    'water_issues': '💧',
-                    'pest_issues': '🐛',
-                    'privacy_violations': '🔒',
-                    'maintenance_issues': '🔧',
-                    'other_issues': '❓'
-                }.get(category, '❓')
-                
-                st.write(f"{category_emoji} **{date[:10]}:** {issue[:80]}...")
-            
-            st.markdown("*Anonymized complaints from other tenants*")
-    else:
-        st.markdown("""
-        <div class="community-insight">
-            <h4>🟢 New Building</h4>
-            <p>No previous complaints found for this address.</p>
-            <p>Your complaint will help future tenants at this location.</p>
-        </div>
-        """, unsafe_allow_html=True)
+    st.markdown(f"*Source: {place.data_owner}*")
 
 def main():
     init_session_state()
@@ -235,161 +315,49 @@ def main():
                 "date": datetime.now().strftime("%B %d, %Y")
             }
             
-            # Initialize workflow if not already done
-            if st.session_state.workflow is None:
-                with st.spinner("🔧 Initializing AI agents..."):
-                    try:
-                        st.session_state.workflow = RightsGuardWorkflow()
-                        st.success("✅ AI agents ready!")
-                    except Exception as e:
-                        st.error(f"❌ Failed to initialize: {str(e)}")
-                        st.session_state.processing = False
-                        return
-            
-            # Process the complaint
-            try:
-                # Show progress
-                progress_placeholder = st.empty()
-                
-                with progress_placeholder.container():
-                    display_agent_status('scraping')
-                    st.info("🔍 Researching building records and legal precedents...")
-                
-                # Run the workflow
-                result = st.session_state.workflow.process_complaint(
-                    user_complaint=user_complaint,
-                    building_address=building_address,
-                    tenant_info=tenant_info
-                )
-                
-                st.session_state.result = result
-                st.session_state.processing = False
-                
-                # Clear progress and show completion
-                progress_placeholder.empty()
-                display_agent_status('complete')
-                st.success("🎉 Analysis complete!")
-                
-            except Exception as e:
-                st.error(f"❌ Processing failed: {str(e)}")
-                st.session_state.processing = False
+            # Queue the analysis - it runs in the background and survives reruns
+            st.session_state.result = None
+            st.session_state.result_key = None
+            st.session_state.job_id = get_job_queue().submit(
+                user_complaint=user_complaint,
+                building_address=building_address,
+                tenant_info=tenant_info
+            )
+            st.query_params["job"] = st.session_state.job_id
         else:
             st.sidebar.error("Please fill in all required fields")
     
+    # Follow the background job until it finishes
+    if st.session_state.job_id:
+        follow_job()
+    
     # Display results
     if st.session_state.result:
         result = st.session_state.result
+        if st.session_state.result_key is None:
+            st.session_state.result_key = result_hash(result)
+        view = get_result_view(st.session_state.result_key, result)
+        
+        # The run hit its deadline - say which parts are fallbacks
+        deadline = result.get('deadline') or {}
+        if deadline.get('partial'):
+            st.warning("⏱️ This analysis ran out of time, so some parts are simplified: "
+                       + "; ".join(deadline['degraded']))
         
         # Community insights
-        display_community_insights(
-            result['community_insights']['building_history'],
-            result['community_insights']['total_community_complaints']
-        )
+        display_community_insights(view['community'])
+        display_landlord_insights(view['landlord'])
         
         # Analysis results
         col1, col2 = st.columns([1, 1])
         
         with col1:
             st.markdown("### 🧠 AI Analysis")
-            
-            # Display structured analysis if available
-            analysis = result['analysis']
-            if 'is_legitimate' in analysis:
-                # Structured analysis format
-                legitimacy = analysis.get('is_legitimate', 'Unknown')
-                case_strength = analysis.get('case_strength', 'Unknown')
-                
-                # Status indicator
-                status_color = "🟢" if legitimacy == "Yes" else "🔴" if legitimacy == "No" else "🟡"
-                st.markdown(f"**{status_color} Complaint Status:** {legitimacy}")
-                
-                strength_color = {"Strong": "🟢", "Moderate": "🟡", "Weak": "🔴"}.get(case_strength, "⚪")
-                st.markdown(f"**{strength_color} Case Strength:** {case_strength}")
-                
-                # Applicable laws
-                if analysis.get('applicable_laws'):
-                    st.markdown("**📜 Applicable Laws:**")
-                    for law in analysis['applicable_laws']:
-                        st.write(f"• {law}")
-                
-                # Evidence needed
-                if analysis.get('evidence_needed'):
-                    st.markdown("**📋 Evidence to Collect:**")
-                    for evidence in analysis['evidence_needed']:
-                        st.write(f"• {evidence}")
-                
-                # Recommended actions
-                if analysis.get('recommended_actions'):
-                    st.markdown("**⚡ Recommended Actions:**")
-                    for action in analysis['recommended_actions']:
-                        st.write(f"• {action}")
-            else:
-                # Fallback to raw analysis text
-                analysis_text = analysis.get('analysis', 'No analysis available')
-                st.write(analysis_text)
+            st.markdown(view['analysis_markdown'])
             
             # Show NYC building violations prominently
-            if result['sources']['violations']:
-                st.markdown("### 🏢 Building Violation History")
-                st.markdown(f"Found **{len(result['sources']['violations'])}** official NYC violations for this address:")
-                
-                for i, violation in enumerate(result['sources']['violations'][:3], 1):
-                    # Get the most descriptive field available
-                    description = violation.get('novdescription', 'No description available')
-                    if description and len(description) > 50:
-                        # Clean up the legal description
-                        description = description.replace('§', 'Section').replace('ADM CODE', 'Admin Code')
-                        # Don't truncate - show full description
-                    
-                    violation_type = violation.get('violationtype', 'Housing Code Violation')
-                    inspection_date = violation.get('inspectiondate', 'Date unknown')
-                    if inspection_date != 'Date unknown':
-                        try:
-                            # Format date nicely
-                            date_part = inspection_date.split('T')[0]  # Get just the date part
-                            inspection_date = date_part
-                        except:
-                            pass
-                    
-                    violation_class = violation.get('class', 'Unknown')
-                    status = violation.get('currentstatus', 'Unknown status')
-                    
-                    st.markdown(f"""
-                    **{i}. {violation_type}**
-                    - **Date:** {inspection_date}
-                    - **Class:** {violation_class} | **Status:** {status}
-                    - **Details:** {description}
-                    """)
-                
-                # Show additional violations in expandable section
-                if len(result['sources']['violations']) > 3:
-                    additional_count = len(result['sources']['violations']) - 3
-                    with st.expander(f"📋 Show {additional_count} more violations"):
-                        for i, violation in enumerate(result['sources']['violations'][3:], 4):
-                            description = violation.get('novdescription', 'No description available')
-                            if description and len(description) > 50:
-                                description = description.replace('§', 'Section').replace('ADM CODE', 'Admin Code')
-                            
-                            violation_type = violation.get('violationtype', 'Housing Code Violation')
-                            inspection_date = violation.get('inspectiondate', 'Date unknown')
-                            if inspection_date != 'Date unknown':
-                                try:
-                                    date_part = inspection_date.split('T')[0]
-                                    inspection_date = date_part
-                                except:
-                                    pass
-                            
-                            violation_class = violation.get('class', 'Unknown')
-                            status = violation.get('currentstatus', 'Unknown status')
-                            
-                            st.markdown(f"""
-                            **{i}. {violation_type}**
-                            - **Date:** {inspection_date}
-                            - **Class:** {violation_class} | **Status:** {status}
-                            - **Details:** {description}
-                            """)
-                    
-                st.markdown("*Source: NYC Department of Housing Preservation & Development*")
+            display_violations(result['sources']['violations'], st.session_state.result_key,
+                               result.get('jurisdiction'))
             
             # Show sources
             with st.expander("📚 Legal References"):
@@ -402,12 +370,11 @@ def main():
         
         with col2:
             st.markdown("### 📄 Generated Letter")
-            letter_content = result['letter']['letter_content']
             
             # Show letter in a text area for easy copying
             st.text_area(
                 "Your complaint letter:",
-                value=letter_content,
+                value=view['letter'],
                 height=400,
                 help="Copy this letter to send to your landlord"
             )
@@ -415,8 +382,8 @@ def main():
             # Download button
             st.download_button(
                 label="📥 Download Letter",
-                data=letter_content,
-                file_name=f"complaint_letter_{datetime.now().strftime('%Y%m%d')}.txt",
+                data=view['download_data'],
+                file_name=view['download_name'],
                 mime="text/plain"
             )
     
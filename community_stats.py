@@ -0,0 +1,127 @@
+# Community Stats - Running aggregates for Community Legal Memory
+#
+# Every stored complaint bumps a few counters (per building, per landlord and
+# citywide), so insight queries never have to loop over complaint histories.
+# Rolling windows use one bucket per day, and buckets older than the longest
+# window are dropped, so a window query touches at most ~90 numbers.
+from datetime import datetime, timedelta
+from functools import lru_cache
+from typing import Dict
+
+# Rolling windows we report, in days
+WINDOWS = (30, 90)
+MAX_WINDOW_DAYS = max(WINDOWS)
+
+
+def new_rollup() -> Dict:
+    """Empty counters for one building, landlord or the whole city"""
+    return {"total": 0, "categories": {}, "daily": {}}
+
+
+def copy_rollup(rollup: Dict) -> Dict:
+    """A copy that can be counted into without changing the original"""
+    return dict(rollup, categories=dict(rollup["categories"]), daily=dict(rollup["daily"]))
+
+
+@lru_cache(maxsize=4096)
+def _prune_cutoff(day: str) -> str:
+    """Oldest day still inside every window when day is the newest (bulk imports repeat days a lot)"""
+    return (datetime.fromisoformat(day) - timedelta(days=MAX_WINDOW_DAYS)).date().isoformat()
+
+
+def add_to_rollup(rollup: Dict, category: str, day: str):
+    """Count one complaint (day is an ISO date like '2024-01-15')"""
+    rollup["total"] += 1
+    rollup["categories"][category] = rollup["categories"].get(category, 0) + 1
+    if day in rollup["daily"]:
+        rollup["daily"][day] += 1
+        return  # nothing new can have fallen out since this day was first counted
+    rollup["daily"][day] = 1
+
+    # Drop day buckets that have fallen out of every window
+    cutoff = _prune_cutoff(day)
+    for old_day in [d for d in rollup["daily"] if d < cutoff]:
+        del rollup["daily"][old_day]
+
+
+def window_counts(rollup: Dict, today: datetime = None) -> Dict:
+    """Complaints in the last 30 and 90 days"""
+    today = today or datetime.now()
+    counts = {}
+    for days in WINDOWS:
+        cutoff = (today - timedelta(days=days)).date().isoformat()
+        counts[f"last_{days}_days"] = sum(n for day, n in rollup["daily"].items() if day > cutoff)
+    return counts
+
+
+def summarize(rollup: Dict) -> Dict:
+    """Totals, category counts and rolling windows for display"""
+    summary = {"total": rollup["total"], "categories": dict(rollup["categories"])}
+    summary.update(window_counts(rollup))
+    return summary
+
+
+def building_risk_level(total: int) -> str:
+    """Same thresholds the UI has always used for a single building"""
+    if total >= 3:
+        return "HIGH"
+    elif total >= 2:
+        return "MODERATE"
+    return "LOW"
+
+
+def landlord_risk_level(total: int, buildings_with_complaints: int, last_90_days: int) -> str:
+    """A landlord is high risk when problems show up across several buildings or keep coming"""
+    if buildings_with_complaints >= 3 or total >= 10 or last_90_days >= 5:
+        return "HIGH"
+    elif buildings_with_complaints >= 2 or total >= 3:
+        return "MODERATE"
+    return "LOW"
+
+
+def record_complaint(memory: Dict, address_key: str, landlord_key: str, category: str, day: str):
+    """Update every aggregate for one newly stored complaint"""
+    building_stats = memory.setdefault("building_stats", {})
+    landlord_stats = memory.setdefault("landlord_stats", {})
+    citywide = memory["statistics"].setdefault("citywide", new_rollup())
+
+    add_to_rollup(building_stats.setdefault(address_key, new_rollup()), category, day)
+    if landlord_key:
+        add_to_rollup(landlord_stats.setdefault(landlord_key, new_rollup()), category, day)
+    add_to_rollup(citywide, category, day)
+
+
+def rebuild_aggregates(memory: Dict):
+    """
+    Recompute all aggregates from the stored complaints
+    Only needed once for databases written before aggregates existed
+    """
+    memory["building_stats"] = {}
+    memory["landlord_stats"] = {}
+    memory["statistics"]["citywide"] = new_rollup()
+
+    # Oldest first so window pruning behaves like it did when they were stored
+    records = []
+    for address_key, complaints in memory["buildings"].items():
+        for complaint in complaints:
+            records.append((complaint.get("date", ""), address_key, complaint))
+    records.sort(key=lambda record: record[0])
+
+    for date, address_key, complaint in records:
+        landlord = complaint.get("landlord")
+        landlord_key = landlord.lower().strip() if landlord else None
+        day = date[:10] or datetime.now().date().isoformat()
+        record_complaint(memory, address_key, landlord_key, complaint.get("category", "other_issues"), day)
+
+
+# Quick check
+if __name__ == "__main__":
+    memory = {"buildings": {}, "landlords": {}, "statistics": {"total_complaints": 0}}
+    today = datetime.now()
+    for i, category in enumerate(["heating_issues", "heating_issues", "pest_issues", "water_issues"]):
+        day = (today - timedelta(days=i * 40)).date().isoformat()
+        record_complaint(memory, f"{i % 2} main st", "abc property", category, day)
+
+    print(summarize(memory["building_stats"]["0 main st"]))
+    print(summarize(memory["landlord_stats"]["abc property"]))
+    print(summarize(memory["statistics"]["citywide"]))
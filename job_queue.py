@@ -0,0 +1,329 @@
+# Job Queue - Runs complaint analyses in the background so the UI never blocks
+#
+# Jobs live in a small SQLite database, so they survive Streamlit reruns,
+# page refreshes and even a restart of the app. Worker threads pick up
+# queued jobs and record which stage the workflow is in while they run.
+# A job nobody has asked about for a while (the user closed the tab) is
+# cancelled, so it stops holding a worker right away. An LLM request it had in
+# flight keeps its endpoint slot until that request's own HTTP timeout (cut to
+# the run's deadline) runs out.
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Callable, Dict, Optional
+
+from agents.cancellation import CancelToken, DEFAULT_RUN_DEADLINE
+from records import to_dicts
+
+# Job status values (stage holds the workflow stage for display_agent_status)
+STATUS_QUEUED = "queued"
+STATUS_RUNNING = "running"
+STATUS_COMPLETE = "complete"
+STATUS_FAILED = "failed"
+STATUS_CANCELLED = "cancelled"
+
+
+class JobQueue:
+    """Persistent SQLite-backed queue of workflow runs"""
+
+    def __init__(self, workflow_factory: Callable, db_path: str = "jobs.db",
+                 num_workers: int = 2, poll_interval: float = 0.5, abandon_after: float = None,
+                 deadline: float = DEFAULT_RUN_DEADLINE):
+        """
+        workflow_factory builds the RightsGuardWorkflow the workers share.
+        It is only called when the first job runs, so creating a queue is cheap.
+        abandon_after: cancel jobs that nobody has get() for this many seconds (None = never)
+        deadline: seconds each run may take before it falls back to partial results
+        """
+        self.name = "JobQueue"
+        self.db_path = db_path
+        self.workflow_factory = workflow_factory
+        self.workflow = None
+        self.workflow_lock = threading.Lock()
+        self.poll_interval = poll_interval
+        self.wakeup = threading.Event()
+        self.stopping = threading.Event()
+        self.local = threading.local()
+        self.abandon_after = abandon_after
+        self.deadline = deadline
+        self.running: Dict[str, CancelToken] = {}  # job id -> its run's cancel token
+        self.last_polled: Dict[str, float] = {}
+        self.jobs_lock = threading.Lock()
+
+        self._create_tables()
+        self._requeue_interrupted_jobs()
+
+        self.workers = []
+        for i in range(num_workers):
+            worker = threading.Thread(target=self._worker_loop, name=f"rightsguard-job-{i}", daemon=True)
+            worker.start()
+            self.workers.append(worker)
+        if abandon_after:
+            watchdog = threading.Thread(target=self._watchdog_loop, name="rightsguard-job-watchdog", daemon=True)
+            watchdog.start()
+            self.workers.append(watchdog)
+
+        print(f"{self.name} ready with {num_workers} workers ({db_path})")
+
+    def _connection(self) -> sqlite3.Connection:
+        """One SQLite connection per thread"""
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            self.local.conn = conn
+        return conn
+
+    def _create_tables(self):
+        self._connection().execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                stage TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                result TEXT,
+                partial TEXT,
+                error TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        """)
+        self._connection().execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)")
+        try:
+            # Databases created before partial results existed
+            self._connection().execute("ALTER TABLE jobs ADD COLUMN partial TEXT")
+        except sqlite3.OperationalError:
+            pass
+
+    def _requeue_interrupted_jobs(self):
+        """Jobs that were running when the app stopped get another try"""
+        now = time.time()
+        conn = self._connection()
+        job_ids = [row["id"] for row in conn.execute("SELECT id FROM jobs WHERE status = ?", (STATUS_RUNNING,))]
+        if not job_ids:
+            return
+        conn.executemany("UPDATE jobs SET status = ?, stage = 'idle', updated_at = ? WHERE id = ? AND status = ?",
+                         [(STATUS_QUEUED, now, job_id, STATUS_RUNNING) for job_id in job_ids])
+        # Like a fresh submit - the watchdog cancels them if nobody comes back for them
+        with self.jobs_lock:
+            for job_id in job_ids:
+                self.last_polled[job_id] = now
+        print(f"🔁 Re-queued {len(job_ids)} interrupted jobs")
+
+    def submit(self, user_complaint: str, building_address: str, tenant_info: Dict) -> str:
+        """Queue a complaint for analysis and return its job id right away"""
+        job_id = uuid.uuid4().hex
+        payload = json.dumps({
+            "user_complaint": user_complaint,
+            "building_address": building_address,
+            "tenant_info": tenant_info
+        })
+        now = time.time()
+        self._connection().execute(
+            "INSERT INTO jobs (id, status, stage, payload, created_at, updated_at) VALUES (?, ?, 'idle', ?, ?, ?)",
+            (job_id, STATUS_QUEUED, payload, now, now)
+        )
+        with self.jobs_lock:
+            self.last_polled[job_id] = now
+        self.wakeup.set()
+        return job_id
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        """Look up a job - cheap enough to call on every UI poll"""
+        row = self._connection().execute(
+            "SELECT id, status, stage, result, partial, error, created_at, updated_at FROM jobs WHERE id = ?",
+            (job_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        with self.jobs_lock:
+            if row["id"] in self.last_polled:
+                self.last_polled[row["id"]] = time.time()
+
+        job = dict(row)
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        job["partial"] = json.loads(job["partial"]) if job["partial"] else None
+        if job["status"] == STATUS_QUEUED:
+            job["position"] = self._connection().execute(
+                "SELECT COUNT(*) FROM jobs WHERE status = ? AND created_at < ?",
+                (STATUS_QUEUED, job["created_at"])
+            ).fetchone()[0]
+        return job
+
+    def cancel(self, job_id: str, reason: str = "cancelled") -> bool:
+        """Stop a queued or running job - False if it had already finished"""
+        with self.jobs_lock:
+            token = self.running.get(job_id)
+            self.last_polled.pop(job_id, None)
+        if token is not None:
+            # The worker sees the token, lets the run fall through its fallbacks and marks it cancelled
+            token.cancel(reason)
+            return True
+        cursor = self._connection().execute(
+            "UPDATE jobs SET status = ?, error = ?, updated_at = ? WHERE id = ? AND status = ?",
+            (STATUS_CANCELLED, reason, time.time(), job_id, STATUS_QUEUED)
+        )
+        return cursor.rowcount > 0
+
+    def _claim_next_job(self) -> Optional[sqlite3.Row]:
+        """Atomically move the oldest queued job to running"""
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT id, payload FROM jobs WHERE status = ? ORDER BY created_at LIMIT 1",
+                (STATUS_QUEUED,)
+            ).fetchone()
+            if row is not None:
+                conn.execute(
+                    "UPDATE jobs SET status = ?, updated_at = ? WHERE id = ?",
+                    (STATUS_RUNNING, time.time(), row["id"])
+                )
+            conn.execute("COMMIT")
+            return row
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _update(self, job_id: str, **fields):
+        fields["updated_at"] = time.time()
+        assignments = ", ".join(f"{key} = ?" for key in fields)
+        self._connection().execute(
+            f"UPDATE jobs SET {assignments} WHERE id = ?",
+            (*fields.values(), job_id)
+        )
+
+    def _get_workflow(self):
+        with self.workflow_lock:
+            if self.workflow is None:
+                self.workflow = self.workflow_factory()
+            return self.workflow
+
+    def _run_job(self, job_id: str, payload: Dict):
+        cancel_token = CancelToken(self.deadline)
+        with self.jobs_lock:
+            self.running[job_id] = cancel_token
+        try:
+            workflow = self._get_workflow()
+            events = workflow.stream_complaint(
+                user_complaint=payload["user_complaint"],
+                building_address=payload["building_address"],
+                tenant_info=payload["tenant_info"],
+                cancel_token=cancel_token
+            )
+            for event in events:
+                if cancel_token.cancelled:
+                    events.close()
+                    self._update(job_id, status=STATUS_CANCELLED, error=cancel_token.reason)
+                    print(f"🛑 Job {job_id[:8]} cancelled ({cancel_token.reason})")
+                    break
+                if event["event"] == "node_start":
+                    self._update(job_id, stage=event["stage"])
+                elif event["event"] == "node_end" and event["node"] == "web_scraper":
+                    # Research is done - the UI can show it while the LLM stages run
+                    partial = {
+                        "jurisdiction": event["state"].get("jurisdiction"),
+                        "building_history": to_dicts(event["state"]["building_history"]),
+                        "violations": to_dicts(event["state"]["violation_data"]),
+                        "total_community_complaints": workflow.get_total_complaints(),
+                        "stats": event["state"]["community_stats"]
+                    }
+                    self._update(job_id, partial=json.dumps(partial, default=str))
+                elif event["event"] == "complete":
+                    result = dict(event["result"], timings=event["timings"])
+                    self._update(job_id, status=STATUS_COMPLETE, stage="complete",
+                                 result=json.dumps(result, default=str))
+                    print(f"✅ Job {job_id[:8]} complete in {event['elapsed']:.1f}s")
+        except Exception as e:
+            self._update(job_id, status=STATUS_FAILED, error=str(e))
+            print(f"❌ Job {job_id[:8]} failed: {e}")
+        finally:
+            with self.jobs_lock:
+                self.running.pop(job_id, None)
+                self.last_polled.pop(job_id, None)
+
+    def _worker_loop(self):
+        backoff = self.poll_interval
+        while not self.stopping.is_set():
+            try:
+                row = self._claim_next_job()
+            except sqlite3.Error as e:
+                # e.g. "database is locked" - keep the worker alive and try again in a bit
+                print(f"⚠️ {threading.current_thread().name} could not claim a job ({e}) - retrying in {backoff:.1f}s")
+                self.stopping.wait(backoff)
+                backoff = min(backoff * 2, 30.0)
+                continue
+            backoff = self.poll_interval
+            if row is None:
+                # Nothing to do - sleep until a submit() or the next poll
+                self.wakeup.wait(self.poll_interval)
+                self.wakeup.clear()
+                continue
+            self._run_job(row["id"], json.loads(row["payload"]))
+
+    def _watchdog_loop(self):
+        """Cancel jobs whose page stopped polling - nobody is waiting for the result"""
+        while not self.stopping.wait(min(self.abandon_after / 4, 5.0)):
+            cutoff = time.time() - self.abandon_after
+            with self.jobs_lock:
+                abandoned = [job_id for job_id, polled in self.last_polled.items() if polled < cutoff]
+            for job_id in abandoned:
+                if self.cancel(job_id, reason=f"not polled for {self.abandon_after:g}s"):
+                    print(f"🛑 Job {job_id[:8]} abandoned - cancelling")
+
+    def cleanup(self, max_age_hours: float = 24):
+        """Delete finished jobs older than max_age_hours"""
+        cutoff = time.time() - max_age_hours * 3600
+        cursor = self._connection().execute(
+            "DELETE FROM jobs WHERE status IN (?, ?, ?) AND updated_at < ?",
+            (STATUS_COMPLETE, STATUS_FAILED, STATUS_CANCELLED, cutoff)
+        )
+        return cursor.rowcount
+
+    def stop(self):
+        """Stop the workers after their current job"""
+        self.stopping.set()
+        self.wakeup.set()
+        for worker in self.workers:
+            worker.join()
+
+
+# Quick check with a fake workflow
+if __name__ == "__main__":
+    import os
+    import tempfile
+
+    class FakeWorkflow:
+        def get_total_complaints(self):
+            return 0
+
+        def stream_complaint(self, user_complaint, building_address, tenant_info, cancel_token=None):
+            state = {"building_history": [], "violation_data": [], "community_stats": {}}
+            for node, stage in [("web_scraper", "scraping"), ("analyzer", "analyzing"),
+                                ("letter_generator", "generating")]:
+                yield {"event": "node_start", "node": node, "stage": stage}
+                cancel_token.wait(0.4)
+                yield {"event": "node_end", "node": node, "stage": stage, "state": state}
+            yield {"event": "complete", "elapsed": 1.2, "timings": {},
+                   "result": {"letter": {"letter_content": f"Re: {building_address}"}}}
+
+    db_path = os.path.join(tempfile.mkdtemp(), "jobs.db")
+    queue = JobQueue(FakeWorkflow, db_path=db_path, abandon_after=0.5)
+    job_id = queue.submit("No heat", "123 Main St", {"name": "John Doe"})
+
+    while True:
+        job = queue.get(job_id)
+        print(job["status"], job["stage"], job["partial"])
+        if job["status"] in (STATUS_COMPLETE, STATUS_FAILED):
+            break
+        time.sleep(0.15)
+    print(job["result"])
+
+    # Submit and walk away - the watchdog should cancel it
+    job_id = queue.submit("Mold", "456 Oak Ave", {"name": "Jane Doe"})
+    time.sleep(2)
+    print(queue.get(job_id)["status"], queue.get(job_id)["error"])
+    queue.stop()
@@ -0,0 +1,272 @@
+# Load Test - How many concurrent users before latency degrades
+#
+# Replays a realistic mix of complaints against the HTTP service (POST /analyze)
+# or straight against the workflow in this process, stepping concurrency up and
+# holding each step for a while. Every step reports throughput, latency
+# percentiles and error rate; the knee is the last step where more users still
+# bought real throughput without p95 latency running away.
+#
+#   python load_test.py --target workflow --mock-llm-ms 800 --mock-data-ms 150
+#
+#   RIGHTSGUARD_MOCK_BACKENDS=1 RIGHTSGUARD_LETTER_CACHE=0 python service.py --workers 4 &
+#   python load_test.py --target http://localhost:8000 --steps 1,2,4,8,16,32
+#
+# The mix has only a handful of complaint texts and the mock analyses are
+# deterministic, so with the letter cache on most requests would be cache hits
+# within a single run. The workflow target turns it off unless --letter-cache
+# is given; start the service with RIGHTSGUARD_LETTER_CACHE=0 for the same.
+#
+# The Streamlit app runs this same workflow for each session, so the workflow
+# target measures its capacity too (Streamlit's websocket protocol isn't replayed).
+# The NVIDIA rate limiter (NVIDIA_RATE_LIMIT_RPM, 60/min by default) would be
+# the knee long before the rest of the stack, so against the mocks the workflow
+# target lifts it (--rate-limit-rpm to pick a limit). The HTTP target reports
+# the service's limit - start the service with a high NVIDIA_RATE_LIMIT_RPM.
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from contextlib import redirect_stdout
+from typing import Callable, Dict, List, Tuple
+
+import requests
+
+# The mocks have no quota to protect - effectively no NVIDIA rate limit
+MOCK_RATE_LIMIT_RPM = 1_000_000
+
+# (weight, complaint) - roughly how often each kind of complaint comes in
+COMPLAINT_MIX = [
+    (30, "No heat in my apartment for over a week and the radiators are cold"),
+    (15, "Roaches and mice in the kitchen even after I reported them"),
+    (15, "Water leak from the ceiling in the bathroom keeps dripping"),
+    (10, "Black mold growing on the bedroom walls"),
+    (10, "Landlord entered my apartment without notice while I was at work"),
+    (10, "Broken window and front door lock nobody will repair"),
+    (5, "No heat and roaches in the kitchen, the landlord won't fix anything"),
+    (5, "The building is too noisy at night")
+]
+TENANTS = ["Maria Lopez", "James Chen", "Aisha Khan", "John Doe", "Dmitri Ivanov", "Grace Park"]
+LANDLORDS = ["ABC Property Management", "Sunrise Realty LLC", "Park Slope Holdings", None]
+BUILDINGS = 40
+
+DEFAULT_STEPS = [1, 2, 4, 8, 16]
+
+# A step is saturated when it adds less than this much throughput...
+MIN_THROUGHPUT_GAIN = 0.10
+# ...or its p95 is this many times the single-user p95, or it fails this often
+MAX_P95_GROWTH = 3.0
+MAX_ERROR_RATE = 0.05
+
+
+def make_request(rng: random.Random) -> Dict:
+    """One complaint drawn from the mix, for one of a few dozen buildings"""
+    complaint = rng.choices([text for _, text in COMPLAINT_MIX], weights=[weight for weight, _ in COMPLAINT_MIX])[0]
+    building = rng.randrange(BUILDINGS)
+    return {
+        "complaint": complaint,
+        "address": f"{100 + building} {rng.choice(['Main St', 'Broadway', 'Atlantic Ave'])}, Brooklyn, NY",
+        "tenant_info": {"name": rng.choice(TENANTS), "landlord": LANDLORDS[building % len(LANDLORDS)]}
+    }
+
+
+def percentile(values: List[float], p: float) -> float:
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def http_caller(base_url: str, timeout: float) -> Callable[[Dict], str]:
+    """POST /analyze - 'ok', 'rejected' (503 backpressure) or 'error'"""
+    local = threading.local()
+
+    def call(payload: Dict) -> str:
+        if not hasattr(local, 'session'):
+            local.session = requests.Session()
+        try:
+            response = local.session.post(f"{base_url.rstrip('/')}/analyze", json=payload, timeout=timeout)
+        except requests.RequestException:
+            return "error"
+        if response.status_code == 200:
+            return "ok"
+        return "rejected" if response.status_code == 503 else "error"
+
+    return call
+
+
+def service_rate_limit(base_url: str, timeout: float):
+    """The service's configured NVIDIA rate limit per minute, from /health (None if it doesn't say)"""
+    try:
+        health = requests.get(base_url.rstrip('/') + "/health", timeout=timeout).json()
+        limiter = health["llm_endpoints"]["nvidia"]["rate_limiter"]
+        return limiter["max_rate_per_minute"]
+    except (requests.RequestException, ValueError, KeyError, TypeError):
+        return None
+
+
+def workflow_caller(memory_db_path: str) -> Callable[[Dict], str]:
+    """process_complaint in this process - 'ok' or 'error'"""
+    from workflow import RightsGuardWorkflow
+
+    workflow = RightsGuardWorkflow(memory_db_path=memory_db_path)
+
+    def call(payload: Dict) -> str:
+        tenant_info = dict(payload["tenant_info"], address=payload["address"], date=time.strftime("%B %d, %Y"))
+        try:
+            result = workflow.process_complaint(payload["complaint"], payload["address"], tenant_info)
+        except Exception:
+            return "error"
+        return "ok" if result.get("letter") else "error"
+
+    return call
+
+
+def run_step(call: Callable[[Dict], str], concurrency: int, duration: float, seed: int) -> Dict:
+    """Closed loop: concurrency users send back-to-back requests for duration seconds"""
+    results: List[Tuple[float, str]] = []
+    results_lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def user(index: int):
+        rng = random.Random(seed * 1000 + index)
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            outcome = call(make_request(rng))
+            with results_lock:
+                results.append((time.perf_counter() - started, outcome))
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=user, args=(i,), daemon=True) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    latencies = sorted(latency for latency, outcome in results if outcome == "ok")
+    errors = sum(1 for _, outcome in results if outcome == "error")
+    rejected = sum(1 for _, outcome in results if outcome == "rejected")
+    return {
+        "concurrency": concurrency,
+        "requests": len(results),
+        "throughput_rps": round(len(latencies) / elapsed, 3),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000),
+        "p90_ms": round(percentile(latencies, 0.90) * 1000),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000),
+        "error_rate": round(errors / len(results), 4) if results else 0.0,
+        "rejected_rate": round(rejected / len(results), 4) if results else 0.0
+    }
+
+
+def find_knee(steps: List[Dict]) -> Dict:
+    """Last step before throughput stops growing, p95 runs away or errors show up"""
+    if not steps:
+        return None
+    baseline_p95 = steps[0]["p95_ms"] or 1
+    knee = steps[0]
+    for previous, step in zip(steps, steps[1:]):
+        gain = (step["throughput_rps"] - previous["throughput_rps"]) / (previous["throughput_rps"] or 1)
+        if (gain < MIN_THROUGHPUT_GAIN or step["p95_ms"] > baseline_p95 * MAX_P95_GROWTH
+                or step["error_rate"] + step["rejected_rate"] > MAX_ERROR_RATE):
+            break
+        knee = step
+    return {"concurrency": knee["concurrency"], "throughput_rps": knee["throughput_rps"], "p95_ms": knee["p95_ms"]}
+
+
+def print_report(steps: List[Dict], knee: Dict):
+    print(f"\n{'users':>6} {'reqs':>6} {'req/s':>8} {'p50':>7} {'p90':>7} {'p95':>7} {'p99':>7} {'errors':>7} {'503s':>7}")
+    for step in steps:
+        marker = "  ◀ knee" if knee and step["concurrency"] == knee["concurrency"] else ""
+        print(f"{step['concurrency']:>6} {step['requests']:>6} {step['throughput_rps']:>8.2f} "
+              f"{step['p50_ms']:>6}ms {step['p90_ms']:>6}ms {step['p95_ms']:>6}ms {step['p99_ms']:>6}ms "
+              f"{step['error_rate']:>7.1%} {step['rejected_rate']:>7.1%}{marker}")
+    if knee:
+        print(f"\n📈 Knee at {knee['concurrency']} concurrent users: "
+              f"{knee['throughput_rps']:.2f} req/s with p95 {knee['p95_ms']}ms")
+
+
+def run(call: Callable[[Dict], str], steps: List[int], duration: float, seed: int = 42, quiet: bool = True) -> Dict:
+    """Ramp through the concurrency steps and find the knee"""
+    results = []
+    for concurrency in steps:
+        print(f"🏋️ {concurrency} concurrent users for {duration:.0f}s...", file=sys.stderr)
+        # The agents print a lot per request - keep it out of the report unless asked for
+        with open(os.devnull, 'w') as devnull, redirect_stdout(devnull if quiet else sys.stdout):
+            results.append(run_step(call, concurrency, duration, seed))
+    return {"steps": results, "knee": find_knee(results)}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Ramp concurrent users against RightsGuard and find the knee")
+    parser.add_argument('--target', default="workflow",
+                        help="'workflow' (in this process) or the service's base URL, e.g. http://localhost:8000")
+    parser.add_argument('--steps', default=",".join(str(step) for step in DEFAULT_STEPS),
+                        help="Comma-separated concurrency levels to ramp through")
+    parser.add_argument('--duration', type=float, default=30.0, help="Seconds to hold each step")
+    parser.add_argument('--timeout', type=float, default=120.0, help="HTTP request timeout in seconds")
+    parser.add_argument('--mock-llm-ms', type=float, default=800.0,
+                        help="Mean mock NVIDIA latency for the workflow target (the service reads RIGHTSGUARD_MOCK_LLM_MS)")
+    parser.add_argument('--mock-data-ms', type=float, default=150.0, help="Mean mock Open Data latency")
+    parser.add_argument('--mock-error-rate', type=float, default=0.0, help="Fraction of mock calls that fail")
+    parser.add_argument('--real-backends', action='store_true',
+                        help="Workflow target calls the real NVIDIA and Open Data endpoints")
+    parser.add_argument('--memory-db', help="Community memory for the workflow target (default: a temp dir)")
+    parser.add_argument('--rate-limit-rpm', type=float,
+                        help="NVIDIA rate limit for the workflow target (default: lifted with the mocks, "
+                             "NVIDIA_RATE_LIMIT_RPM with --real-backends)")
+    parser.add_argument('--letter-cache', action='store_true',
+                        help="Keep the letter cache on for the workflow target (measures cache hits, not capacity)")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help="Also write the results as JSON here")
+    parser.add_argument('--verbose', action='store_true', help="Keep the agents' console output")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    steps = [int(step) for step in args.steps.split(",") if step.strip()]
+
+    if args.target == "workflow":
+        # Fresh community memory, and no letter cache - repeats of the same few complaints
+        # (within this run or from earlier ones) would otherwise be measured as cache hits
+        scratch_dir = tempfile.mkdtemp(prefix="rightsguard-load-")
+        os.environ.setdefault("RIGHTSGUARD_LETTER_CACHE_DIR", os.path.join(scratch_dir, "letter_cache"))
+        if not args.letter_cache:
+            os.environ["RIGHTSGUARD_LETTER_CACHE"] = "0"
+        # Before the agents are imported - the endpoint guard reads its limit then
+        if args.rate_limit_rpm is not None:
+            os.environ["NVIDIA_RATE_LIMIT_RPM"] = str(args.rate_limit_rpm)
+        elif not args.real_backends:
+            os.environ["NVIDIA_RATE_LIMIT_RPM"] = str(MOCK_RATE_LIMIT_RPM)
+        rate_limit = float(os.getenv("NVIDIA_RATE_LIMIT_RPM", "60"))
+        if not args.real_backends:
+            from mock_backends import MockBackends
+            MockBackends(args.mock_llm_ms, args.mock_data_ms, error_rate=args.mock_error_rate).install()
+        memory_db = args.memory_db or os.path.join(scratch_dir, "community_memory.json")
+        with open(os.devnull, 'w') as devnull, redirect_stdout(sys.stdout if args.verbose else devnull):
+            call = workflow_caller(memory_db)
+    else:
+        call = http_caller(args.target, args.timeout)
+        rate_limit = service_rate_limit(args.target, args.timeout)
+
+    if rate_limit is not None and rate_limit < MOCK_RATE_LIMIT_RPM:
+        print(f"ℹ️ NVIDIA calls are capped at {rate_limit:g}/min by the rate limiter - "
+              f"the knee may be that limit rather than the service", file=sys.stderr)
+
+    report = run(call, steps, args.duration, args.seed, quiet=not args.verbose)
+    report["target"] = args.target
+    report["letter_cache"] = args.letter_cache if args.target == "workflow" else None
+    report["rate_limit_rpm"] = rate_limit
+    print_report(report["steps"], report["knee"])
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"💾 Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
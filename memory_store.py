@@ -0,0 +1,464 @@
+# Memory Store - Sharded, lazily loaded Community Legal Memory
+#
+# The single community_memory.json had to be parsed in full by every process
+# at startup. Here buildings and landlords are spread over a fixed number of
+# shard files by a hash of their key:
+#
+#   community_memory.shards/
+#     index.bin        memory-mapped header + one (version, complaints) slot per shard
+#     meta.json        citywide statistics (fixed size)
+#     shards/0a3.json  {"buildings", "building_stats", "landlords", "landlord_stats"}
+#
+# Opening the store only maps index.bin, so startup doesn't depend on how many
+# complaints there are. A shard is read the first time one of its buildings is
+# asked for and kept in a bounded LRU. Every write bumps the shard's version in
+# the shared mapping, so other processes notice and re-read just that shard.
+# Writers change a copy of the shard and swap it into the LRU once it's saved,
+# so threads reading the cached one never see it change under them.
+#
+# Each building's history is kept in monthly buckets. Complaints older than the
+# retention period are rolled up into per-category counts whenever their shard
+# is written (or by compact_all() for shards nobody writes to).
+import fcntl
+import hashlib
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import community_stats
+from records import BuildingHistory, ComplaintRecord, complaint_key, json_default
+
+DEFAULT_SHARDS = int(os.getenv("RIGHTSGUARD_MEMORY_SHARDS", "1024"))
+DEFAULT_CACHED_SHARDS = int(os.getenv("RIGHTSGUARD_MEMORY_CACHED_SHARDS", "64"))
+DEFAULT_RETENTION_DAYS = float(os.getenv("RIGHTSGUARD_HISTORY_RETENTION_DAYS", "730"))
+
+INDEX_MAGIC = b"RGMEM001"
+HEADER = struct.Struct("<8sIIQ")  # magic, shard count, reserved, meta version
+SLOT = struct.Struct("<QQ")       # shard version, complaints in shard
+
+
+def shards_path(memory_db_path: str) -> str:
+    """community_memory.json -> community_memory.shards"""
+    return os.path.splitext(memory_db_path)[0] + ".shards"
+
+
+def shard_for(key: str, num_shards: int) -> int:
+    """Stable across processes and restarts (unlike hash())"""
+    digest = hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'little') % num_shards
+
+
+def _new_shard() -> Dict:
+    return {"buildings": {}, "building_stats": {}, "landlords": {}, "landlord_stats": {}}
+
+
+def _new_meta() -> Dict:
+    return {"total_complaints": 0, "citywide": community_stats.new_rollup()}
+
+
+def _write_json(path: str, data: Dict):
+    """Write to a temp file, then swap it in so readers never see half a file"""
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    # json.dumps rather than json.dump - only the one-shot encoder runs in C
+    with open(tmp_path, 'w') as f:
+        f.write(json.dumps(data, default=json_default))
+    os.replace(tmp_path, path)
+
+
+def _copy_meta(meta: Dict) -> Dict:
+    return dict(meta, citywide=community_stats.copy_rollup(meta["citywide"]))
+
+
+class _ShardEdit:
+    """
+    A writer's copy of a cached shard - the maps are copied up front, their entries
+    the first time they're changed, so the cached shard readers hold stays as it was
+    """
+
+    def __init__(self, shard: Dict):
+        self.shard = {section: dict(entries) for section, entries in shard.items()}
+        self.copied = set()  # (section, key) entries that are already ours
+
+    def _own(self, section: str, key: str, copy: Callable, new: Callable):
+        entries = self.shard[section]
+        if (section, key) not in self.copied:
+            self.copied.add((section, key))
+            entries[key] = copy(entries[key]) if key in entries else new()
+        return entries[key]
+
+    def history(self, address_key: str) -> BuildingHistory:
+        return self._own("buildings", address_key, BuildingHistory.copy, BuildingHistory)
+
+    def landlord_buildings(self, landlord_key: str) -> List[str]:
+        return self._own("landlords", landlord_key, list, list)
+
+    def rollup(self, section: str, key: str) -> Dict:
+        """A building_stats or landlord_stats entry, ready for community_stats.record_complaint"""
+        return self._own(section, key, community_stats.copy_rollup, community_stats.new_rollup)
+
+    def compact(self, cutoff: int) -> int:
+        return sum(self.history(address_key).compact(cutoff)
+                   for address_key, history in list(self.shard["buildings"].items()) if history.needs_compact(cutoff))
+
+
+class ShardedMemoryStore:
+    """Community memory split into hash shards with a memory-mapped version index"""
+
+    def __init__(self, path: str, num_shards: int = DEFAULT_SHARDS, cached_shards: int = DEFAULT_CACHED_SHARDS,
+                 legacy_path: str = None, retention_days: float = DEFAULT_RETENTION_DAYS):
+        self.name = "ShardedMemoryStore"
+        self.path = path
+        self.shard_dir = os.path.join(path, "shards")
+        self.index_path = os.path.join(path, "index.bin")
+        self.meta_path = os.path.join(path, "meta.json")
+        self.lock_path = os.path.join(path, ".lock")
+        self.cached_shards = cached_shards
+        self.retention = retention_days * 86400
+
+        self.cache = OrderedDict()  # shard id -> (version, shard data)
+        self.meta = None
+        self.meta_version = None
+        self.cache_lock = threading.Lock()
+        self.stats = {"shard_loads": 0, "shard_hits": 0, "shard_evictions": 0, "rolled_up": 0}
+
+        os.makedirs(self.shard_dir, exist_ok=True)
+        with self.lock():
+            if not os.path.exists(self.index_path):
+                self._create_index(num_shards)
+                if legacy_path and os.path.exists(legacy_path):
+                    self._import_legacy(legacy_path)
+
+        self.index_file = open(self.index_path, 'r+b')
+        self.index = mmap.mmap(self.index_file.fileno(), 0)
+        magic, self.num_shards, _, _ = HEADER.unpack_from(self.index, 0)
+        if magic != INDEX_MAGIC:
+            raise ValueError(f"{self.index_path} is not a community memory index")
+
+    @contextmanager
+    def lock(self):
+        """Exclusive lock across processes for read-modify-write of the store"""
+        with open(self.lock_path, 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _create_index(self, num_shards: int):
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(HEADER.pack(INDEX_MAGIC, num_shards, 0, 0))
+            f.write(b"\0" * SLOT.size * num_shards)
+        _write_json(self.meta_path, _new_meta())
+        os.replace(tmp_path, self.index_path)
+
+    # -- index slots -----------------------------------------------------------
+
+    def _slot_offset(self, shard_id: int) -> int:
+        return HEADER.size + shard_id * SLOT.size
+
+    def _shard_version(self, shard_id: int) -> Tuple[int, int]:
+        return SLOT.unpack_from(self.index, self._slot_offset(shard_id))
+
+    def _current_meta_version(self) -> int:
+        return HEADER.unpack_from(self.index, 0)[3]
+
+    def _shard_path(self, shard_id: int) -> str:
+        return os.path.join(self.shard_dir, f"{shard_id:04x}.json")
+
+    # -- reading ---------------------------------------------------------------
+
+    def _load_shard_file(self, shard_id: int) -> Dict:
+        try:
+            with open(self._shard_path(shard_id), 'r') as f:
+                shard = json.load(f)
+        except FileNotFoundError:
+            return _new_shard()
+        shard["buildings"] = {
+            address_key: BuildingHistory.from_dict(history) for address_key, history in shard["buildings"].items()
+        }
+        return shard
+
+    def get_shard(self, shard_id: int) -> Dict:
+        """The shard's current contents, from the LRU unless another process changed it"""
+        version, _ = self._shard_version(shard_id)
+        with self.cache_lock:
+            cached = self.cache.get(shard_id)
+            if cached is not None and cached[0] == version:
+                self.cache.move_to_end(shard_id)
+                self.stats["shard_hits"] += 1
+                return cached[1]
+
+        shard = self._load_shard_file(shard_id)
+        with self.cache_lock:
+            self.stats["shard_loads"] += 1
+            self.cache[shard_id] = (version, shard)
+            self.cache.move_to_end(shard_id)
+            while len(self.cache) > self.cached_shards:
+                self.cache.popitem(last=False)
+                self.stats["shard_evictions"] += 1
+        return shard
+
+    def building_shard(self, address_key: str) -> Tuple[int, Dict]:
+        shard_id = shard_for("building:" + address_key, self.num_shards)
+        return shard_id, self.get_shard(shard_id)
+
+    def landlord_shard(self, landlord_key: str) -> Tuple[int, Dict]:
+        shard_id = shard_for("landlord:" + landlord_key, self.num_shards)
+        return shard_id, self.get_shard(shard_id)
+
+    def get_building_history(self, address_key: str) -> BuildingHistory:
+        return self.building_shard(address_key)[1]["buildings"].get(address_key) or BuildingHistory()
+
+    def recent(self, address_key: str, since: int = None, limit: int = None) -> List[ComplaintRecord]:
+        """A building's newest complaints (filed at or after since, at most limit), oldest first"""
+        return self.get_building_history(address_key).recent(since, limit)
+
+    def get_building_stats(self, address_key: str) -> Optional[Dict]:
+        return self.building_shard(address_key)[1]["building_stats"].get(address_key)
+
+    def get_landlord(self, landlord_key: str) -> Tuple[List[str], Optional[Dict]]:
+        """(buildings the landlord owns, their running stats)"""
+        shard = self.landlord_shard(landlord_key)[1]
+        return shard["landlords"].get(landlord_key, []), shard["landlord_stats"].get(landlord_key)
+
+    def get_statistics(self) -> Dict:
+        """Total complaints and citywide rollup (re-read only when another process wrote)"""
+        version = self._current_meta_version()
+        if self.meta is None or version != self.meta_version:
+            with open(self.meta_path, 'r') as f:
+                self.meta = json.load(f)
+            self.meta_version = version
+        return self.meta
+
+    # -- writing (caller holds lock()) -----------------------------------------
+
+    def _compact_shard(self, edit: _ShardEdit) -> int:
+        """Roll up complaints past the retention period in every building of a shard"""
+        rolled = edit.compact(int(time.time() - self.retention))
+        if rolled:
+            with self.cache_lock:
+                self.stats["rolled_up"] += rolled
+        return rolled
+
+    def _save_shard(self, shard_id: int, edit: _ShardEdit, added: int, roll_up: bool = True):
+        # The whole shard is rewritten anyway, so this is when old complaints get rolled up
+        rolled = self._compact_shard(edit) if roll_up else 0
+        _write_json(self._shard_path(shard_id), edit.shard)
+        version, complaints = self._shard_version(shard_id)
+        SLOT.pack_into(self.index, self._slot_offset(shard_id), version + 1, max(0, complaints + added - rolled))
+        with self.cache_lock:
+            self.cache[shard_id] = (version + 1, edit.shard)
+            self.cache.move_to_end(shard_id)
+            while len(self.cache) > self.cached_shards:
+                self.cache.popitem(last=False)
+                self.stats["shard_evictions"] += 1
+
+    def _save_meta(self, meta: Dict):
+        _write_json(self.meta_path, meta)
+        magic, num_shards, reserved, version = HEADER.unpack_from(self.index, 0)
+        HEADER.pack_into(self.index, 0, magic, num_shards, reserved, version + 1)
+        self.meta, self.meta_version = meta, version + 1
+
+    def add_complaint(self, address_key: str, landlord_key: Optional[str], record: ComplaintRecord):
+        """Store one complaint and update every aggregate - caller must hold lock()"""
+        building_id, building_shard = self.building_shard(address_key)
+        building_edit = _ShardEdit(building_shard)
+        building_edit.history(address_key).add(record)
+        building_edit.rollup("building_stats", address_key)
+
+        landlord_id, landlord_edit = None, None
+        if landlord_key:
+            landlord_id, landlord_shard = self.landlord_shard(landlord_key)
+            landlord_edit = building_edit if landlord_id == building_id else _ShardEdit(landlord_shard)
+            buildings = landlord_edit.landlord_buildings(landlord_key)
+            if address_key not in buildings:
+                buildings.append(address_key)
+            landlord_edit.rollup("landlord_stats", landlord_key)
+
+        meta = _copy_meta(self.get_statistics())
+        meta["total_complaints"] += 1
+        community_stats.record_complaint(
+            {
+                "building_stats": building_edit.shard["building_stats"],
+                "landlord_stats": landlord_edit.shard["landlord_stats"] if landlord_key else {},
+                "statistics": meta
+            },
+            address_key, landlord_key, record.category, record.day
+        )
+
+        self._save_shard(building_id, building_edit, 1)
+        if landlord_key and landlord_id != building_id:
+            self._save_shard(landlord_id, landlord_edit, 0)
+        self._save_meta(meta)
+
+    def add_complaints(self, complaints: Iterable[Tuple[str, Optional[str], ComplaintRecord]],
+                       roll_up: bool = True) -> Dict:
+        """
+        Store many (address_key, landlord_key, record) at once - caller must hold lock()
+        Every touched shard is read once and written once, and meta.json once, however
+        many complaints land in it. A complaint the building already has (same day and
+        text, even if it has since been rolled up) is skipped.
+        roll_up=False keeps complaints past the retention period in full until the
+        shard's next ordinary write or compact_all(), so a bulk import can be exported again.
+        """
+        meta = _copy_meta(self.get_statistics())
+        shards = {}  # shard id -> our copy of the shard, made on first touch
+        added = {}   # shard id -> complaints added to it
+        seen = {}    # address key -> fingerprints of the building's complaints
+        cutoff = int(time.time() - self.retention)
+        counts = {"added": 0, "duplicates": 0, "past_retention": 0}
+
+        def touch(shard_id: int) -> _ShardEdit:
+            if shard_id not in shards:
+                shards[shard_id] = _ShardEdit(self.get_shard(shard_id))
+                added[shard_id] = 0
+            return shards[shard_id]
+
+        # Oldest first so rolling-window pruning behaves like it did when they were stored
+        for address_key, landlord_key, record in sorted(complaints, key=lambda item: item[2].date):
+            building_id = shard_for("building:" + address_key, self.num_shards)
+            building_edit = touch(building_id)
+            keys = seen.get(address_key)
+            if keys is None:
+                history = building_edit.shard["buildings"].get(address_key)
+                keys = seen[address_key] = history.keys() if history else set()
+            day = record.day
+            key = complaint_key(day, record.complaint)
+            if key in keys:
+                counts["duplicates"] += 1
+                continue
+            keys.add(key)
+            building_edit.history(address_key).add(record)
+            building_edit.rollup("building_stats", address_key)
+            added[building_id] += 1
+
+            landlord_edit = None
+            if landlord_key:
+                landlord_edit = touch(shard_for("landlord:" + landlord_key, self.num_shards))
+                buildings = landlord_edit.landlord_buildings(landlord_key)
+                if address_key not in buildings:
+                    buildings.append(address_key)
+                landlord_edit.rollup("landlord_stats", landlord_key)
+
+            meta["total_complaints"] += 1
+            community_stats.record_complaint(
+                {
+                    "building_stats": building_edit.shard["building_stats"],
+                    "landlord_stats": landlord_edit.shard["landlord_stats"] if landlord_key else {},
+                    "statistics": meta
+                },
+                address_key, landlord_key, record.category, day
+            )
+            counts["added"] += 1
+            if record.date < cutoff:
+                counts["past_retention"] += 1
+
+        rolled_before = self.stats["rolled_up"]
+        for shard_id, edit in shards.items():
+            self._save_shard(shard_id, edit, added[shard_id], roll_up)
+        if shards:
+            self._save_meta(meta)
+        counts["shards_written"] = len(shards)
+        counts["rolled_up"] = self.stats["rolled_up"] - rolled_before
+        return counts
+
+    def iter_complaints(self) -> Iterator[Tuple[str, ComplaintRecord]]:
+        """(address_key, record) for every complaint still held in full, shard by shard"""
+        for shard_id in range(self.num_shards):
+            if self._shard_version(shard_id)[0] == 0:
+                continue  # never written
+            # Read straight from disk so an export doesn't flush the LRU
+            for address_key, history in self._load_shard_file(shard_id)["buildings"].items():
+                for month in sorted(history.buckets):
+                    for record in history.buckets[month]:
+                        yield address_key, record
+
+    def compact_all(self) -> int:
+        """Roll up old complaints in every shard that holds any (for shards nobody writes to)"""
+        rolled = 0
+        with self.lock():
+            for shard_id in range(self.num_shards):
+                if self._shard_version(shard_id)[1] == 0:
+                    continue
+                shard = self.get_shard(shard_id)
+                cutoff = int(time.time() - self.retention)
+                if any(history.needs_compact(cutoff) for history in shard["buildings"].values()):
+                    before = self._shard_version(shard_id)[1]
+                    self._save_shard(shard_id, _ShardEdit(shard), 0)
+                    rolled += before - self._shard_version(shard_id)[1]
+        print(f"🗜️ Rolled up {rolled} complaints older than {self.retention / 86400:.0f} days")
+        return rolled
+
+    def _import_legacy(self, legacy_path: str):
+        """One-time split of an old single-file community_memory.json into shards"""
+        print(f"📦 Migrating {legacy_path} to sharded community memory...")
+        with open(legacy_path, 'r') as f:
+            memory = json.load(f)
+        if "building_stats" not in memory:
+            community_stats.rebuild_aggregates(memory)
+
+        with open(self.index_path, 'rb') as f:
+            num_shards = HEADER.unpack(f.read(HEADER.size))[1]
+        shards = {}
+        counts = {}
+        for address_key, complaints in memory.get("buildings", {}).items():
+            shard_id = shard_for("building:" + address_key, num_shards)
+            shard = shards.setdefault(shard_id, _new_shard())
+            shard["buildings"][address_key] = complaints
+            if address_key in memory.get("building_stats", {}):
+                shard["building_stats"][address_key] = memory["building_stats"][address_key]
+            counts[shard_id] = counts.get(shard_id, 0) + len(complaints)
+        for landlord_key, buildings in memory.get("landlords", {}).items():
+            shard = shards.setdefault(shard_for("landlord:" + landlord_key, num_shards), _new_shard())
+            shard["landlords"][landlord_key] = buildings
+            if landlord_key in memory.get("landlord_stats", {}):
+                shard["landlord_stats"][landlord_key] = memory["landlord_stats"][landlord_key]
+
+        for shard_id, shard in shards.items():
+            _write_json(self._shard_path(shard_id), shard)
+        with open(self.index_path, 'r+b') as f:
+            for shard_id, count in counts.items():
+                f.seek(self._slot_offset(shard_id))
+                f.write(SLOT.pack(1, count))
+        statistics = memory.get("statistics", {})
+        _write_json(self.meta_path, {
+            "total_complaints": statistics.get("total_complaints", 0),
+            "citywide": statistics.get("citywide") or community_stats.new_rollup()
+        })
+        print(f"✅ Migrated {sum(counts.values())} complaints into {len(shards)} shards")
+
+    def get_metrics(self) -> Dict:
+        with self.cache_lock:
+            metrics = dict(self.stats, cached_shards=len(self.cache))
+        metrics["num_shards"] = self.num_shards
+        return metrics
+
+
+# Quick check: fill a store, then time opening it again and paging in one building
+if __name__ == "__main__":
+    import tempfile
+
+    path = os.path.join(tempfile.mkdtemp(), "community_memory.shards")
+    store = ShardedMemoryStore(path, num_shards=64, cached_shards=8)
+    started = time.perf_counter()
+    with store.lock():
+        for i in range(2000):
+            store.add_complaint(f"{i % 1500} main st", f"landlord {i % 40}",
+                                ComplaintRecord(int(time.time()) - i * 600, "No heat", "heating_issues", f"Landlord {i % 40}"))
+    print(f"Stored 2000 complaints in {time.perf_counter() - started:.2f}s")
+
+    started = time.perf_counter()
+    reopened = ShardedMemoryStore(path)
+    print(f"Reopened in {(time.perf_counter() - started) * 1000:.2f}ms")
+    print(len(reopened.get_building_history("7 main st")), [r.day for r in reopened.recent("7 main st", limit=2)],
+          reopened.get_landlord("landlord 7")[1]["total"])
+    reopened.retention = 5 * 86400
+    reopened.compact_all()
+    print(reopened.get_statistics()["total_complaints"], reopened.get_metrics())
@@ -0,0 +1,216 @@
+# Memory Tool - Bulk import/export for Community Legal Memory
+#
+# Seeding memory through store_complaint() costs a shard rewrite per complaint.
+# This streams JSONL or CSV, validates and categorizes each row, and hands
+# complaints to the store in large batches - every touched shard is read and
+# written once per batch, so a million rows is one pass over the shards.
+#
+#   python memory_tool.py import complaints.jsonl
+#   python memory_tool.py import complaints.csv --memory-db community_memory.json
+#   python memory_tool.py export backup.jsonl
+#   python memory_tool.py export - --format csv > backup.csv
+#
+# Rows (JSONL objects or CSV columns): address, complaint, date, category, landlord
+# Only address and complaint are required. A missing date means "now" and a
+# missing or unknown category is worked out from the complaint text. A row the
+# building already has (same day, same text) is counted as a duplicate - also
+# when the stored one has been rolled up, so importing a file twice is safe.
+# Imported rows older than the retention period are kept in full (and can be
+# exported again) until their shard's next ordinary write or compact_all().
+# Exported addresses are the normalized (lowercased) keys memory is indexed by.
+#
+# Expect roughly 11-18k rows/s (a minute or two per million rows) - the time
+# goes into per-row parsing, categorizing and aggregate updates in Python.
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from collections import Counter
+from functools import lru_cache
+from typing import Callable, Dict, Iterator, Optional, Set, Tuple
+
+from memory_store import ShardedMemoryStore, shards_path
+from records import ComplaintRecord, parse_date
+
+FIELDS = ['address', 'complaint', 'date', 'category', 'landlord']
+
+DEFAULT_BATCH_SIZE = 250_000
+PROGRESS_EVERY = 100_000
+MAX_REPORTED_ERRORS = 10
+
+
+def detect_format(path: str, requested: str = None) -> str:
+    if requested:
+        return requested
+    return 'csv' if path.lower().endswith('.csv') else 'jsonl'
+
+
+def _open(path: str, mode: str):
+    if path == '-':
+        return sys.stdin if 'r' in mode else sys.stdout
+    return open(path, mode, newline='' if path.lower().endswith('.csv') else None, encoding='utf-8')
+
+
+def read_rows(f, file_format: str) -> Iterator[Tuple[int, Optional[Dict]]]:
+    """(line number, row) one at a time - row is None when the line isn't valid JSON"""
+    if file_format == 'csv':
+        reader = csv.DictReader(f)
+        for row in reader:
+            yield reader.line_num, row
+        return
+    for line_number, line in enumerate(f, 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except json.JSONDecodeError:
+            row = None
+        yield line_number, row if isinstance(row, dict) else None
+
+
+TEXT_FIELDS = ['address', 'complaint', 'category', 'landlord']
+
+
+def validate(row: Optional[Dict], now: int, summary: Counter, known_categories: Set[str],
+             classify: Callable) -> Tuple[Optional[Tuple], Optional[str]]:
+    """Row -> ((address_key, landlord_key, record), None) or (None, reason it was rejected)"""
+    if row is None:
+        return None, "not a JSON object"
+    for field in TEXT_FIELDS:
+        value = row.get(field)
+        if value is not None and not isinstance(value, str):
+            return None, f"{field} is not text ({value!r})"
+    address = (row.get('address') or '').strip()
+    complaint = (row.get('complaint') or '').strip()
+    if not address:
+        return None, "missing address"
+    if not complaint:
+        return None, "missing complaint"
+
+    if row.get('date'):
+        date = parse_date(row['date'])
+        if not date:
+            return None, f"bad date {row['date']!r}"
+    else:
+        date = now
+        summary["dated_now"] += 1
+
+    category = (row.get('category') or '').strip()
+    if category not in known_categories:
+        category = classify(complaint)[0]
+        summary["categorized"] += 1
+
+    landlord = (row.get('landlord') or '').strip() or None
+    record = ComplaintRecord(date, complaint[:150], category, landlord)  # same cap as store_complaint
+    return (address.lower(), landlord.lower() if landlord else None, record), None
+
+
+def import_file(store: ShardedMemoryStore, path: str, file_format: str = None,
+                batch_size: int = DEFAULT_BATCH_SIZE) -> Dict:
+    """Validate, categorize and store every row of a JSONL/CSV file, return the summary"""
+    # Imported here so export (which may be writing to stdout) doesn't load the agents
+    from workflow import CATEGORY_KEYWORDS, classify_complaint
+    known_categories = {category for category, _ in CATEGORY_KEYWORDS} | {'other_issues'}
+    # Bulk files repeat the same complaint texts a lot - categorize each one once
+    classify = lru_cache(maxsize=65536)(classify_complaint)
+
+    file_format = detect_format(path, file_format)
+    summary = Counter()
+    errors = []
+    batch = []
+    now = int(time.time())
+    started = time.perf_counter()
+
+    def flush():
+        with store.lock():
+            summary.update(store.add_complaints(batch, roll_up=False))
+        batch.clear()
+
+    with _open(path, 'r') as f:
+        for line_number, row in read_rows(f, file_format):
+            summary["rows"] += 1
+            item, reason = validate(row, now, summary, known_categories, classify)
+            if item is None:
+                summary["invalid"] += 1
+                if len(errors) < MAX_REPORTED_ERRORS:
+                    errors.append(f"line {line_number}: {reason}")
+            else:
+                batch.append(item)
+
+            if summary["rows"] % PROGRESS_EVERY == 0:
+                elapsed = time.perf_counter() - started
+                print(f"📥 Read {summary['rows']:,} rows ({summary['rows'] / elapsed:,.0f}/s)", file=sys.stderr)
+            if len(batch) >= batch_size:
+                flush()
+        if batch:
+            flush()
+
+    elapsed = time.perf_counter() - started
+    result = {field: summary[field] for field in
+              ("rows", "added", "duplicates", "invalid", "categorized", "dated_now", "past_retention", "shards_written")}
+    result["seconds"] = round(elapsed, 2)
+    result["rows_per_second"] = round(summary["rows"] / elapsed) if elapsed else 0
+    result["errors"] = errors
+    return result
+
+
+def export_file(store: ShardedMemoryStore, path: str, file_format: str = None) -> Dict:
+    """Stream every complaint held in full to JSONL/CSV (rolled-up counts aren't exported)"""
+    file_format = detect_format(path, file_format)
+    started = time.perf_counter()
+    count = 0
+
+    f = _open(path, 'w')
+    try:
+        writer = csv.DictWriter(f, fieldnames=FIELDS) if file_format == 'csv' else None
+        if writer:
+            writer.writeheader()
+        for address_key, record in store.iter_complaints():
+            row = dict(record.to_dict(), address=address_key)
+            if writer:
+                writer.writerow(row)
+            else:
+                f.write(json.dumps({field: row[field] for field in FIELDS}) + "\n")
+            count += 1
+            if count % PROGRESS_EVERY == 0:
+                print(f"📤 Wrote {count:,} complaints", file=sys.stderr)
+    finally:
+        if f is not sys.stdout:
+            f.close()
+
+    return {"complaints": count, "seconds": round(time.perf_counter() - started, 2)}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk import/export for Community Legal Memory")
+    parser.add_argument('command', choices=['import', 'export'])
+    parser.add_argument('path', help="JSONL or CSV file ('-' for stdin/stdout)")
+    parser.add_argument('--format', choices=['jsonl', 'csv'],
+                        help="File format (default: from the extension, jsonl otherwise)")
+    parser.add_argument('--memory-db', default="community_memory.json",
+                        help="Community memory to load into / export from (stored as <name>.shards/)")
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                        help="Rows held in memory before they're written to the shards")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    store = ShardedMemoryStore(shards_path(args.memory_db), legacy_path=args.memory_db)
+
+    if args.command == 'import':
+        if args.path != '-' and not os.path.exists(args.path):
+            sys.exit(f"❌ No such file: {args.path}")
+        summary = import_file(store, args.path, args.format, args.batch_size)
+        print(f"✅ Imported {summary['added']:,} of {summary['rows']:,} rows in {summary['seconds']}s "
+              f"({summary['duplicates']:,} duplicates, {summary['invalid']:,} invalid)", file=sys.stderr)
+    else:
+        summary = export_file(store, args.path, args.format)
+        print(f"✅ Exported {summary['complaints']:,} complaints in {summary['seconds']}s", file=sys.stderr)
+    print(json.dumps(summary, indent=2), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
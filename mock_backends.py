@@ -0,0 +1,215 @@
+# Mock Backends - Stand-in NVIDIA and NYC Open Data endpoints with tunable latency
+#
+# For load tests and demos without keys or network. Like traffic_recorder, this
+# patches ChatNVIDIA.invoke and requests.get for the whole process, but answers
+# are made up on the spot: analyses and letters from MockNVIDIAResponses, and a
+# few synthetic HPD violations per address. Each call sleeps for a latency
+# drawn around the configured mean, and can be made to fail at a given rate.
+#
+#   RIGHTSGUARD_MOCK_BACKENDS=1 RIGHTSGUARD_MOCK_LLM_MS=800 RIGHTSGUARD_MOCK_DATA_MS=150 python service.py
+import json
+import os
+import random
+import threading
+import time
+from typing import Dict
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+from agents.data_sources import find_source_by_url
+from agents.mock_responses import MockNVIDIAResponses
+from agents.prompt_templates import prompt_text
+
+VIOLATION_SAMPLES = [
+    ("HEAT", "B", "§ 27-2029 ADM CODE PROVIDE ADEQUATE SUPPLY OF HEAT"),
+    ("PESTS", "B", "§ 27-2018 ADM CODE ABATE THE NUISANCE CONSISTING OF ROACHES"),
+    ("MOLD", "B", "§ 27-2017.3 ADM CODE TRACE AND ERADICATE THE SOURCE OF THE MOLD CONDITION"),
+    ("PLUMBING", "B", "§ 27-2026 ADM CODE REPAIR THE LEAKY FAUCET"),
+    ("PAINT", "A", "§ 27-2013 ADM CODE PAINT WALLS AND CEILINGS WITH LIGHT COLORED PAINT"),
+    ("WINDOW GUARD", "C", "§ 27-2046.1 ADM CODE PROVIDE AND MAINTAIN WINDOW GUARDS")
+]
+
+
+def _sleep_around(mean_ms: float, jitter: float, timeout: float = None):
+    """
+    Sleep for roughly mean_ms (normally distributed, jitter is the relative spread)
+    Like an HTTP client, give up with an error after timeout seconds
+    """
+    if mean_ms > 0:
+        delay = max(0.0, random.gauss(mean_ms, mean_ms * jitter)) / 1000
+        if timeout is not None and delay > timeout:
+            time.sleep(timeout)
+            raise Exception(f"Mock read timed out after {timeout:.1f}s")
+        time.sleep(delay)
+
+
+def _estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+def mock_llm_content(prompt: str) -> str:
+    """What the model would have said to an analyzer, fused or letter prompt"""
+    if "JSON" in prompt:
+        analysis = dict(MockNVIDIAResponses.mock_analyzer_response(prompt, simulate_delay=False))
+        if '"letter"' in prompt:
+            analysis["letter"] = MockNVIDIAResponses.mock_letter_response(analysis, {}, simulate_delay=False)["letter_content"]
+        return json.dumps(analysis)
+    analysis = MockNVIDIAResponses.mock_analyzer_response(prompt, simulate_delay=False)
+    return MockNVIDIAResponses.mock_letter_response(analysis, {}, simulate_delay=False)["letter_content"]
+
+
+def mock_violations(params: Dict = None) -> list:
+    """A few HPD violations, the same ones every time for the same query"""
+    params = params or {}
+    rng = random.Random(str(params.get('$q')))
+    limit = int(params.get('$limit') or 5)
+    # One made-up building (borough, block, lot) per address
+    borough, block, lot = rng.randint(1, 5), rng.randint(1, 2000), rng.randint(1, 40)
+    rows = []
+    for i in range(rng.randint(0, limit)):
+        violation_type, violation_class, description = rng.choice(VIOLATION_SAMPLES)
+        rows.append({
+            "violationid": str(rng.randint(10_000_000, 19_999_999)),
+            "violationtype": violation_type,
+            "inspectiondate": f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}T00:00:00.000",
+            "class": violation_class,
+            "currentstatus": rng.choice(["OPEN", "CLOSE"]),
+            "novdescription": description,
+            "boroid": str(borough),
+            "block": str(block),
+            "lot": str(lot),
+            "bbl": str(borough * 1_000_000_000 + block * 10_000 + lot)
+        })
+    return rows
+
+
+class MockBackends:
+    """Patches ChatNVIDIA.invoke and requests.get with canned answers after a simulated delay"""
+
+    def __init__(self, llm_latency_ms: float = 800, data_latency_ms: float = 150,
+                 jitter: float = 0.25, error_rate: float = 0.0):
+        self.name = "MockBackends"
+        self.llm_latency_ms = llm_latency_ms
+        self.data_latency_ms = data_latency_ms
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.lock = threading.Lock()
+        self.seen_prefixes = set()
+        self.stats = {"llm_calls": 0, "data_calls": 0, "errors": 0}
+        self.originals = {}
+
+    def _count(self, key: str):
+        with self.lock:
+            self.stats[key] += 1
+
+    def _maybe_fail(self, what: str):
+        if self.error_rate and random.random() < self.error_rate:
+            self._count("errors")
+            raise Exception(f"Mock {what} error")
+
+    def invoke(self, llm, prompt):
+        from langchain_core.messages import AIMessage
+
+        self._count("llm_calls")
+        # Like a prefix-caching endpoint: a system message it has seen before is a cache read
+        system = prompt[0].content if not isinstance(prompt, str) and len(prompt) > 1 else None
+        with self.lock:
+            cached = system in self.seen_prefixes
+            if system is not None:
+                self.seen_prefixes.add(system)
+        prompt = prompt_text(prompt)
+        # The client's HTTP timeout (what the endpoint guard allowed), as ChatNVIDIA would use it
+        client = getattr(llm, "_client", None)
+        _sleep_around(self.llm_latency_ms, self.jitter, getattr(client, "timeout", None))
+        self._maybe_fail("NVIDIA")
+        content = mock_llm_content(prompt)
+        input_tokens, output_tokens = _estimate_tokens(prompt), _estimate_tokens(content)
+        return AIMessage(content=content, usage_metadata={
+            "input_tokens": input_tokens, "output_tokens": output_tokens, "total_tokens": input_tokens + output_tokens,
+            "input_token_details": {"cache_read": _estimate_tokens(system) if cached else 0}
+        })
+
+    def get(self, url, params=None):
+        self._count("data_calls")
+        _sleep_around(self.data_latency_ms, self.jitter)
+        self._maybe_fail("Open Data")
+        response = requests.Response()
+        response.status_code = 200
+        response.url = url
+        response.encoding = 'utf-8'
+        if url.endswith('.json'):
+            rows = mock_violations(params)
+            source = find_source_by_url(url)
+            if source is not None:
+                # In the source's own field names, so its projection has something to do
+                rows = [{source_field: row[field] for source_field, field in source.field_map.items() if field in row}
+                        for row in rows]
+            response.headers = CaseInsensitiveDict({"Content-Type": "application/json"})
+            response._content = json.dumps(rows).encode('utf-8')
+        else:
+            response.headers = CaseInsensitiveDict({"Content-Type": "text/html"})
+            response._content = b"<html><body><p>Landlords must give tenants notice before entry.</p></body></html>"
+        return response
+
+    def install(self):
+        """Patch ChatNVIDIA and requests for the whole process"""
+        from langchain_nvidia_ai_endpoints import ChatNVIDIA
+
+        backends = self
+        self.originals = {"invoke": ChatNVIDIA.invoke, "get": requests.get}
+        ChatNVIDIA.invoke = lambda llm, prompt, *args, **kwargs: backends.invoke(llm, prompt)
+        requests.get = lambda url, params=None, **kwargs: backends.get(url, params)
+        # The agents only build ChatNVIDIA clients when there's a key
+        os.environ.setdefault("NVIDIA_API_KEY", "mock")
+        print(f"🎭 Mock backends on (LLM ~{self.llm_latency_ms:.0f}ms, Open Data ~{self.data_latency_ms:.0f}ms, "
+              f"{self.error_rate:.0%} errors)")
+        return self
+
+    def uninstall(self):
+        from langchain_nvidia_ai_endpoints import ChatNVIDIA
+
+        if self.originals:
+            ChatNVIDIA.invoke = self.originals["invoke"]
+            requests.get = self.originals["get"]
+            self.originals = {}
+
+    def __enter__(self):
+        return self.install()
+
+    def __exit__(self, *exc):
+        self.uninstall()
+
+    def get_metrics(self) -> Dict:
+        with self.lock:
+            return dict(self.stats)
+
+
+# The mocks installed from the environment, if any (one per process)
+_active_backends = None
+_install_lock = threading.Lock()
+
+
+def install_from_env():
+    """Turn on the mock backends when RIGHTSGUARD_MOCK_BACKENDS is set"""
+    global _active_backends
+    if os.getenv("RIGHTSGUARD_MOCK_BACKENDS", "").lower() not in ("1", "true", "yes"):
+        return None
+    with _install_lock:
+        if _active_backends is None:
+            _active_backends = MockBackends(
+                float(os.getenv("RIGHTSGUARD_MOCK_LLM_MS", "800")),
+                float(os.getenv("RIGHTSGUARD_MOCK_DATA_MS", "150")),
+                error_rate=float(os.getenv("RIGHTSGUARD_MOCK_ERROR_RATE", "0"))
+            ).install()
+    return _active_backends
+
+
+# Quick check
+if __name__ == "__main__":
+    with MockBackends(llm_latency_ms=50, data_latency_ms=10) as backends:
+        from langchain_nvidia_ai_endpoints import ChatNVIDIA
+        print(ChatNVIDIA(model="meta/llama-3.1-70b-instruct", api_key="mock").invoke("No heat. Respond in JSON format").content)
+        print(requests.get("https://data.cityofnewyork.us/resource/wvxf-dwi5.json",
+                           params={"$q": "123 Main St", "$limit": 5}).json())
+        print(backends.get_metrics())
@@ -0,0 +1,331 @@
+# Neighborhood Stats - How a building's violations compare with its block and borough
+#
+# Built once from a local export of the HPD violations dataset (the same Open
+# Data dataset the scraper queries, downloaded as CSV). Every violation is
+# reduced to a few integer arrays - building (BBL), borough, block and
+# category - and per-building counts, block and borough rates and each
+# building's percentile within its borough are computed for all buildings in
+# one vectorized pass. The result is cached as an .npz next to the export, so
+# later starts just load the arrays and a request is a binary search plus a few
+# array reads - no scan over the violations.
+#
+#   python neighborhood_stats.py hpd_violations.csv     (build the cache ahead of time)
+#   RIGHTSGUARD_VIOLATIONS_FILE=hpd_violations.csv streamlit run app.py
+#
+# Only buildings with at least one violation are in the export, so percentiles
+# compare a building against other buildings that have had violations.
+import os
+import time
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+# Local HPD violations export (no file = no neighborhood comparisons)
+DEFAULT_VIOLATIONS_FILE = os.getenv("RIGHTSGUARD_VIOLATIONS_FILE", "hpd_violations.csv")
+
+# Bump when the cached arrays change shape or meaning (or the categorizer changes)
+INDEX_VERSION = 2
+
+BOROUGHS = {1: "Manhattan", 2: "Bronx", 3: "Brooklyn", 4: "Queens", 5: "Staten Island"}
+
+# Columns read from the export (Open Data CSV headers, lowercased)
+EXPORT_COLUMNS = ['boroid', 'block', 'lot', 'bbl', 'novdescription']
+
+READ_CHUNK_ROWS = 1_000_000
+
+# Percentile at or above which a building is called out
+NOTABLE_PERCENTILE = 75
+
+
+def cache_path(source_path: str) -> str:
+    return f"{source_path}.neighborhood.npz"
+
+
+def make_bbl(borough, block, lot):
+    """Borough-Block-Lot as the 10-digit number the dataset uses"""
+    return borough * 1_000_000_000 + block * 10_000 + lot
+
+
+def read_export(path: str, categories: List[str], classify: Callable[[str], str]) -> Dict[str, np.ndarray]:
+    """Stream the CSV in chunks and keep only integer arrays - descriptions are classified once each"""
+    category_codes = {category: code for code, category in enumerate(categories)}
+    description_codes = {}
+    parts = {"bbl": [], "borough": [], "block": [], "category": []}
+
+    chunks = pd.read_csv(path, usecols=lambda column: column.lower() in EXPORT_COLUMNS,
+                         chunksize=READ_CHUNK_ROWS, dtype=str)
+    for chunk in chunks:
+        chunk.columns = [column.lower() for column in chunk.columns]
+        borough = pd.to_numeric(chunk['boroid'], errors='coerce')
+        block = pd.to_numeric(chunk['block'], errors='coerce')
+        lot = pd.to_numeric(chunk['lot'], errors='coerce') if 'lot' in chunk else 0
+        bbl = pd.to_numeric(chunk['bbl'], errors='coerce') if 'bbl' in chunk else pd.Series(np.nan, index=chunk.index)
+        bbl = bbl.fillna(make_bbl(borough, block, lot))
+        keep = (borough.between(1, 5) & block.notna() & bbl.notna()).to_numpy()
+
+        # The same few thousand descriptions repeat across millions of rows
+        codes, descriptions = pd.factorize(chunk['novdescription'].fillna('').str.lower())
+        lookup = np.empty(len(descriptions) + 1, dtype=np.int8)
+        for i, description in enumerate(descriptions):
+            if description not in description_codes:
+                description_codes[description] = category_codes[classify(description)]
+            lookup[i] = description_codes[description]
+        lookup[-1] = category_codes["other_issues"]  # factorize gives -1 for missing
+
+        parts["bbl"].append(bbl.to_numpy()[keep].astype(np.int64))
+        parts["borough"].append(borough.to_numpy()[keep].astype(np.int8))
+        parts["block"].append(block.to_numpy()[keep].astype(np.int32))
+        parts["category"].append(lookup[codes][keep])
+
+    if not parts["bbl"]:
+        return {name: np.array([], dtype=np.int64) for name in parts}
+    return {name: np.concatenate(arrays) for name, arrays in parts.items()}
+
+
+def build_arrays(bbl: np.ndarray, borough: np.ndarray, block: np.ndarray, category: np.ndarray,
+                 categories: List[str]) -> Dict[str, np.ndarray]:
+    """Per-building counts, block/borough rates and borough percentiles from one row per violation"""
+    columns = len(categories) + 1  # every category plus the total
+
+    # Buildings, sorted by BBL so a lookup is a binary search
+    building_bbl, building_of_row = np.unique(bbl, return_inverse=True)
+    buildings = len(building_bbl)
+    counts = np.bincount(building_of_row * len(categories) + category,
+                         minlength=buildings * len(categories)).reshape(buildings, len(categories))
+    counts = np.hstack([counts, counts.sum(axis=1, keepdims=True)]).astype(np.int32)
+
+    # Borough and block of each building (every row of a building agrees)
+    first_row = np.zeros(buildings, dtype=np.int64)
+    first_row[building_of_row] = np.arange(len(bbl))
+    building_borough = borough[first_row]
+    building_block = building_borough.astype(np.int64) * 100_000 + block[first_row]
+
+    # Violations per building on each block and in each borough
+    block_keys, block_of_building = np.unique(building_block, return_inverse=True)
+    block_buildings = np.bincount(block_of_building, minlength=len(block_keys))
+    block_rates = np.zeros((len(block_keys), columns), dtype=np.float32)
+    np.add.at(block_rates, block_of_building, counts)
+    block_rates /= np.maximum(block_buildings, 1)[:, None]
+
+    borough_buildings = np.bincount(building_borough, minlength=len(BOROUGHS) + 1)
+    borough_rates = np.zeros((len(BOROUGHS) + 1, columns), dtype=np.float32)
+    np.add.at(borough_rates, building_borough, counts)
+    borough_rates /= np.maximum(borough_buildings, 1)[:, None]
+
+    # Each column sorted within each borough - a percentile is a searchsorted in one segment
+    order = np.argsort(building_borough, kind='stable')
+    borough_offsets = np.searchsorted(building_borough[order], np.arange(len(BOROUGHS) + 2))
+    borough_sorted = counts[order]
+    percentiles = np.zeros_like(counts, dtype=np.uint8)
+    for borough_id in BOROUGHS:
+        start, end = borough_offsets[borough_id], borough_offsets[borough_id + 1]
+        if start == end:
+            continue
+        segment = np.sort(borough_sorted[start:end], axis=0)
+        borough_sorted[start:end] = segment
+        members = order[start:end]
+        for column in range(columns):
+            # Share of the borough's buildings with fewer violations of this kind
+            below = np.searchsorted(segment[:, column], counts[members, column], side='left')
+            percentiles[members, column] = below * 100 // (end - start)
+
+    return {
+        "categories": np.array(categories + ["total"]),
+        "bbl": building_bbl,
+        "borough": building_borough,
+        "block": building_block,
+        "counts": counts,
+        "percentiles": percentiles,
+        "block_keys": block_keys,
+        "block_buildings": block_buildings,
+        "block_rates": block_rates,
+        "borough_buildings": borough_buildings,
+        "borough_rates": borough_rates,
+        "borough_offsets": borough_offsets,
+        "borough_sorted": borough_sorted
+    }
+
+
+class NeighborhoodIndex:
+    """Precomputed violation counts, rates and percentiles for every building in the export"""
+
+    def __init__(self, arrays: Dict[str, np.ndarray], classify: Callable[[str], str]):
+        self.name = "NeighborhoodIndex"
+        self.arrays = arrays
+        self.categories = [str(category) for category in arrays["categories"]]
+        self.classify = classify
+
+    @classmethod
+    def build(cls, source_path: str, categories: List[str], classify: Callable[[str], str],
+              use_cache: bool = True) -> 'NeighborhoodIndex':
+        """Load the cached arrays for an export, rebuilding them if the export changed"""
+        stat = os.stat(source_path)
+        fingerprint = np.array([INDEX_VERSION, stat.st_size, int(stat.st_mtime)], dtype=np.int64)
+        cached = cache_path(source_path)
+        if use_cache and os.path.exists(cached):
+            with np.load(cached) as saved:
+                arrays = {name: saved[name] for name in saved.files}
+            if (np.array_equal(arrays["fingerprint"], fingerprint)
+                    and [str(c) for c in arrays["categories"]] == categories + ["total"]):
+                print(f"🗺️ Neighborhood stats loaded for {len(arrays['bbl']):,} buildings")
+                return cls(arrays, classify)
+
+        started = time.perf_counter()
+        rows = read_export(source_path, categories, classify)
+        arrays = build_arrays(rows["bbl"], rows["borough"], rows["block"], rows["category"], categories)
+        arrays["fingerprint"] = fingerprint
+        if use_cache:
+            with open(cached, 'wb') as f:
+                np.savez(f, **arrays)
+        print(f"🗺️ Neighborhood stats built from {len(rows['bbl']):,} violations "
+              f"({len(arrays['bbl']):,} buildings) in {time.perf_counter() - started:.1f}s")
+        return cls(arrays, classify)
+
+    def find_building(self, bbl: int) -> Optional[int]:
+        bbls = self.arrays["bbl"]
+        index = int(np.searchsorted(bbls, bbl))
+        return index if index < len(bbls) and bbls[index] == bbl else None
+
+    def enrich(self, violations: List) -> Optional[Dict]:
+        """Block and borough comparison for the building these violation rows belong to"""
+        # The address search is full-text, so its hits can come from more than one
+        # building - only compare when they all share one BBL
+        places = {place for place in (_row_place(row) for row in violations) if place}
+        if len(places) != 1:
+            return None
+        borough, block, bbl = places.pop()
+
+        building = self.find_building(bbl)
+        if building is not None:
+            counts = self.arrays["counts"][building]
+            percentiles = [int(p) for p in self.arrays["percentiles"][building]]
+        else:
+            # Not in the export - the few rows we fetched are a sample, not the building's
+            # counts, so don't rank them against whole buildings
+            counts = np.zeros(len(self.categories), dtype=np.int32)
+            for row in violations:
+                counts[self.categories.index(self.classify((row.get('novdescription') or '').lower()))] += 1
+            counts[-1] = len(violations)
+            percentiles = [None] * len(self.categories)
+
+        block_key = borough * 100_000 + block
+        block_index = int(np.searchsorted(self.arrays["block_keys"], block_key))
+        on_block = block_index < len(self.arrays["block_keys"]) and self.arrays["block_keys"][block_index] == block_key
+        block_rates = self.arrays["block_rates"][block_index] if on_block else None
+        borough_rates = self.arrays["borough_rates"][borough]
+
+        return {
+            "bbl": str(bbl),
+            "borough": BOROUGHS[borough],
+            "block": block,
+            "in_export": building is not None,
+            "low_confidence": building is None,
+            "borough_buildings": int(self.arrays["borough_buildings"][borough]),
+            "block_buildings": int(self.arrays["block_buildings"][block_index]) if on_block else 0,
+            "categories": {
+                category: {
+                    "count": int(counts[column]),
+                    "borough_percentile": percentiles[column],
+                    "block_rate": round(float(block_rates[column]), 2) if on_block else None,
+                    "borough_rate": round(float(borough_rates[column]), 2)
+                }
+                for column, category in enumerate(self.categories)
+            }
+        }
+
+
+def _row_place(row) -> Optional[tuple]:
+    """(borough, block, bbl) of a violation row, or None if the row doesn't say"""
+    try:
+        borough = int(row.get('boroid'))
+        block = int(row.get('block'))
+        bbl = int(row.get('bbl') or make_bbl(borough, block, int(row.get('lot', 0))))
+    except (TypeError, ValueError):
+        return None
+    return (borough, block, bbl) if borough in BOROUGHS else None
+
+
+def load_index(categories: List[str], classify: Callable[[str], str],
+               source_path: str = DEFAULT_VIOLATIONS_FILE) -> Optional[NeighborhoodIndex]:
+    """The index for the local export, or None if there isn't one"""
+    if not source_path or not os.path.exists(source_path):
+        print(f"ℹ️ No violations export at {source_path} - neighborhood comparisons are off")
+        return None
+    try:
+        return NeighborhoodIndex.build(source_path, categories, classify)
+    except Exception as e:
+        print(f"⚠️ Could not load neighborhood stats from {source_path}: {e}")
+        return None
+
+
+def _ordinal(n: int) -> str:
+    suffix = "th" if 10 <= n % 100 <= 20 else {1: "st", 2: "nd", 3: "rd"}.get(n % 10, "th")
+    return f"{n}{suffix}"
+
+
+def neighborhood_headline(neighborhood: Dict, category: str = None) -> Optional[str]:
+    """'This building is in the 95th percentile of Brooklyn buildings for heating violations' (or None)"""
+    if not neighborhood or neighborhood.get("low_confidence"):
+        return None
+    categories = neighborhood["categories"]
+    # The complaint's own category if it stands out, otherwise all violations together
+    for key in ([category] if category in categories and category != "other_issues" else []) + ["total"]:
+        stats = categories[key]
+        if stats["count"] and (stats["borough_percentile"] or 0) >= NOTABLE_PERCENTILE:
+            kind = "" if key == "total" else f"{key.split('_')[0]} "
+            return (f"This building is in the {_ordinal(stats['borough_percentile'])} percentile of "
+                    f"{neighborhood['borough']} buildings for {kind}violations "
+                    f"({stats['count']} vs {stats['borough_rate']:.1f} per building in the borough)")
+    return None
+
+
+# Quick check with a synthetic export
+if __name__ == "__main__":
+    import sys
+    import tempfile
+
+    from workflow import CATEGORY_KEYWORDS, classify_violation
+
+    categories = [category for category, _ in CATEGORY_KEYWORDS] + ["other_issues"]
+    if len(sys.argv) > 1:
+        NeighborhoodIndex.build(sys.argv[1], categories, classify_violation)
+        sys.exit(0)
+
+    rng = np.random.default_rng(7)
+    rows = 500_000
+    descriptions = np.array(["§ 27-2029 ADM CODE PROVIDE ADEQUATE SUPPLY OF HEAT",
+                             "§ 27-2018 ADM CODE ABATE THE NUISANCE CONSISTING OF ROACHES",
+                             "§ 27-2017.3 ADM CODE TRACE AND ERADICATE THE SOURCE OF THE MOLD CONDITION",
+                             "§ 27-2005 ADM CODE REPAIR THE BROKEN OR DEFECTIVE PLASTERED SURFACES",
+                             "§ 27-2013 ADM CODE PAINT WALLS AND CEILINGS WITH LIGHT COLORED PAINT"])
+    boroughs = rng.integers(1, 6, rows)
+    blocks = rng.integers(1, 2000, rows)
+    lots = rng.integers(1, 40, rows)
+    export = pd.DataFrame({"BoroID": boroughs, "Block": blocks, "Lot": lots,
+                           "BBL": make_bbl(boroughs, blocks, lots),
+                           "NOVDescription": descriptions[rng.integers(0, len(descriptions), rows)]})
+    path = os.path.join(tempfile.mkdtemp(), "hpd_violations.csv")
+    export.to_csv(path, index=False)
+
+    index = NeighborhoodIndex.build(path, categories, classify_violation)
+    started = time.perf_counter()
+    index = NeighborhoodIndex.build(path, categories, classify_violation)
+    print(f"Cached load: {(time.perf_counter() - started) * 1000:.1f}ms")
+
+    # The building with the most heat violations should stand out
+    bbl = int(index.arrays["bbl"][np.argmax(index.arrays["counts"][:, 0])])
+    building = {"boroid": str(bbl // 1_000_000_000), "block": str(bbl // 10_000 % 100_000), "bbl": str(bbl)}
+    started = time.perf_counter()
+    for _ in range(10_000):
+        neighborhood = index.enrich([building])
+    print(f"Lookup: {(time.perf_counter() - started) * 100:.1f}µs")
+    print(neighborhood["categories"]["heating_issues"], neighborhood["categories"]["total"])
+    print(neighborhood_headline(neighborhood, "heating_issues"))
+
+    # Hits from two buildings can't be told apart; a building outside the export gets no percentile
+    other = {"boroid": building["boroid"], "block": building["block"], "bbl": str(bbl + 1)}
+    print("Two buildings:", index.enrich([building, other]))
+    missing = index.enrich([{"boroid": "1", "block": "99999", "lot": "1",
+                             "novdescription": "provide adequate supply of heat"}])
+    print("Not in export:", missing["categories"]["heating_issues"], neighborhood_headline(missing, "heating_issues"))
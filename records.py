@@ -0,0 +1,264 @@
+# Records - Compact types for complaints and violations held in memory
+#
+# Community memory can hold millions of complaints, and every run carries its
+# building's violations around. As dicts each one repeats its keys and keeps
+# every Socrata field; these slotted records keep only what we read, store
+# dates as epoch seconds and share one copy of each category/landlord string.
+# JSON on disk and everything handed to the UI stay plain dicts - convert with
+# from_dict()/to_dict() (or json_default) at those boundaries.
+import hashlib
+import sys
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional
+
+
+def _intern(value: Optional[str]) -> Optional[str]:
+    return sys.intern(value) if value else value
+
+
+def parse_date(value) -> int:
+    """ISO date/datetime string (or epoch number) -> epoch seconds"""
+    if isinstance(value, (int, float)):
+        return int(value)
+    try:
+        return int(datetime.fromisoformat(value).timestamp())
+    except (TypeError, ValueError):
+        return 0
+
+
+def format_date(epoch: int) -> str:
+    return datetime.fromtimestamp(epoch).isoformat() if epoch else ""
+
+
+class ComplaintRecord:
+    """One complaint in community memory"""
+
+    __slots__ = ('date', 'complaint', 'category', 'landlord')
+
+    def __init__(self, date: int, complaint: str, category: str, landlord: str = None):
+        self.date = date  # epoch seconds
+        self.complaint = complaint
+        self.category = _intern(category)
+        self.landlord = _intern(landlord)
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'ComplaintRecord':
+        return cls(parse_date(data.get('date')), data.get('complaint', ''),
+                   data.get('category', 'other_issues'), data.get('landlord'))
+
+    def to_dict(self) -> Dict:
+        return {"date": format_date(self.date), "complaint": self.complaint,
+                "category": self.category, "landlord": self.landlord}
+
+    @property
+    def day(self) -> str:
+        """YYYY-MM-DD the complaint was filed"""
+        return format_date(self.date)[:10]
+
+    def get(self, field: str, default: Any = None) -> Any:
+        """Read a field the way the old dict did (date as an ISO string)"""
+        value = format_date(self.date) if field == 'date' else getattr(self, field, None)
+        return default if value is None else value
+
+
+def month_of(epoch: int) -> str:
+    """Bucket key for a complaint date, e.g. '2024-01'"""
+    return format_date(epoch)[:7] or "0000-00"
+
+
+def complaint_key(day: str, complaint: str) -> str:
+    """Short fingerprint of a complaint (same day, same text) - kept after the complaint is rolled up"""
+    return hashlib.blake2b(f"{day}|{complaint}".encode('utf-8'), digest_size=6).hexdigest()
+
+
+class BuildingHistory:
+    """
+    A building's complaints in monthly buckets, plus counts (and fingerprints,
+    so a re-import can still spot them) for complaints that were rolled up
+    after the retention period
+    """
+
+    __slots__ = ('buckets', 'archived')
+
+    def __init__(self, buckets: Dict[str, List[ComplaintRecord]] = None, archived: Dict = None):
+        self.buckets = buckets or {}  # 'YYYY-MM' -> complaints, oldest first
+        self.archived = archived or {"total": 0, "categories": {}, "through": None, "keys": []}
+
+    @classmethod
+    def from_dict(cls, data) -> 'BuildingHistory':
+        """Accepts the bucketed format or an old flat list of complaint dicts"""
+        history = cls()
+        if isinstance(data, list):
+            for complaint in data:
+                history.add(ComplaintRecord.from_dict(complaint))
+            return history
+        for month, complaints in data.get("buckets", {}).items():
+            history.buckets[month] = [ComplaintRecord.from_dict(complaint) for complaint in complaints]
+        history.archived = data.get("archived") or history.archived
+        history.archived.setdefault("keys", [])  # rolled up before fingerprints were kept
+        return history
+
+    def to_dict(self) -> Dict:
+        return {"buckets": {month: [record.to_dict() for record in records]
+                            for month, records in sorted(self.buckets.items())},
+                "archived": self.archived}
+
+    def copy(self) -> 'BuildingHistory':
+        """A copy a writer can change without touching this one (records are shared, never changed)"""
+        archived = dict(self.archived, categories=dict(self.archived["categories"]),
+                        keys=list(self.archived["keys"]))
+        return BuildingHistory({month: list(records) for month, records in self.buckets.items()}, archived)
+
+    def add(self, record: ComplaintRecord):
+        bucket = self.buckets.setdefault(month_of(record.date), [])
+        bucket.append(record)
+        if len(bucket) > 1 and bucket[-2].date > record.date:
+            bucket.sort(key=lambda complaint: complaint.date)
+
+    def recent(self, since: int = None, limit: int = None) -> List[ComplaintRecord]:
+        """
+        Newest complaints (at or after since, at most limit), oldest first.
+        Only the buckets that can hold them are touched.
+        """
+        since_month = month_of(since) if since else None
+        picked = []
+        for month in sorted(self.buckets, reverse=True):
+            if since_month and month < since_month:
+                break
+            for record in reversed(self.buckets[month]):
+                if since and record.date < since:
+                    break
+                picked.append(record)
+                if limit is not None and len(picked) >= limit:
+                    return picked[::-1]
+        return picked[::-1]
+
+    def keys(self) -> set:
+        """Fingerprints of every complaint the building has had, rolled up or not"""
+        keys = set(self.archived["keys"])
+        for records in self.buckets.values():
+            keys.update(complaint_key(record.day, record.complaint) for record in records)
+        return keys
+
+    def __len__(self) -> int:
+        """Complaints still held in full (not rolled up)"""
+        return sum(len(records) for records in self.buckets.values())
+
+    def needs_compact(self, cutoff: int) -> bool:
+        """Whether any bucket may hold complaints older than cutoff"""
+        return bool(self.buckets) and min(self.buckets) <= month_of(cutoff)
+
+    def compact(self, cutoff: int) -> int:
+        """Roll complaints older than cutoff up into per-category counts, return how many"""
+        cutoff_month = month_of(cutoff)
+        rolled = 0
+        for month in [month for month in self.buckets if month <= cutoff_month]:
+            keep = []
+            for record in self.buckets[month]:
+                if record.date >= cutoff:
+                    keep.append(record)
+                    continue
+                categories = self.archived["categories"]
+                categories[record.category] = categories.get(record.category, 0) + 1
+                self.archived["total"] += 1
+                self.archived["through"] = max(self.archived["through"] or "", record.day)
+                self.archived["keys"].append(complaint_key(record.day, record.complaint))
+                rolled += 1
+            if keep:
+                self.buckets[month] = keep
+            else:
+                del self.buckets[month]
+        return rolled
+
+
+# The Socrata violation fields anything reads (prompt builder and violation table)
+# Socrata name -> attribute ("class" is a keyword)
+VIOLATION_FIELDS = {
+    'violationid': 'violation_id',
+    'violationtype': 'violation_type',
+    'inspectiondate': 'inspection_date',
+    'class': 'violation_class',
+    'currentstatus': 'current_status',
+    'novdescription': 'description',
+    # Where the building is - for the block/borough comparison in neighborhood_stats
+    'boroid': 'borough_id',
+    'block': 'block',
+    'lot': 'lot',
+    'bbl': 'bbl'
+}
+
+
+class ViolationRecord:
+    """One HPD violation, projected to the fields we use"""
+
+    __slots__ = tuple(VIOLATION_FIELDS.values())
+
+    def __init__(self, **fields):
+        for attribute in self.__slots__:
+            setattr(self, attribute, fields.get(attribute))
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'ViolationRecord':
+        record = cls()
+        for field, attribute in VIOLATION_FIELDS.items():
+            value = data.get(field)
+            if value is not None:
+                # Types, classes and statuses repeat across thousands of rows
+                setattr(record, attribute, _intern(value) if field in ('violationtype', 'class', 'currentstatus') else value)
+        return record
+
+    def to_dict(self) -> Dict:
+        """Socrata-shaped dict with only the fields that were present"""
+        data = {}
+        for field, attribute in VIOLATION_FIELDS.items():
+            value = getattr(self, attribute)
+            if value is not None:
+                data[field] = value
+        return data
+
+    def get(self, field: str, default: Any = None) -> Any:
+        """Read a field by its Socrata name, like the raw row"""
+        attribute = VIOLATION_FIELDS.get(field)
+        value = getattr(self, attribute) if attribute else None
+        return default if value is None else value
+
+    def __contains__(self, field: str) -> bool:
+        return self.get(field) is not None
+
+
+def to_dicts(items: Iterable) -> List[Dict]:
+    """Records (or dicts already) -> plain dicts for JSON and the UI"""
+    return [item.to_dict() if hasattr(item, 'to_dict') else item for item in items or []]
+
+
+def json_default(obj: Any) -> Any:
+    """json.dump(default=...) hook so records serialize as their dicts"""
+    if hasattr(obj, 'to_dict'):
+        return obj.to_dict()
+    return str(obj)
+
+
+# Quick check: memory for 200k complaints as dicts vs records
+if __name__ == "__main__":
+    import tracemalloc
+
+    categories = ['heating_issues', 'pest_issues', 'water_issues', 'mold_issues']
+
+    def build(as_records: bool):
+        tracemalloc.start()
+        items = []
+        for i in range(200_000):
+            data = {"date": datetime(2024, 1, 1 + i % 28, 12, i % 60).isoformat(),
+                    "complaint": "No heat in the apartment since Monday",
+                    "category": ''.join(categories[i % 4]),  # fresh string like json.load gives
+                    "landlord": ''.join("abc property management")}
+            items.append(ComplaintRecord.from_dict(data) if as_records else data)
+        size, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return items, size
+
+    _, dict_bytes = build(False)
+    records, record_bytes = build(True)
+    print(f"dicts:   {dict_bytes / 200_000:.0f} bytes per complaint")
+    print(f"records: {record_bytes / 200_000:.0f} bytes per complaint ({dict_bytes / record_bytes:.1f}x smaller)")
+    print(records[0].to_dict(), records[0].day)
@@ -0,0 +1,192 @@
+# Result View - Pre-formats everything the UI shows for a workflow result
+#
+# Streamlit re-runs the whole script on every widget interaction. Building
+# the markdown/HTML fragments here once per result (and caching them by the
+# result's hash in app.py) means those reruns only have to emit them again.
+import hashlib
+import json
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from neighborhood_stats import neighborhood_headline
+
+# Display names for complaint categories
+CATEGORY_NAMES = {
+    'heating_issues': '🔥 Heating',
+    'mold_issues': '🦠 Mold',
+    'water_issues': '💧 Water/Leaks',
+    'pest_issues': '🐛 Pests',
+    'privacy_violations': '🔒 Privacy',
+    'maintenance_issues': '🔧 Maintenance',
+    'other_issues': '❓ Other'
+}
+
+CATEGORY_EMOJI = {category: name.split(' ')[0] for category, name in CATEGORY_NAMES.items()}
+
+RISK_COLORS = {"HIGH": "🔴", "MODERATE": "🟡", "LOW": "🟢"}
+
+NEW_BUILDING_HTML = """
+<div class="community-insight">
+    <h4>🟢 New Building</h4>
+    <p>No previous complaints found for this address.</p>
+    <p>Your complaint will help future tenants at this location.</p>
+</div>
+"""
+
+
+def result_hash(result: Dict) -> str:
+    """Stable fingerprint of a result, used as the render cache key"""
+    encoded = json.dumps(result, sort_keys=True, default=str).encode('utf-8')
+    return hashlib.sha256(encoded).hexdigest()[:16]
+
+
+def category_label(category: str) -> str:
+    return CATEGORY_NAMES.get(category, category.replace('_', ' ').title())
+
+
+def build_neighborhood_view(neighborhood: Dict) -> Optional[Dict]:
+    """Headline and block/borough comparison lines from the precomputed neighborhood stats"""
+    if not neighborhood:
+        return None
+
+    category = neighborhood.get('complaint_category')
+    keys = ([category] if category in neighborhood['categories'] and category != 'other_issues' else []) + ['total']
+    lines = []
+    for key in keys:
+        stats = neighborhood['categories'][key]
+        label = "🏚️ All violations" if key == 'total' else category_label(key)
+        block_rate = f" · {stats['block_rate']:.1f} per building on the block" if stats['block_rate'] is not None else ""
+        percentile = (f" ({stats['borough_percentile']}th percentile)"
+                      if stats['borough_percentile'] is not None else "")
+        lines.append(f"- {label}: **{stats['count']}** here{block_rate} · "
+                     f"{stats['borough_rate']:.1f} across {neighborhood['borough']}{percentile}")
+
+    caption = (f"{neighborhood['borough']} block {neighborhood['block']} · compared with "
+               f"{neighborhood['borough_buildings']:,} {neighborhood['borough']} buildings with HPD violations")
+    if neighborhood.get('low_confidence'):
+        caption += " · this building isn't in the export, so its counts are only the violations we fetched"
+    return {
+        "headline": neighborhood_headline(neighborhood, category),
+        "lines": "\n".join(lines),
+        "caption": caption
+    }
+
+
+def build_community_view(building_history: List[Dict], total_complaints: int, stats: Dict = None) -> Dict:
+    """Risk box, category metrics and recent complaint lines for a building"""
+    neighborhood = build_neighborhood_view((stats or {}).get('neighborhood'))
+    if not building_history:
+        return {"html": NEW_BUILDING_HTML, "categories": [], "recent": [], "neighborhood": neighborhood}
+
+    # Precomputed aggregates from the workflow (older results don't have them)
+    building_stats = (stats or {}).get('building')
+    if building_stats:
+        risk_level = building_stats['risk_level']
+        complaint_categories = building_stats['categories']
+        previous_complaints = building_stats['total']
+        recent_activity = f" ({building_stats['last_90_days']} in the last 90 days)"
+    else:
+        risk_level = "HIGH" if len(building_history) >= 3 else "MODERATE" if len(building_history) >= 2 else "LOW"
+        complaint_categories = {}
+        for complaint in building_history:
+            category = complaint.get('category', 'other_issues')
+            complaint_categories[category] = complaint_categories.get(category, 0) + 1
+        previous_complaints = len(building_history)
+        recent_activity = ""
+
+    html = f"""
+    <div class="community-insight">
+        <h4>{RISK_COLORS[risk_level]} Building Risk Level: {risk_level}</h4>
+        <p><strong>Previous Complaints:</strong> {previous_complaints}{recent_activity}</p>
+        <p><strong>Community Database:</strong> {total_complaints} total complaints tracked</p>
+    </div>
+    """
+
+    # The two most recent previous complaints (the history is from before the user's own was stored)
+    recent = []
+    for complaint in building_history[-2:]:
+        date = complaint.get('date', 'Unknown date')
+        issue = complaint.get('complaint', 'No details')
+        emoji = CATEGORY_EMOJI.get(complaint.get('category', 'other_issues'), '❓')
+        recent.append(f"{emoji} **{date[:10]}:** {issue[:80]}...")
+
+    return {
+        "html": html,
+        "categories": [(category_label(category), count) for category, count in complaint_categories.items()],
+        "recent": recent,
+        "neighborhood": neighborhood
+    }
+
+
+def build_landlord_view(landlord_stats: Dict) -> Dict:
+    """Risk box and top issues across every building the landlord owns"""
+    if not landlord_stats:
+        return None
+
+    risk_level = landlord_stats['risk_level']
+    html = f"""
+    <div class="community-insight">
+        <h4>{RISK_COLORS[risk_level]} Landlord Risk Level: {risk_level}</h4>
+        <p><strong>{landlord_stats['landlord']}:</strong> {landlord_stats['total']} complaints across {landlord_stats['buildings']} buildings</p>
+        <p><strong>Recent Activity:</strong> {landlord_stats['last_30_days']} in the last 30 days, {landlord_stats['last_90_days']} in the last 90 days</p>
+    </div>
+    """
+    top_categories = sorted(landlord_stats['categories'].items(), key=lambda item: -item[1])[:4]
+    return {
+        "html": html,
+        "categories": [(category_label(category), count) for category, count in top_categories]
+    }
+
+
+def build_analysis_markdown(analysis: Dict) -> str:
+    """The AI analysis section as one markdown block"""
+    if 'is_legitimate' not in analysis:
+        # Fallback to raw analysis text
+        return analysis.get('analysis', 'No analysis available')
+
+    legitimacy = analysis.get('is_legitimate', 'Unknown')
+    case_strength = analysis.get('case_strength', 'Unknown')
+    status_color = "🟢" if legitimacy == "Yes" else "🔴" if legitimacy == "No" else "🟡"
+    strength_color = {"Strong": "🟢", "Moderate": "🟡", "Weak": "🔴"}.get(case_strength, "⚪")
+
+    lines = [
+        f"**{status_color} Complaint Status:** {legitimacy}",
+        "",
+        f"**{strength_color} Case Strength:** {case_strength}"
+    ]
+    sections = [
+        ('applicable_laws', "**📜 Applicable Laws:**"),
+        ('evidence_needed', "**📋 Evidence to Collect:**"),
+        ('recommended_actions', "**⚡ Recommended Actions:**")
+    ]
+    for field, heading in sections:
+        if analysis.get(field):
+            lines += ["", heading, ""]
+            lines += [f"- {item}" for item in analysis[field]]
+
+    return "\n".join(lines)
+
+
+def build_partial_view(partial: Dict) -> Dict:
+    """Fragments for the research results shown while the AI stages run"""
+    stats = partial.get('stats') or {}
+    return {
+        "community": build_community_view(partial['building_history'], partial['total_community_complaints'], stats),
+        "landlord": build_landlord_view(stats.get('landlord'))
+    }
+
+
+def build_result_view(result: Dict) -> Dict:
+    """Every formatted fragment for a finished result, plus the download payload"""
+    insights = result['community_insights']
+    stats = insights.get('stats') or {}
+    letter_content = result['letter']['letter_content']
+
+    return {
+        "community": build_community_view(insights['building_history'], insights['total_community_complaints'], stats),
+        "landlord": build_landlord_view(stats.get('landlord')),
+        "analysis_markdown": build_analysis_markdown(result['analysis']),
+        "letter": letter_content,
+        "download_data": letter_content.encode('utf-8'),
+        "download_name": f"complaint_letter_{datetime.now().strftime('%Y%m%d')}.txt"
+    }
@@ -0,0 +1,230 @@
+# Run Profiler - Opt-in sampling profiler for workflow runs
+#
+# While a graph node runs, a background thread looks at that node's stack
+# every few milliseconds (sys._current_frames, nothing is traced). Each node's
+# CPU time comes from time.thread_time(), so wall time minus CPU time is time
+# spent waiting on NVIDIA, Socrata or locks. Work a node hands to a helper
+# thread (EndpointGuard runs each LLM call on one) is followed too: a thread
+# whose profile_parent is the node's thread is sampled under the node's stack,
+# and the cpu_seconds it sets when it finishes counts as the node's CPU.
+# Every profiled run writes:
+#   profiles/<run_id>.collapsed         collapsed stacks (flamegraph.pl, speedscope, inferno)
+#   profiles/<run_id>.speedscope.json   one sampled profile per node for speedscope.app
+#   profiles/<run_id>.summary.json      wall / cpu / wait seconds per node
+#
+# Runs that aren't profiled pay nothing, so production can profile a small
+# sample with RIGHTSGUARD_PROFILE_RATE=0.01.
+import json
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+PROFILE_RATE = float(os.getenv("RIGHTSGUARD_PROFILE_RATE", "0"))
+PROFILE_DIR = os.getenv("RIGHTSGUARD_PROFILE_DIR", "profiles")
+SAMPLE_INTERVAL = float(os.getenv("RIGHTSGUARD_PROFILE_INTERVAL_MS", "5")) / 1000
+
+
+def frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _stack(frame) -> tuple:
+    """Frame labels from the root of the thread down to frame"""
+    stack = []
+    while frame is not None:
+        stack.append(frame_label(frame))
+        frame = frame.f_back
+    return tuple(reversed(stack))
+
+
+class _NodeSampler:
+    """Samples one thread's stack until stopped"""
+
+    def __init__(self, thread_id: int, interval: float):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()  # tuple of frame labels (root first) -> sample count
+        self.helpers = set()  # threads doing work for this one (profile_parent)
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self.run, name="RunProfilerSampler", daemon=True)
+
+    def run(self):
+        while not self.stop_event.wait(self.interval):
+            self.sample()
+
+    def sample(self):
+        for thread in threading.enumerate():
+            if getattr(thread, "profile_parent", None) == self.thread_id:
+                self.helpers.add(thread)
+        frames = sys._current_frames()
+        stack = _stack(frames.get(self.thread_id))
+        # While a helper works for the node, the node thread is just waiting on it
+        helper_stacks = [helper_stack for helper_stack in (_stack(frames.get(thread.ident)) for thread in self.helpers)
+                         if helper_stack]
+        for helper_stack in helper_stacks or [()]:
+            if stack + helper_stack:
+                self.stacks[stack + helper_stack] += 1
+
+    def helper_cpu(self) -> float:
+        """CPU seconds of the helper threads that finished"""
+        return sum(getattr(thread, "cpu_seconds", 0.0) for thread in self.helpers)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        self.thread.join()
+
+
+class RunProfiler:
+    """Profiles the nodes of one workflow run and writes the results"""
+
+    def __init__(self, run_id: str = None, interval: float = SAMPLE_INTERVAL, output_dir: str = PROFILE_DIR):
+        self.name = "RunProfiler"
+        self.run_id = run_id or f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        self.interval = interval
+        self.output_dir = output_dir
+        self.nodes = {}  # node -> {"wall", "cpu", "stacks"}
+        self.order: List[str] = []
+
+    @contextmanager
+    def node(self, node_name: str):
+        """Sample the current thread while one node runs"""
+        sampler = _NodeSampler(threading.get_ident(), self.interval)
+        wall_started = time.perf_counter()
+        cpu_started = time.thread_time()
+        sampler.start()
+        try:
+            yield
+        finally:
+            cpu = time.thread_time() - cpu_started
+            wall = time.perf_counter() - wall_started
+            sampler.stop()
+            cpu += sampler.helper_cpu()
+            self.nodes[node_name] = {"wall": wall, "cpu": cpu, "stacks": sampler.stacks}
+            self.order.append(node_name)
+
+    def summary(self) -> Dict:
+        nodes = {}
+        for node_name in self.order:
+            data = self.nodes[node_name]
+            nodes[node_name] = {
+                "wall_seconds": round(data["wall"], 4),
+                "cpu_seconds": round(data["cpu"], 4),
+                "wait_seconds": round(max(0.0, data["wall"] - data["cpu"]), 4),
+                "samples": sum(data["stacks"].values())
+            }
+        total_wall = sum(node["wall_seconds"] for node in nodes.values())
+        total_cpu = sum(node["cpu_seconds"] for node in nodes.values())
+        return {
+            "run_id": self.run_id,
+            "sample_interval_ms": self.interval * 1000,
+            "nodes": nodes,
+            "total": {"wall_seconds": round(total_wall, 4), "cpu_seconds": round(total_cpu, 4),
+                      "wait_seconds": round(max(0.0, total_wall - total_cpu), 4)}
+        }
+
+    def collapsed_stacks(self) -> str:
+        """One 'node;frame;frame count' line per distinct stack"""
+        lines = []
+        for node_name in self.order:
+            for stack, count in self.nodes[node_name]["stacks"].most_common():
+                lines.append(";".join((node_name,) + stack) + f" {count}")
+        return "\n".join(lines) + "\n"
+
+    def speedscope(self) -> Dict:
+        """speedscope.app 'sampled' file with one profile per node"""
+        frames = []
+        frame_index = {}
+        profiles = []
+        for node_name in self.order:
+            samples, weights = [], []
+            # The sampler can be starved of the GIL by CPU-bound code, so spread the
+            # node's wall time over the samples we did get instead of trusting the interval
+            stacks = self.nodes[node_name]["stacks"]
+            sample_weight = self.nodes[node_name]["wall"] / max(1, sum(stacks.values()))
+            for stack, count in stacks.items():
+                indexes = []
+                for label in stack:
+                    if label not in frame_index:
+                        frame_index[label] = len(frames)
+                        frames.append({"name": label})
+                    indexes.append(frame_index[label])
+                samples.append(indexes)
+                weights.append(count * sample_weight)
+            profiles.append({
+                "type": "sampled",
+                "name": node_name,
+                "unit": "seconds",
+                "startValue": 0,
+                "endValue": sum(weights),
+                "samples": samples,
+                "weights": weights
+            })
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": f"RightsGuard run {self.run_id}",
+            "exporter": "rightsguard-run-profiler",
+            "shared": {"frames": frames},
+            "profiles": profiles
+        }
+
+    def write(self) -> Dict:
+        """Write the profile files and return the summary (with their paths)"""
+        summary = self.summary()
+        try:
+            os.makedirs(self.output_dir, exist_ok=True)
+            base = os.path.join(self.output_dir, self.run_id)
+            with open(base + ".collapsed", 'w') as f:
+                f.write(self.collapsed_stacks())
+            with open(base + ".speedscope.json", 'w') as f:
+                json.dump(self.speedscope(), f)
+            summary["files"] = [base + ".collapsed", base + ".speedscope.json", base + ".summary.json"]
+            with open(base + ".summary.json", 'w') as f:
+                json.dump(summary, f, indent=2)
+        except OSError as e:
+            print(f"⚠️ Could not write profile for run {self.run_id}: {e}")
+
+        for node_name, node in summary["nodes"].items():
+            print(f"🔬 {node_name}: {node['wall_seconds']:.3f}s wall = "
+                  f"{node['cpu_seconds']:.3f}s CPU + {node['wait_seconds']:.3f}s waiting")
+        return summary
+
+
+def start_run(profile: bool = None) -> Optional[RunProfiler]:
+    """A profiler for this run if asked for, or if it falls in the RIGHTSGUARD_PROFILE_RATE sample"""
+    if profile is None:
+        profile = PROFILE_RATE > 0 and random.random() < PROFILE_RATE
+    return RunProfiler() if profile else None
+
+
+# Quick check: a CPU-bound "node" and a waiting one
+if __name__ == "__main__":
+    profiler = RunProfiler(output_dir="/tmp/rightsguard-profiles")
+
+    with profiler.node("busy"):
+        sum(i * i for i in range(3_000_000))
+    with profiler.node("waiting"):
+        time.sleep(0.3)
+
+    # A node waiting on a helper thread that does the CPU work (like an LLM call on EndpointGuard)
+    def helper_work():
+        started = time.thread_time()
+        sum(i * i for i in range(3_000_000))
+        threading.current_thread().cpu_seconds = time.thread_time() - started
+
+    with profiler.node("helper"):
+        helper = threading.Thread(target=helper_work)
+        helper.profile_parent = threading.get_ident()
+        helper.start()
+        helper.join()
+
+    print(json.dumps(profiler.write(), indent=2))
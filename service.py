@@ -0,0 +1,320 @@
+# RightsGuard Service - Headless HTTP/JSON API for the multi-agent workflow
+#
+# Runs a pre-fork pool of worker processes that share one listening socket.
+# Put several of these behind a load balancer to scale out.
+#
+#   python service.py --workers 4 --port 8000
+#
+# By default the workflow (agents, guardrails, compiled graph) is built and
+# warmed once in the parent, and the workers fork from it and share those pages
+# copy-on-write - so workers, including replacements, serve right away.
+#
+#   POST /analyze   {"complaint": "...", "address": "...", "tenant_info": {...}, "profile": false,
+#                    "deadline_seconds": 20}   (optional - past it the reply is partial, see result["deadline"])
+#   GET  /health    liveness + queue state
+#   GET  /metrics   request counters summed across all workers
+import argparse
+import gc
+import json
+import multiprocessing
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from typing import Dict
+
+from dotenv import load_dotenv
+
+from agents.endpoint_guard import get_all_guard_metrics
+from agents.model_router import get_tier_metrics
+from agents.prompt_templates import get_template_metrics
+
+# Load environment variables from .env file (for local development)
+load_dotenv()
+
+# Counters shared by every worker process (created before fork)
+METRIC_NAMES = ['requests_total', 'requests_ok', 'requests_failed', 'requests_rejected',
+                'inflight', 'queued', 'total_latency_ms']
+
+
+class SharedMetrics:
+    """Counters in shared memory so /metrics reports the whole pool, not one worker"""
+
+    def __init__(self):
+        self.values = multiprocessing.Array('d', len(METRIC_NAMES))
+        self.index = {name: i for i, name in enumerate(METRIC_NAMES)}
+
+    def add(self, name: str, amount: float = 1):
+        with self.values.get_lock():
+            self.values[self.index[name]] += amount
+
+    def snapshot(self) -> Dict:
+        with self.values.get_lock():
+            data = {name: self.values[i] for name, i in self.index.items()}
+        completed = data['requests_ok'] + data['requests_failed']
+        data['avg_latency_ms'] = data['total_latency_ms'] / completed if completed else 0.0
+        return data
+
+
+class AdmissionControl:
+    """
+    Per-worker backpressure: a fixed number of analyses run at once,
+    a bounded number wait, and everything beyond that gets a 503 right away
+    """
+
+    def __init__(self, concurrency: int, max_queue: int, queue_timeout: float):
+        self.slots = threading.BoundedSemaphore(concurrency)
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.waiting = 0
+        self.lock = threading.Lock()
+
+    def acquire(self) -> bool:
+        with self.lock:
+            if self.waiting >= self.max_queue:
+                return False
+            self.waiting += 1
+        try:
+            return self.slots.acquire(timeout=self.queue_timeout)
+        finally:
+            with self.lock:
+                self.waiting -= 1
+
+    def release(self):
+        self.slots.release()
+
+
+class ThreadedHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class RightsGuardRequestHandler(BaseHTTPRequestHandler):
+    """Routes requests to the workflow owned by this worker process"""
+
+    # Set by run_worker() before serving
+    workflow = None
+    metrics = None
+    admission = None
+
+    def _send_json(self, status: int, payload: Dict, headers: Dict = None):
+        body = json.dumps(payload, default=str).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        print(f"[worker {os.getpid()}] {self.address_string()} - {format % args}")
+
+    def do_GET(self):
+        if self.path == '/health':
+            self._send_json(200, {
+                "status": "ok",
+                "pid": os.getpid(),
+                "queued": self.admission.waiting,
+                "max_queue": self.admission.max_queue,
+                "coalescing": self.workflow.get_coalescing_metrics(),
+                "data_sources": self.workflow.get_source_metrics(),
+                "llm_endpoints": get_all_guard_metrics(),
+                "guardrails": self.workflow.analyzer.local_rails.get_metrics(),
+                "model_tiers": get_tier_metrics(),
+                "prompt_templates": get_template_metrics(),
+                "letter_cache": self.workflow.letter.cache.get_metrics()
+            })
+        elif self.path == '/metrics':
+            self._send_json(200, self.metrics.snapshot())
+        else:
+            self._send_json(404, {"error": "Not found"})
+
+    def do_POST(self):
+        if self.path != '/analyze':
+            self._send_json(404, {"error": "Not found"})
+            return
+
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            payload = json.loads(self.rfile.read(length) or b'{}')
+        except (ValueError, json.JSONDecodeError):
+            self._send_json(400, {"error": "Request body must be JSON"})
+            return
+        if not isinstance(payload, dict):
+            self._send_json(400, {"error": "Request body must be a JSON object"})
+            return
+
+        complaint = payload.get('complaint')
+        address = payload.get('address')
+        tenant_info = payload.get('tenant_info') or {}
+        if not isinstance(tenant_info, dict):
+            self._send_json(400, {"error": "tenant_info must be an object"})
+            return
+        if not complaint or not address or not tenant_info.get('name'):
+            self._send_json(400, {"error": "complaint, address and tenant_info.name are required"})
+            return
+        if not all(isinstance(value, str) for value in (complaint, address, tenant_info['name'])):
+            self._send_json(400, {"error": "complaint, address and tenant_info.name must be strings"})
+            return
+        deadline = payload.get('deadline_seconds')
+        if deadline is not None and (isinstance(deadline, bool) or not isinstance(deadline, (int, float))
+                                     or deadline <= 0):
+            self._send_json(400, {"error": "deadline_seconds must be a positive number"})
+            return
+        tenant_info.setdefault('address', address)
+        tenant_info.setdefault('date', time.strftime("%B %d, %Y"))
+
+        self.metrics.add('requests_total')
+
+        # Backpressure: reject instead of piling up work we can't finish
+        self.metrics.add('queued')
+        admitted = self.admission.acquire()
+        self.metrics.add('queued', -1)
+        if not admitted:
+            self.metrics.add('requests_rejected')
+            self._send_json(503, {"error": "Server busy, try again shortly"}, {"Retry-After": "5"})
+            return
+
+        self.metrics.add('inflight')
+        started = time.perf_counter()
+        try:
+            result = self.workflow.process_complaint(
+                user_complaint=complaint,
+                building_address=address,
+                tenant_info=tenant_info,
+                profile=True if payload.get('profile') else None,
+                deadline=deadline
+            )
+            self.metrics.add('requests_ok')
+            self._send_json(200, result)
+        except Exception as e:
+            self.metrics.add('requests_failed')
+            self._send_json(500, {"error": f"Processing failed: {e}"})
+        finally:
+            self.metrics.add('total_latency_ms', (time.perf_counter() - started) * 1000)
+            self.metrics.add('inflight', -1)
+            self.admission.release()
+
+
+def preload_workflow(memory_db_path: str):
+    """Build and warm the workflow in the parent so every forked worker inherits it"""
+    from workflow import RightsGuardWorkflow
+
+    started = time.perf_counter()
+    workflow = RightsGuardWorkflow(memory_db_path=memory_db_path)
+    workflow.warm_up()
+    # Park everything built so far in the permanent generation - otherwise the first
+    # collection in each worker writes to every object's header and un-shares its page
+    gc.collect()
+    gc.freeze()
+    print(f"📦 Preloaded workflow in {time.perf_counter() - started:.2f}s - workers share it copy-on-write")
+    return workflow
+
+
+def run_worker(listen_socket: socket.socket, metrics: SharedMetrics, args, workflow=None):
+    """Body of one forked worker: serve on the shared socket with the preloaded workflow (or build one)"""
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+
+    if workflow is None:
+        from workflow import RightsGuardWorkflow
+        workflow = RightsGuardWorkflow(memory_db_path=args.memory_db)
+    RightsGuardRequestHandler.workflow = workflow
+    RightsGuardRequestHandler.metrics = metrics
+    RightsGuardRequestHandler.admission = AdmissionControl(args.concurrency, args.max_queue, args.queue_timeout)
+
+    server = ThreadedHTTPServer((args.host, args.port), RightsGuardRequestHandler, bind_and_activate=False)
+    server.socket = listen_socket
+    print(f"👷 Worker {os.getpid()} ready")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+
+
+def spawn_worker(listen_socket: socket.socket, metrics: SharedMetrics, args, workflow=None) -> int:
+    pid = os.fork()
+    if pid == 0:
+        exit_code = 0
+        try:
+            run_worker(listen_socket, metrics, args, workflow)
+        except SystemExit:
+            pass
+        except Exception as e:
+            print(f"❌ Worker {os.getpid()} crashed: {e}")
+            exit_code = 1
+        os._exit(exit_code)
+    return pid
+
+
+def serve(args):
+    """Parent process: bind once, fork the workers, restart any that die"""
+    listen_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listen_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listen_socket.bind((args.host, args.port))
+    listen_socket.listen(args.backlog)
+
+    metrics = SharedMetrics()
+    workflow = preload_workflow(args.memory_db) if args.preload else None
+    workers = set()
+    shutting_down = False
+
+    def shutdown(*_):
+        nonlocal shutting_down
+        shutting_down = True
+        for pid in list(workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+
+    print(f"🏛️ RightsGuard service on http://{args.host}:{args.port} with {args.workers} workers")
+    for _ in range(args.workers):
+        workers.add(spawn_worker(listen_socket, metrics, args, workflow))
+
+    while workers:
+        try:
+            pid, _ = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        workers.discard(pid)
+        if not shutting_down:
+            print(f"⚠️ Worker {pid} exited - starting a replacement")
+            workers.add(spawn_worker(listen_socket, metrics, args, workflow))
+
+    listen_socket.close()
+    print("👋 RightsGuard service stopped")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="RightsGuard HTTP service")
+    parser.add_argument('--host', default=os.getenv('RIGHTSGUARD_HOST', '0.0.0.0'))
+    parser.add_argument('--port', type=int, default=int(os.getenv('RIGHTSGUARD_PORT', '8000')))
+    parser.add_argument('--workers', type=int, default=int(os.getenv('RIGHTSGUARD_WORKERS', os.cpu_count() or 2)),
+                        help="Number of pre-forked worker processes")
+    parser.add_argument('--concurrency', type=int, default=4,
+                        help="Analyses each worker runs at the same time")
+    parser.add_argument('--max-queue', type=int, default=16,
+                        help="Requests each worker lets wait before answering 503")
+    parser.add_argument('--queue-timeout', type=float, default=30.0,
+                        help="Seconds a queued request waits for a slot before a 503")
+    parser.add_argument('--backlog', type=int, default=128, help="Listen socket backlog")
+    parser.add_argument('--memory-db', default="community_memory.json",
+                        help="Community memory shared by all workers (stored as <name>.shards/; "
+                             "an existing single-file database is migrated on first start)")
+    parser.add_argument('--preload', action=argparse.BooleanOptionalAction,
+                        default=os.getenv('RIGHTSGUARD_PRELOAD', 'true').lower() not in ('0', 'false', 'no'),
+                        help="Build the workflow once before forking workers (--no-preload: each worker builds its own)")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    serve(parse_args())
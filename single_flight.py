@@ -0,0 +1,147 @@
+# Single Flight - Lets concurrent identical requests share one in-flight call
+#
+# During building-wide outages many tenants at the same address file nearly
+# the same complaint at once. Instead of each run hitting NYC Open Data and
+# the LLM separately, the first caller for a key does the work and everyone
+# else who asks for the same key while it's running waits for that result.
+#
+# A waiting caller only waits as long as its own run has left, and a result
+# from a leader whose run was stopped (or that the caller says is a fallback)
+# isn't handed on - the waiting callers try again themselves.
+import copy
+import re
+import threading
+from typing import Any, Callable, Dict, Hashable
+
+from agents.cancellation import CancelToken
+
+# Common street suffixes so "123 Main Street" and "123 main st." match
+ADDRESS_ABBREVIATIONS = {
+    'street': 'st', 'avenue': 'ave', 'av': 'ave', 'boulevard': 'blvd', 'road': 'rd',
+    'place': 'pl', 'drive': 'dr', 'lane': 'ln', 'parkway': 'pkwy', 'east': 'e',
+    'west': 'w', 'north': 'n', 'south': 's', 'apartment': 'apt'
+}
+
+
+def normalize_address(address: str) -> str:
+    """Lowercase, drop punctuation and abbreviate street words"""
+    words = re.sub(r'[^\w\s]', ' ', (address or '').lower()).split()
+    return ' '.join(ADDRESS_ABBREVIATIONS.get(word, word) for word in words)
+
+
+def normalize_complaint(complaint: str) -> str:
+    """Lowercase and drop punctuation/extra whitespace"""
+    return ' '.join(re.sub(r'[^\w\s]', ' ', (complaint or '').lower()).split())
+
+
+class _Call:
+    """One in-flight call that other callers can wait on"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.shared = True
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Coalesces concurrent calls that share a key"""
+
+    def __init__(self, name: str = "SingleFlight"):
+        self.name = name
+        self.lock = threading.Lock()
+        self.calls: Dict[Hashable, _Call] = {}
+        self.stats = {"calls": 0, "executed": 0, "coalesced": 0, "not_shared": 0, "gave_up": 0}
+
+    def do(self, key: Hashable, fn: Callable[[], Any], cancel_token: CancelToken = None,
+           shareable: Callable[[Any], bool] = None) -> Any:
+        """
+        Run fn() unless a call for the same key is already in flight,
+        in which case wait for it and share its result.
+        Every caller gets its own copy, so later edits don't leak between runs.
+        cancel_token: this caller's run - it stops waiting when the run stops and runs its own fn()
+        shareable: False for a result others shouldn't get (a fallback) - they run the call again
+        """
+        while True:
+            with self.lock:
+                self.stats["calls"] += 1
+                call = self.calls.get(key)
+                leader = call is None
+                if leader:
+                    call = _Call()
+                    self.calls[key] = call
+                    self.stats["executed"] += 1
+                else:
+                    call.waiters += 1
+                    self.stats["coalesced"] += 1
+
+            if leader:
+                try:
+                    call.result = fn()
+                    # Cut short by the leader's own deadline or cancel - not good enough for anyone else
+                    call.shared = (not (cancel_token is not None and cancel_token.stopped)
+                                   and (shareable is None or shareable(call.result)))
+                except Exception as e:
+                    call.error = e
+                finally:
+                    with self.lock:
+                        del self.calls[key]
+                    call.done.set()
+                if call.waiters:
+                    print(f"🔗 {self.name}: shared one call with {call.waiters} other runs"
+                          if call.shared else f"🔗 {self.name}: {call.waiters} other runs will try again themselves")
+                break
+
+            # Wait only as long as our own run has left
+            while not call.done.wait(0.1):
+                if cancel_token is not None and cancel_token.stopped:
+                    with self.lock:
+                        self.stats["gave_up"] += 1
+                    return fn()
+            if call.error is not None or call.shared:
+                break
+            with self.lock:
+                self.stats["not_shared"] += 1
+
+        if call.error is not None:
+            raise call.error
+        return copy.deepcopy(call.result)
+
+    def get_metrics(self) -> Dict:
+        with self.lock:
+            metrics = dict(self.stats)
+            metrics["in_flight"] = len(self.calls)
+        return metrics
+
+
+# Quick check with a slow fake call
+if __name__ == "__main__":
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+
+    flight = SingleFlight("ViolationFetch")
+
+    def slow_fetch():
+        time.sleep(0.5)
+        return [{"violationid": "1"}]
+
+    addresses = ["123 Main Street", "123 main st.", "123 MAIN ST", "9 Elm Avenue"]
+    with ThreadPoolExecutor(len(addresses)) as pool:
+        results = list(pool.map(lambda a: flight.do(normalize_address(a), slow_fetch), addresses))
+
+    print(results)
+    print(flight.get_metrics())
+
+    # The leader's run is out of time - a follower with time left fetches for itself
+    def cut_short():
+        time.sleep(0.3)
+        return []
+
+    rushed = CancelToken(0.1)
+    with ThreadPoolExecutor(2) as pool:
+        leader = pool.submit(flight.do, "1 main st", cut_short, rushed)
+        time.sleep(0.05)
+        follower = pool.submit(flight.do, "1 main st", slow_fetch, CancelToken(5))
+        print(leader.result(), follower.result())
+    print(flight.get_metrics())
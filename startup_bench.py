@@ -0,0 +1,143 @@
+# Startup Benchmark - Time from launching the service to its first served request
+#
+# Starts service.py with the mock backends (no keys, no network), polls until
+# POST /analyze answers 200, then stops it. Runs once with the preloaded,
+# copy-on-write workflow and once with every worker building its own, and
+# fails (exit code 1) if the preloaded start misses the budget - so it can
+# gate a deploy.
+#
+#   python startup_bench.py --workers 4 --budget 10
+#
+# On Linux it also reports how much of each worker's memory is still shared
+# with the parent (from /proc/<pid>/smaps_rollup).
+import argparse
+import json
+import os
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+import requests
+
+SERVICE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "service.py")
+DEFAULT_BUDGET = float(os.getenv("RIGHTSGUARD_STARTUP_BUDGET", "10"))
+FIRST_REQUEST = {"complaint": "No heat in my apartment for a week", "address": "123 Main St, Brooklyn, NY",
+                 "tenant_info": {"name": "Startup Check"}}
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def worker_pids(parent_pid: int) -> List[int]:
+    try:
+        with open(f"/proc/{parent_pid}/task/{parent_pid}/children") as f:
+            return [int(pid) for pid in f.read().split()]
+    except OSError:
+        return []
+
+
+def memory_kb(pid: int) -> Optional[Dict]:
+    """Rss and how much of it is private to the process (Linux only)"""
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            fields = dict(line.split(":", 1) for line in f if ":" in line and not line.startswith("0"))
+    except OSError:
+        return None
+    value = lambda name: int(fields.get(name, "0 kB").split()[0])
+    return {"rss_kb": value("Rss"), "private_kb": value("Private_Clean") + value("Private_Dirty")}
+
+
+def measure(workers: int, preload: bool, timeout: float) -> Dict:
+    """Launch the service and time /health and the first /analyze"""
+    scratch_dir = tempfile.mkdtemp(prefix="rightsguard-startup-")
+    port = free_port()
+    env = dict(os.environ, RIGHTSGUARD_MOCK_BACKENDS="1", RIGHTSGUARD_MOCK_LLM_MS="0", RIGHTSGUARD_MOCK_DATA_MS="0",
+               RIGHTSGUARD_LETTER_CACHE_DIR=os.path.join(scratch_dir, "letter_cache"))
+    command = [sys.executable, SERVICE, "--host", "127.0.0.1", "--port", str(port), "--workers", str(workers),
+               "--memory-db", os.path.join(scratch_dir, "community_memory.json"),
+               "--preload" if preload else "--no-preload"]
+
+    started = time.perf_counter()
+    process = subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    result = {"preload": preload, "workers": workers, "health_seconds": None, "first_request_seconds": None}
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        while time.perf_counter() - started < timeout:
+            if process.poll() is not None:
+                result["error"] = f"service exited with code {process.returncode}"
+                break
+            try:
+                if result["health_seconds"] is None:
+                    if requests.get(f"{base_url}/health", timeout=1).status_code == 200:
+                        result["health_seconds"] = round(time.perf_counter() - started, 3)
+                response = requests.post(f"{base_url}/analyze", json=FIRST_REQUEST, timeout=timeout)
+                if response.status_code == 200:
+                    result["first_request_seconds"] = round(time.perf_counter() - started, 3)
+                    break
+            except requests.RequestException:
+                pass
+            time.sleep(0.05)
+        else:
+            result["error"] = f"no answer within {timeout:.0f}s"
+
+        # Give every worker time to come up before looking at how much memory they share
+        time.sleep(1)
+        usage = [memory_kb(pid) for pid in worker_pids(process.pid)]
+        usage = [u for u in usage if u]
+        if usage:
+            result["worker_rss_mb"] = round(sum(u["rss_kb"] for u in usage) / len(usage) / 1024, 1)
+            result["worker_private_mb"] = round(sum(u["private_kb"] for u in usage) / len(usage) / 1024, 1)
+    finally:
+        process.send_signal(signal.SIGTERM)
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+    return result
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Time from service start to first served request")
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--budget', type=float, default=DEFAULT_BUDGET,
+                        help="Seconds the preloaded service may take to serve its first request")
+    parser.add_argument('--timeout', type=float, default=120.0, help="Give up on a start after this many seconds")
+    parser.add_argument('--preload-only', action='store_true', help="Skip the per-worker comparison run")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    runs = [measure(args.workers, True, args.timeout)]
+    if not args.preload_only:
+        runs.append(measure(args.workers, False, args.timeout))
+
+    for run in runs:
+        label = "preloaded " if run["preload"] else "per-worker"
+        memory = (f", worker RSS {run['worker_rss_mb']}MB ({run['worker_private_mb']}MB private)"
+                  if "worker_rss_mb" in run else "")
+        print(f"⏱️ {label}: /health after {run['health_seconds']}s, "
+              f"first request served after {run['first_request_seconds']}s{memory}")
+        if run.get("error"):
+            print(f"❌ {label}: {run['error']}")
+    print(json.dumps(runs, indent=2))
+
+    first_request = runs[0]["first_request_seconds"]
+    if first_request is None or first_request > args.budget:
+        print(f"❌ Preloaded start took {first_request}s - over the {args.budget:.1f}s budget")
+        return 1
+    print(f"✅ Preloaded start served its first request in {first_request}s (budget {args.budget:.1f}s)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,266 @@
+# Traffic Recorder - Record real NVIDIA/Socrata traffic once, replay it offline
+#
+# Record mode wraps ChatNVIDIA.invoke and requests.get, passes every call
+# through to the real endpoint and appends the request, the response and how
+# long it took to a JSONL file. Playback mode answers the same calls from that
+# file without any network, sleeping for the recorded latency (optionally
+# scaled), so profiling and regression runs are deterministic. LLM calls are
+# matched without the parts of the prompt that change between runs (the date
+# on the letter, community and neighborhood counts), and a call that isn't in
+# the recording fails the run instead of falling back to a template.
+#
+#   RIGHTSGUARD_TRAFFIC_MODE=record   RIGHTSGUARD_TRAFFIC_FILE=traffic.jsonl  streamlit run app.py
+#   RIGHTSGUARD_TRAFFIC_MODE=playback RIGHTSGUARD_TRAFFIC_SPEED=0.5           python service.py
+#   python traffic_recorder.py traffic.jsonl    # summary of a recording
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import defaultdict
+from typing import Dict
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+from agents.endpoint_guard import PassThroughError
+from agents.prompt_templates import prompt_text
+
+DEFAULT_TRAFFIC_FILE = "traffic.jsonl"
+
+RECORD = "record"
+PLAYBACK = "playback"
+
+
+# Prompt lines that differ from run to run without changing what is asked: today's date
+# in the tenant details, and the counts the analyzer appends from community memory
+VOLATILE_PROMPT_LINES = re.compile(r"^\s*(- Today's Date:|🏢 COMMUNITY INSIGHT:|📍 NEIGHBORHOOD:).*$", re.MULTILINE)
+
+
+class RecordingMissError(PassThroughError):
+    """Playback was asked for a call that isn't in the recording"""
+    pass
+
+
+def normalize_prompt(text: str) -> str:
+    """The prompt without its volatile lines, whitespace collapsed"""
+    return re.sub(r'\s+', ' ', VOLATILE_PROMPT_LINES.sub('', text or '')).strip()
+
+
+def request_key(kind: str, request: Dict) -> str:
+    """Stable key for a request so playback can find its recorded response"""
+    if kind == "llm":
+        request = dict(request, prompt=normalize_prompt(request.get("prompt")))
+    encoded = json.dumps([kind, request], sort_keys=True, default=str).encode('utf-8')
+    return hashlib.sha256(encoded).hexdigest()[:24]
+
+
+def _llm_request(llm, prompt) -> Dict:
+    return {"model": getattr(llm, 'model', None), "temperature": getattr(llm, 'temperature', None),
+            "prompt": prompt_text(prompt)}
+
+
+def _http_request(url, params=None, **kwargs) -> Dict:
+    return {"url": url, "params": params}
+
+
+def _llm_response(response) -> Dict:
+    return {"content": response.content,
+            "usage_metadata": dict(getattr(response, 'usage_metadata', None) or {}),
+            "response_metadata": dict(getattr(response, 'response_metadata', None) or {})}
+
+
+def _http_response(response: requests.Response) -> Dict:
+    return {"status_code": response.status_code, "url": response.url,
+            "headers": dict(response.headers), "text": response.text}
+
+
+def _build_llm_response(data: Dict):
+    from langchain_core.messages import AIMessage
+    return AIMessage(content=data["content"], usage_metadata=data.get("usage_metadata") or None,
+                     response_metadata=data.get("response_metadata") or {})
+
+
+def _build_http_response(data: Dict) -> requests.Response:
+    response = requests.Response()
+    response.status_code = data["status_code"]
+    response.url = data["url"]
+    response.headers = CaseInsensitiveDict(data["headers"])
+    response.encoding = 'utf-8'
+    response._content = data["text"].encode('utf-8')
+    return response
+
+
+class TrafficRecorder:
+    """Patches ChatNVIDIA.invoke and requests.get to record or replay their traffic"""
+
+    def __init__(self, mode: str, path: str = DEFAULT_TRAFFIC_FILE, latency_scale: float = 1.0):
+        if mode not in (RECORD, PLAYBACK):
+            raise ValueError(f"Unknown traffic mode: {mode}")
+        self.name = "TrafficRecorder"
+        self.mode = mode
+        self.path = path
+        self.latency_scale = latency_scale
+        self.lock = threading.Lock()
+        self.recordings = defaultdict(list)  # request key -> recorded entries, in order
+        self.replay_position = defaultdict(int)
+        self.stats = {"recorded": 0, "replayed": 0, "missed": 0}
+        self.originals = {}
+
+        if mode == PLAYBACK:
+            self.load(path)
+
+    def load(self, path: str):
+        with open(path, 'r') as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    # Re-key from the request, so older recordings match the current normalization
+                    self.recordings[request_key(entry["kind"], entry["request"])].append(entry)
+        print(f"📼 Loaded {sum(len(entries) for entries in self.recordings.values())} recorded calls from {path}")
+
+    def _write(self, entry: Dict):
+        with self.lock:
+            with open(self.path, 'a') as f:
+                f.write(json.dumps(entry, default=str) + "\n")
+            self.stats["recorded"] += 1
+
+    def _record(self, kind: str, request: Dict, call, to_dict):
+        """Make the real call and log it - failures are recorded too, so playback fails the same way"""
+        entry = {"key": request_key(kind, request), "kind": kind, "request": request, "recorded_at": time.time()}
+        started = time.perf_counter()
+        try:
+            response = call()
+        except Exception as e:
+            entry.update(latency=time.perf_counter() - started, error=str(e))
+            self._write(entry)
+            raise
+        entry.update(latency=time.perf_counter() - started, response=to_dict(response))
+        self._write(entry)
+        return response
+
+    def _replay(self, kind: str, request: Dict, from_dict):
+        """Answer from the recording: the same key replays its recordings in order, repeating the last"""
+        key = request_key(kind, request)
+        with self.lock:
+            entries = self.recordings.get(key)
+            if not entries:
+                self.stats["missed"] += 1
+                entry = None
+            else:
+                position = self.replay_position[key]
+                entry = entries[min(position, len(entries) - 1)]
+                self.replay_position[key] = position + 1
+                self.stats["replayed"] += 1
+
+        if entry is None:
+            raise RecordingMissError(f"No recorded {kind} call for {json.dumps(request, default=str)[:120]}")
+
+        time.sleep(entry["latency"] * self.latency_scale)
+        if "error" in entry:
+            raise Exception(entry["error"])
+        return from_dict(entry["response"])
+
+    def install(self):
+        """Patch ChatNVIDIA and requests for the whole process"""
+        from langchain_nvidia_ai_endpoints import ChatNVIDIA
+
+        recorder = self
+        original_invoke = ChatNVIDIA.invoke
+        original_get = requests.get
+        self.originals = {"invoke": original_invoke, "get": original_get}
+
+        def invoke(llm, prompt, *args, **kwargs):
+            request = _llm_request(llm, prompt)
+            if recorder.mode == PLAYBACK:
+                return recorder._replay("llm", request, _build_llm_response)
+            return recorder._record("llm", request, lambda: original_invoke(llm, prompt, *args, **kwargs), _llm_response)
+
+        def get(url, params=None, **kwargs):
+            request = _http_request(url, params, **kwargs)
+            if recorder.mode == PLAYBACK:
+                return recorder._replay("http", request, _build_http_response)
+            return recorder._record("http", request, lambda: original_get(url, params=params, **kwargs), _http_response)
+
+        ChatNVIDIA.invoke = invoke
+        requests.get = get
+        if self.mode == PLAYBACK:
+            # The agents only build ChatNVIDIA clients when there's a key - playback never uses it
+            os.environ.setdefault("NVIDIA_API_KEY", "playback")
+        print(f"📼 Traffic {self.mode} on {self.path} (latency x{self.latency_scale})")
+        return self
+
+    def uninstall(self):
+        from langchain_nvidia_ai_endpoints import ChatNVIDIA
+
+        if self.originals:
+            ChatNVIDIA.invoke = self.originals["invoke"]
+            requests.get = self.originals["get"]
+            self.originals = {}
+
+    def __enter__(self):
+        return self.install()
+
+    def __exit__(self, *exc):
+        self.uninstall()
+
+    def get_metrics(self) -> Dict:
+        with self.lock:
+            return dict(self.stats, mode=self.mode, path=self.path)
+
+
+# The recorder installed from the environment, if any (one per process)
+_active_recorder = None
+_install_lock = threading.Lock()
+
+
+def install_from_env():
+    """Turn on record/playback when RIGHTSGUARD_TRAFFIC_MODE is set"""
+    global _active_recorder
+    mode = os.getenv("RIGHTSGUARD_TRAFFIC_MODE", "").lower()
+    if not mode:
+        return None
+    with _install_lock:
+        if _active_recorder is None:
+            _active_recorder = TrafficRecorder(
+                mode,
+                os.getenv("RIGHTSGUARD_TRAFFIC_FILE", DEFAULT_TRAFFIC_FILE),
+                float(os.getenv("RIGHTSGUARD_TRAFFIC_SPEED", "1.0"))
+            ).install()
+    return _active_recorder
+
+
+def summarize(path: str) -> Dict:
+    """Call counts and latency per kind (and per model) in a recording"""
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+    with open(path, 'r') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            group = entry["kind"] if entry["kind"] != "llm" else f"llm:{entry['request'].get('model')}"
+            latencies[group].append(entry["latency"])
+            if "error" in entry:
+                errors[group] += 1
+
+    summary = {}
+    for group, values in latencies.items():
+        values.sort()
+        summary[group] = {
+            "calls": len(values),
+            "errors": errors[group],
+            "avg": round(sum(values) / len(values), 3),
+            "p50": round(values[len(values) // 2], 3),
+            "p95": round(values[min(len(values) - 1, int(len(values) * 0.95))], 3),
+            "max": round(values[-1], 3)
+        }
+    return summary
+
+
+if __name__ == "__main__":
+    import sys
+
+    for group, stats in summarize(sys.argv[1] if len(sys.argv) > 1 else DEFAULT_TRAFFIC_FILE).items():
+        print(f"{group}: {stats}")
@@ -0,0 +1,89 @@
+# Violation Table - Normalizes NYC violation records into one DataFrame for the UI
+#
+# All the cleanup the UI used to do per record (date trimming, legal jargon
+# replacement, defaults for missing fields) happens here once, column by
+# column, so rendering a page of violations is just slicing a DataFrame.
+from typing import Dict, List
+
+import pandas as pd
+
+# Socrata field -> display column
+VIOLATION_COLUMNS = {
+    'violationtype': 'Type',
+    'inspectiondate': 'Date',
+    'class': 'Class',
+    'currentstatus': 'Status',
+    'novdescription': 'Details'
+}
+
+COLUMN_DEFAULTS = {
+    'Type': 'Housing Code Violation',
+    'Date': 'Date unknown',
+    'Class': 'Unknown',
+    'Status': 'Unknown status',
+    'Details': 'No description available'
+}
+
+# Violations shown as highlighted cards above the table
+HIGHLIGHT_COUNT = 3
+
+
+def normalize_violations(violations: List[Dict]) -> pd.DataFrame:
+    """Build the display table for a list of raw violation records (numbered from 1)"""
+    table = pd.DataFrame.from_records(violations or [], columns=list(VIOLATION_COLUMNS))
+    table = table.rename(columns=VIOLATION_COLUMNS)
+
+    # Fill in missing values the same way the old per-record code did
+    for column, default in COLUMN_DEFAULTS.items():
+        table[column] = table[column].fillna(default).astype(str)
+
+    # 2023-01-05T00:00:00.000 -> 2023-01-05
+    table['Date'] = table['Date'].str.split('T').str[0]
+
+    # Clean up long legal descriptions
+    details = table['Details']
+    cleaned = details.str.replace('§', 'Section', regex=False).str.replace('ADM CODE', 'Admin Code', regex=False)
+    table['Details'] = cleaned.where(details.str.len() > 50, details)
+
+    table.index = pd.RangeIndex(1, len(table) + 1, name='#')
+    return table
+
+
+def highlight_markdown(table: pd.DataFrame, count: int = HIGHLIGHT_COUNT) -> str:
+    """Markdown cards for the first few violations"""
+    cards = []
+    for number, row in table.head(count).iterrows():
+        cards.append(
+            f"**{number}. {row['Type']}**\n"
+            f"- **Date:** {row['Date']}\n"
+            f"- **Class:** {row['Class']} | **Status:** {row['Status']}\n"
+            f"- **Details:** {row['Details']}"
+        )
+    return "\n\n".join(cards)
+
+
+def get_page(table: pd.DataFrame, page: int, page_size: int, skip: int = HIGHLIGHT_COUNT) -> pd.DataFrame:
+    """One page of the violations after the highlighted ones (page starts at 1)"""
+    start = skip + (page - 1) * page_size
+    return table.iloc[start:start + page_size]
+
+
+def page_count(table: pd.DataFrame, page_size: int, skip: int = HIGHLIGHT_COUNT) -> int:
+    remaining = max(len(table) - skip, 0)
+    return (remaining + page_size - 1) // page_size
+
+
+# Quick check with fake records
+if __name__ == "__main__":
+    import time
+
+    fake = [{"inspectiondate": "2024-01-05T00:00:00.000", "class": "C",
+             "novdescription": "§ 27-2029 ADM CODE PROVIDE HEAT TO THE ENTIRE APARTMENT AND BUILDING",
+             "currentstatus": "VIOLATION OPEN"} if i % 3 else {"class": "B"} for i in range(20000)]
+
+    started = time.perf_counter()
+    table = normalize_violations(fake)
+    print(f"Normalized {len(table)} violations in {(time.perf_counter() - started) * 1000:.1f}ms")
+    print(highlight_markdown(table))
+    print(get_page(table, 2, 5))
+    print(page_count(table, 50))
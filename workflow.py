@@ -1,110 +1,257 @@
 # LangGraph Workflow - Orchestrates our three agents
-import json
 import os
-from typing import Dict, List, TypedDict
-from datetime import datetime
+import re
+import time
+from typing import Callable, Dict, Iterator, List, Tuple, TypedDict
 
 from langgraph.graph import StateGraph, END
+from langchain_core.runnables import RunnableConfig
 from agents.scraper_agent import WebScraperAgent
 from agents.analyzer_agent import AnalyzerAgent 
 from agents.letter_agent import LetterAgent
+from agents.cancellation import CancelToken, DEFAULT_RUN_DEADLINE
+from agents.data_sources import JURISDICTIONS, detect_jurisdiction, get_jurisdiction
+from agents.prompt_templates import TEMPLATES
+import community_stats
+import neighborhood_stats
+from memory_store import ShardedMemoryStore, shards_path
+from records import ComplaintRecord, ViolationRecord, to_dicts
+import mock_backends
+import run_profiler
+import traffic_recorder
+from single_flight import SingleFlight, normalize_address, normalize_complaint
 
 # Define the state that flows between agents
 class WorkflowState(TypedDict):
     user_complaint: str
     building_address: str
     tenant_info: Dict
+    jurisdiction: str  # which city's data sources and law (agents.data_sources.JURISDICTIONS)
     scraped_laws: List[str]
-    violation_data: List[Dict]
-    building_history: List[Dict]
+    violation_data: List[ViolationRecord]  # projected rows - build_result turns them back into dicts
+    building_history: List[ComplaintRecord]
+    community_stats: Dict
     analysis_result: Dict
     final_letter: Dict
     status: str
 
+# Complaint categories and their keywords, in priority order
+# Matched as whole words, so every inflection we want to count is listed
+CATEGORY_KEYWORDS = [
+    ("heating_issues", ['heat', 'heater', 'heaters', 'heating', 'cold', 'temperature', 'temperatures']),
+    ("mold_issues", ['mold', 'moldy', 'mould', 'mouldy', 'fungus']),
+    ("water_issues", ['leak', 'leaks', 'leaking', 'leaky', 'water', 'flood', 'flooded', 'flooding',
+                      'drip', 'drips', 'dripping']),
+    ("pest_issues", ['pest', 'pests', 'roach', 'roaches', 'cockroach', 'cockroaches', 'mouse', 'mice',
+                     'rat', 'rats', 'bug', 'bugs', 'bedbug', 'bedbugs']),
+    ("privacy_violations", ['entry', 'enter', 'enters', 'entered', 'entering', 'notice', 'privacy']),
+    ("maintenance_issues", ['repair', 'repairs', 'repaired', 'broken', 'fix', 'fixed', 'maintenance'])
+]
+
+# One whole-word pattern per category, compiled once
+KEYWORD_PATTERNS = [
+    (category, re.compile(r'\b(?:' + '|'.join(keywords) + r')\b')) for category, keywords in CATEGORY_KEYWORDS
+]
+
+
+def classify_complaint(complaint: str) -> Tuple[str, float]:
+    """
+    Categorize a complaint and say how sure we are
+    Confidence is the share of whole-word keyword hits that belong to the chosen category,
+    so "no heat" is 1.0, "no heat and roaches" is 0.5 and "rather" or "temperature" don't count as "rat"
+    """
+    complaint_lower = complaint.lower()
+    # Each distinct keyword counts once, however often it's repeated
+    word_hits = {category: len(set(pattern.findall(complaint_lower))) for category, pattern in KEYWORD_PATTERNS}
+    total_hits = sum(word_hits.values())
+    
+    # First category in priority order with any keyword in it wins
+    for category, _ in CATEGORY_KEYWORDS:
+        if word_hits[category]:
+            return category, word_hits[category] / total_hits
+    return "other_issues", 0.0
+
+
+def classify_violation(description: str) -> str:
+    """Category of an HPD violation description - whole-word hits only, the texts are long legalese"""
+    category, confidence = classify_complaint(description)
+    return category if confidence else "other_issues"
+
+# How many of a building's newest complaints a run carries (counts come from the aggregates)
+RECENT_HISTORY_LIMIT = 10
+
+# Nodes in the order the graph runs them, and the UI stage each one maps to
+NODE_ORDER = ["web_scraper", "analyzer", "letter_generator"]
+NODE_STAGES = {
+    "web_scraper": "scraping",
+    "analyzer": "analyzing",
+    "letter_generator": "generating"
+}
+
 class RightsGuardWorkflow:
-    def __init__(self):
-        """Initialize the multi-agent workflow"""
+    def __init__(self, memory_db_path: str = "community_memory.json", fused_mode: bool = None):
+        """
+        Initialize the multi-agent workflow
+        fused_mode: analysis and letter come from one LLM call (defaults to RIGHTSGUARD_FUSED_MODE)
+        """
         print("🚀 Initializing RightsGuard Multi-Agent Workflow...")
         
+        # Answer NVIDIA/Socrata calls with canned responses if RIGHTSGUARD_MOCK_BACKENDS is set (load tests, demos)
+        mock_backends.install_from_env()
+        # Record or replay them if RIGHTSGUARD_TRAFFIC_MODE is set - installed last so it wraps the mocks
+        traffic_recorder.install_from_env()
+        
+        if fused_mode is None:
+            fused_mode = os.getenv("RIGHTSGUARD_FUSED_MODE", "").lower() in ("1", "true", "yes")
+        self.fused_mode = fused_mode
+        
         # Initialize all our agents
         self.scraper = WebScraperAgent()
         self.analyzer = AnalyzerAgent()
         self.letter = LetterAgent()
         
-        # Community Legal Memory database (simple JSON for now)
-        self.memory_db_path = "community_memory.json"
-        self.load_community_memory()
+        # Community Legal Memory - sharded on disk, buildings are paged in when asked for
+        # (an old single-file community_memory.json is split into shards the first time)
+        self.memory_db_path = memory_db_path
+        self.memory_store = ShardedMemoryStore(shards_path(memory_db_path),
+                                               legacy_path=memory_db_path)
+        
+        # Block/borough violation rates and percentiles from the local HPD export, if there is one
+        self.neighborhood = neighborhood_stats.load_index(
+            [category for category, _ in CATEGORY_KEYWORDS] + ["other_issues"], classify_violation
+        )
+        
+        # Concurrent runs for the same building/complaint share one fetch and one analysis
+        self.violation_flight = SingleFlight("ViolationFetch")
+        self.analysis_flight = SingleFlight("Analysis")
         
         # Build the LangGraph workflow
         self.graph = self.build_workflow()
         
         print("✅ Workflow initialized with Community Legal Memory!")
     
-    def load_community_memory(self):
-        """Load the community memory database"""
-        if os.path.exists(self.memory_db_path):
-            with open(self.memory_db_path, 'r') as f:
-                self.community_memory = json.load(f)
-        else:
-            self.community_memory = {
-                "buildings": {},  # address -> complaint history
-                "landlords": {},  # landlord -> building list
-                "statistics": {"total_complaints": 0}
-            }
-            self.save_community_memory()
+    def warm_up(self) -> Dict:
+        """
+        Do the one-time work a first request would otherwise pay for - no network, nothing stored
+        Call it before forking workers (see service.py) so they start with it already done.
+        Returns seconds spent on each step.
+        """
+        timings = {}
+        
+        started = time.perf_counter()
+        # Imported lazily by the scraper and the recorders, loaded here instead of mid-request
+        import bs4  # noqa: F401
+        import langchain_core.messages  # noqa: F401
+        timings["imports"] = time.perf_counter() - started
+        
+        started = time.perf_counter()
+        sample = "No heat in my apartment and roaches in the kitchen"
+        self.classify_complaint(sample)
+        # Render and measure each template's system prefix once, for every city
+        for template in TEMPLATES.values():
+            for jurisdiction in JURISDICTIONS.values():
+                template.compile(jurisdiction)
+        timings["prompts"] = time.perf_counter() - started
+        
+        started = time.perf_counter()
+        self.memory_store.get_statistics()
+        timings["memory"] = time.perf_counter() - started
+        
+        print(f"🔥 Workflow warmed up in {sum(timings.values()):.3f}s")
+        return timings
+    
+    def memory_lock(self):
+        """Exclusive lock so only one process updates community memory at a time"""
+        return self.memory_store.lock()
     
-    def save_community_memory(self):
-        """Save the community memory to disk"""
-        with open(self.memory_db_path, 'w') as f:
-            json.dump(self.community_memory, f, indent=2)
+    def get_total_complaints(self) -> int:
+        return self.memory_store.get_statistics()["total_complaints"]
     
-    def get_building_history(self, address: str) -> List[Dict]:
-        """Get complaint history for a building"""
+    def get_building_history(self, address: str, since: int = None,
+                             limit: int = RECENT_HISTORY_LIMIT) -> List[ComplaintRecord]:
+        """Get a building's newest complaints (filed at or after since, at most limit), oldest first"""
         address_key = address.lower().strip()
-        return self.community_memory["buildings"].get(address_key, [])
+        return self.memory_store.recent(address_key, since=since, limit=limit)
+    
+    def get_building_insights(self, address: str) -> Dict:
+        """Category counts, rolling windows and risk level for a building - no history scan"""
+        address_key = address.lower().strip()
+        rollup = self.memory_store.get_building_stats(address_key) or community_stats.new_rollup()
+        insights = community_stats.summarize(rollup)
+        insights["risk_level"] = community_stats.building_risk_level(insights["total"])
+        return insights
+    
+    def get_landlord_insights(self, landlord: str) -> Dict:
+        """Totals across every building a landlord owns, or None if we've never seen them"""
+        if not landlord:
+            return None
+        landlord_key = landlord.lower().strip()
+        buildings, rollup = self.memory_store.get_landlord(landlord_key)
+        if rollup is None:
+            return None
+        
+        insights = community_stats.summarize(rollup)
+        insights["landlord"] = landlord
+        insights["buildings"] = len(buildings)
+        insights["risk_level"] = community_stats.landlord_risk_level(
+            insights["total"], len(buildings), insights["last_90_days"]
+        )
+        return insights
+    
+    def get_neighborhood_insights(self, violations: List[ViolationRecord], category: str) -> Dict:
+        """How the building's violations compare with its block and borough, or None if we can't tell"""
+        if self.neighborhood is None:
+            return None
+        insights = self.neighborhood.enrich(violations)
+        if insights:
+            insights["complaint_category"] = category
+        return insights
+    
+    def get_coalescing_metrics(self) -> Dict:
+        """How many violation fetches and analyses were shared between concurrent runs"""
+        return {
+            "violation_fetch": self.violation_flight.get_metrics(),
+            "analysis": self.analysis_flight.get_metrics()
+        }
+    
+    def get_source_metrics(self) -> Dict:
+        """Per data source: queries, cache hit rate, errors and fetch latency"""
+        return self.scraper.get_source_metrics()
+    
+    def get_citywide_insights(self) -> Dict:
+        """Citywide category histogram and rolling windows"""
+        return community_stats.summarize(self.memory_store.get_statistics()["citywide"])
     
     def categorize_complaint(self, complaint: str) -> str:
         """Categorize complaint by type"""
-        complaint_lower = complaint.lower()
-        
-        if any(word in complaint_lower for word in ['heat', 'heating', 'cold', 'temperature']):
-            return "heating_issues"
-        elif any(word in complaint_lower for word in ['mold', 'mould', 'fungus']):
-            return "mold_issues"  
-        elif any(word in complaint_lower for word in ['leak', 'water', 'flooding', 'drip']):
-            return "water_issues"
-        elif any(word in complaint_lower for word in ['pest', 'roach', 'mice', 'rat', 'bug']):
-            return "pest_issues"
-        elif any(word in complaint_lower for word in ['entry', 'enter', 'notice', 'privacy']):
-            return "privacy_violations"
-        elif any(word in complaint_lower for word in ['repair', 'broken', 'fix', 'maintenance']):
-            return "maintenance_issues"
-        else:
-            return "other_issues"
+        return self.classify_complaint(complaint)[0]
     
-    def is_duplicate_complaint(self, new_complaint: str, existing_complaints: List[Dict], session_id: str = None) -> bool:
+    def classify_complaint(self, complaint: str) -> Tuple[str, float]:
+        """Categorize a complaint and say how sure we are (see classify_complaint above)"""
+        return classify_complaint(complaint)
+    
+    def is_duplicate_complaint(self, new_complaint: str, existing_complaints: List[ComplaintRecord], session_id: str = None) -> bool:
         """Check if complaint is duplicate or too similar to recent ones"""
         if not existing_complaints:
             return False
             
         new_category = self.categorize_complaint(new_complaint)
-        now = datetime.now()
+        now = time.time()
         
         # Check for duplicates in last 24 hours
         for complaint in existing_complaints[-5:]:  # Check last 5 complaints
             try:
-                complaint_date = datetime.fromisoformat(complaint['date'])
-                hours_diff = (now - complaint_date).total_seconds() / 3600
+                hours_diff = (now - complaint.date) / 3600
                 
                 # If same category within 24 hours, likely duplicate
                 if hours_diff <= 24:
-                    existing_category = self.categorize_complaint(complaint['complaint'])
+                    existing_category = self.categorize_complaint(complaint.complaint)
                     if new_category == existing_category:
                         return True
                         
                 # If very similar text within 7 days, definitely duplicate
                 if hours_diff <= 168:  # 7 days
-                    similarity = len(set(new_complaint.lower().split()) & set(complaint['complaint'].lower().split()))
+                    similarity = len(set(new_complaint.lower().split()) & set(complaint.complaint.lower().split()))
                     if similarity >= 3:  # 3+ matching words
                         return True
             except:
@@ -114,10 +261,16 @@ class RightsGuardWorkflow:
     
     def store_complaint(self, address: str, complaint: str, landlord: str = None):
         """Store a new complaint in community memory with duplicate detection"""
+        # Hold the lock across read-modify-write so other processes don't lose updates
+        with self.memory_lock():
+            self._store_complaint_locked(address, complaint, landlord)
+    
+    def _store_complaint_locked(self, address: str, complaint: str, landlord: str = None):
+        """Store a complaint - caller must hold memory_lock()"""
         address_key = address.lower().strip()
         
-        # Get existing complaints for this building
-        existing_complaints = self.community_memory["buildings"].get(address_key, [])
+        # Duplicate checks only look at the last 5 complaints from the past week
+        existing_complaints = self.memory_store.recent(address_key, since=int(time.time()) - 7 * 86400, limit=5)
         
         # Check for duplicates (prevent spam and test noise)
         if self.is_duplicate_complaint(complaint, existing_complaints):
@@ -127,76 +280,135 @@ class RightsGuardWorkflow:
         # Categorize the complaint
         category = self.categorize_complaint(complaint)
         
-        complaint_record = {
-            "date": datetime.now().isoformat(),
-            "complaint": complaint[:150],  # Limit length for display
-            "category": category,
-            "landlord": landlord
-        }
-        
-        # Add to building history
-        if address_key not in self.community_memory["buildings"]:
-            self.community_memory["buildings"][address_key] = []
-        
-        self.community_memory["buildings"][address_key].append(complaint_record)
-        
-        # Update landlord tracking
-        if landlord:
-            landlord_key = landlord.lower().strip()
-            if landlord_key not in self.community_memory["landlords"]:
-                self.community_memory["landlords"][landlord_key] = []
-            
-            if address_key not in self.community_memory["landlords"][landlord_key]:
-                self.community_memory["landlords"][landlord_key].append(address_key)
-        
-        # Update statistics
-        self.community_memory["statistics"]["total_complaints"] += 1
+        complaint_record = ComplaintRecord(
+            date=int(time.time()),
+            complaint=complaint[:150],  # Limit length for display
+            category=category,
+            landlord=landlord
+        )
         
-        # Save to disk
-        self.save_community_memory()
+        # Add to building history, landlord tracking, statistics and running aggregates - then save
+        self.memory_store.add_complaint(address_key, landlord.lower().strip() if landlord else None, complaint_record)
         
         print(f"💾 Stored {category} complaint for {address} in Community Legal Memory")
     
-    def web_scraper_node(self, state: WorkflowState) -> WorkflowState:
+    def report_stage(self, config: RunnableConfig, stage: str):
+        """Tell the caller (UI, job queue) which stage this run has reached"""
+        on_stage = ((config or {}).get("configurable") or {}).get("on_stage")
+        if on_stage:
+            on_stage(stage)
+    
+    def get_cancel_token(self, config: RunnableConfig) -> CancelToken:
+        """The run's deadline/cancel flag (a token that never fires if the caller didn't pass one)"""
+        return ((config or {}).get("configurable") or {}).get("cancel_token") or CancelToken()
+    
+    def web_scraper_node(self, state: WorkflowState, config: RunnableConfig = None) -> WorkflowState:
         """Node 1: Web scraping for legal information"""
         print("\n🕷️ WebScraper Agent: Gathering legal information...")
+        self.report_stage(config, "scraping")
+        cancel_token = self.get_cancel_token(config)
         
         # Let the LLM determine relevant laws based on the complaint
         # This is smarter than web scraping!
         scraped_laws = []  # We'll let the AnalyzerAgent handle law identification
         
-        # Get NYC violation data
-        violation_data = self.scraper.search_nyc_open_data(state["building_address"])
+        # Get violation data from every source for the address's city
+        # (shared with any other run for the same address that's already fetching)
+        # Only the fields we use are kept from each row
+        # Each source only gets what's left of the run's deadline, and whatever comes back after
+        # the deadline is dropped - the analysis goes ahead without violation history
+        if cancel_token.stopped:
+            violation_data = []
+            cancel_token.note("violations: skipped (run stopped)")
+        else:
+            violation_data = self.violation_flight.do(
+                (state["jurisdiction"], normalize_address(state["building_address"])),
+                lambda: [ViolationRecord.from_dict(row) for row in self.scraper.search_violations(
+                    state["building_address"], state["jurisdiction"], cancel_token)],
+                cancel_token
+            )
+            if cancel_token.stopped:
+                violation_data = []
+                cancel_token.note("violations: dropped (fetch ran past the deadline)")
         
         # Get building history from Community Legal Memory
         building_history = self.get_building_history(state["building_address"])
         
+        # Precomputed building, landlord and citywide aggregates
+        stats = {
+            "building": self.get_building_insights(state["building_address"]),
+            "landlord": self.get_landlord_insights(state["tenant_info"].get("landlord")),
+            "citywide": self.get_citywide_insights(),
+            "neighborhood": self.get_neighborhood_insights(violation_data,
+                                                           self.classify_complaint(state["user_complaint"])[0])
+        }
+        
         # Update state
         state["scraped_laws"] = scraped_laws
         state["violation_data"] = violation_data
         state["building_history"] = building_history
+        state["community_stats"] = stats
         state["status"] = "scraping_complete"
         
         print(f"✅ Found {len(scraped_laws)} laws, {len(violation_data)} violations, {len(building_history)} community complaints")
         
         return state
     
-    def analyzer_node(self, state: WorkflowState) -> WorkflowState:
+    def analyzer_node(self, state: WorkflowState, config: RunnableConfig = None) -> WorkflowState:
         """Node 2: AI analysis of the complaint"""
         print("\n🧠 Analyzer Agent: Analyzing complaint with NVIDIA AI...")
+        self.report_stage(config, "analyzing")
+        cancel_token = self.get_cancel_token(config)
         
         # Use our AnalyzerAgent to analyze the complaint
-        analysis_result = self.analyzer.analyze_complaint(
-            user_complaint=state["user_complaint"],
-            scraped_laws=state["scraped_laws"],
-            violations_data=state["violation_data"]
+        # Identical complaints about the same building in flight together share one LLM call
+        # The complaint's category and how sure we are of it decide which model tier runs
+        category, confidence = self.classify_complaint(state["user_complaint"])
+        analysis_key = (normalize_complaint(state["user_complaint"]), normalize_address(state["building_address"]))
+        
+        # Fused mode writes the letter in the same call, so the tenant details become part of the key
+        tenant_info = state["tenant_info"] if self.fused_mode else None
+        if tenant_info is not None:
+            analysis_key += tuple(str(tenant_info.get(field, '')) for field in ('name', 'address', 'landlord', 'date'))
+        
+        # The call runs on the leader's deadline - followers wait only as long as their own run
+        # has left, and a fallback (or a leader that was cut short) isn't shared, they retry it
+        analysis_result = self.analysis_flight.do(
+            analysis_key,
+            lambda: self.analyzer.analyze_complaint(
+                user_complaint=state["user_complaint"],
+                scraped_laws=state["scraped_laws"],
+                violations_data=state["violation_data"],
+                complaint_category=category,
+                category_confidence=confidence,
+                tenant_info=tenant_info,
+                cancel_token=cancel_token,
+                jurisdiction=get_jurisdiction(state["jurisdiction"])
+            ),
+            cancel_token,
+            shareable=lambda result: not result.get("fallback")
         )
         
+        # Fused call came back with a letter - the letter node only has to finish it off
+        letter_content = analysis_result.pop("letter_content", None)
+        if letter_content:
+            state["final_letter"] = {
+                "letter_content": letter_content,
+                "generated_by": f"{analysis_result['source']} (fused with analysis)",
+                "model_tier": analysis_result.get("model_tier"),
+                "letter_type": "Tenant Complaint Letter"
+            }
+        
         # Add community insights
-        building_history = state["building_history"]
-        if building_history:
-            community_insight = f"\n🏢 COMMUNITY INSIGHT: This building has {len(building_history)} previous complaints. Risk level: {'HIGH' if len(building_history) >= 2 else 'MODERATE'}"
+        building = state["community_stats"]["building"]
+        previous_complaints = building["total"]
+        if previous_complaints:
+            community_insight = f"\n🏢 COMMUNITY INSIGHT: This building has {previous_complaints} previous complaints. Risk level: {building['risk_level']}"
             analysis_result["analysis"] += community_insight
+        neighborhood = state["community_stats"].get("neighborhood")
+        headline = neighborhood_stats.neighborhood_headline(neighborhood, category)
+        if headline:
+            analysis_result["analysis"] += f"\n📍 NEIGHBORHOOD: {headline}"
         
         state["analysis_result"] = analysis_result
         state["status"] = "analysis_complete"
@@ -205,43 +417,84 @@ class RightsGuardWorkflow:
         
         return state
     
-    def letter_generator_node(self, state: WorkflowState) -> WorkflowState:
+    def letter_generator_node(self, state: WorkflowState, config: RunnableConfig = None) -> WorkflowState:
         """Node 3: Generate legal complaint letter"""
         print("\n📝 Letter Agent: Generating complaint letter...")
-        
-        # Generate the letter using our LetterAgent
-        final_letter = self.letter.generate_complaint_letter(
-            analysis_data=state["analysis_result"],
-            tenant_info=state["tenant_info"]
-        )
+        self.report_stage(config, "generating")
+        cancel_token = self.get_cancel_token(config)
+        
+        # The guardrails turned the complaint away - no letter, and nothing for community memory
+        blocked_by = state["analysis_result"].get("blocked_by")
+        if blocked_by:
+            state["final_letter"] = {
+                "letter_content": "No complaint letter was written - this request is outside what RightsGuard can help with.",
+                "generated_by": "Local Guardrails",
+                "blocked_by": blocked_by,
+                "letter_type": "Not generated"
+            }
+            state["status"] = "letter_skipped"
+            print(f"🛡️ Letter skipped - input blocked by {blocked_by}")
+            return state
+        
+        # Generate the letter using our LetterAgent (unless fused mode already wrote it)
+        final_letter = state["final_letter"]
+        if not final_letter:
+            category, confidence = self.classify_complaint(state["user_complaint"])
+            final_letter = self.letter.generate_complaint_letter(
+                analysis_data=state["analysis_result"],
+                tenant_info=state["tenant_info"],
+                complaint_category=category,
+                category_confidence=confidence,
+                cancel_token=cancel_token,
+                jurisdiction=get_jurisdiction(state["jurisdiction"])
+            )
         
         # Add community memory reference if relevant
-        if state["building_history"]:
-            community_addendum = f"\n\nNote: Community records show {len(state['building_history'])} similar complaints at this address."
+        previous_complaints = state["community_stats"]["building"]["total"]
+        if previous_complaints:
+            community_addendum = f"\n\nNote: Community records show {previous_complaints} similar complaints at this address."
+            final_letter = dict(final_letter)  # our own copy - the letter cache may hold the original
             final_letter["letter_content"] += community_addendum
         
         state["final_letter"] = final_letter
         state["status"] = "letter_complete"
         
-        # Store this complaint in community memory
+        # Store this complaint in community memory (a run past its deadline still counts -
+        # one the user walked away from doesn't)
+        if cancel_token.cancelled:
+            cancel_token.note("complaint: not stored (run cancelled)")
+            print("🛑 Run cancelled - complaint not stored")
+            return state
         self.store_complaint(
             address=state["building_address"],
             complaint=state["user_complaint"],
             landlord=state["tenant_info"].get("landlord")
         )
+        # building_history and community_stats stay as they were before this complaint,
+        # so the result describes the building's previous complaints consistently
         
         print("✅ Letter generated and complaint stored in Community Legal Memory")
         
         return state
     
+    def profiled_node(self, node_name: str, node_fn: Callable) -> Callable:
+        """Wrap a node so it's sampled when the run's config carries a profiler"""
+        def run_node(state: WorkflowState, config: RunnableConfig = None) -> WorkflowState:
+            profiler = ((config or {}).get("configurable") or {}).get("profiler")
+            if profiler is None:
+                return node_fn(state, config)
+            with profiler.node(node_name):
+                return node_fn(state, config)
+        return run_node
+    
     def build_workflow(self) -> StateGraph:
         """Build the LangGraph workflow"""
         workflow = StateGraph(WorkflowState)
         
-        # Add our three agent nodes
-        workflow.add_node("web_scraper", self.web_scraper_node)
-        workflow.add_node("analyzer", self.analyzer_node)
-        workflow.add_node("letter_generator", self.letter_generator_node)
+        # Add our three agent nodes (each one profiled when the run asks for it)
+        workflow.add_node("web_scraper", self.profiled_node("web_scraper", self.web_scraper_node))
+        workflow.add_node("analyzer", self.profiled_node("analyzer", self.analyzer_node))
+        workflow.add_node("letter_generator", self.profiled_node("letter_generator", self.letter_generator_node))
         
         # Define the flow: WebScraper -> Analyzer -> LetterGenerator -> END
         workflow.set_entry_point("web_scraper")
@@ -251,40 +504,141 @@ class RightsGuardWorkflow:
         
         return workflow.compile()
     
-    def process_complaint(self, user_complaint: str, building_address: str, tenant_info: Dict) -> Dict:
-        """Main entry point - process a tenant complaint end-to-end"""
-        print(f"\n🏛️ Processing complaint for {building_address}...")
-        
-        # Initialize the workflow state
-        initial_state = WorkflowState(
+    def create_initial_state(self, user_complaint: str, building_address: str, tenant_info: Dict) -> WorkflowState:
+        """Initialize the workflow state for one run"""
+        return WorkflowState(
             user_complaint=user_complaint,
             building_address=building_address,
             tenant_info=tenant_info,
+            jurisdiction=detect_jurisdiction(building_address).key,
             scraped_laws=[],
             violation_data=[],
             building_history=[],
+            community_stats={},
             analysis_result={},
             final_letter={},
             status="initialized"
         )
-        
-        # Run the workflow
-        final_state = self.graph.invoke(initial_state)
-        
-        # Return the complete result
-        return {
+    
+    def build_result(self, final_state: WorkflowState, cancel_token: CancelToken = None) -> Dict:
+        """Turn the final workflow state into the result the UI shows"""
+        result = {
+            "jurisdiction": final_state["jurisdiction"],
             "letter": final_state["final_letter"],
             "analysis": final_state["analysis_result"],
             "community_insights": {
-                "building_history": final_state["building_history"],
+                "building_history": to_dicts(final_state["building_history"]),
                 "violation_count": len(final_state["violation_data"]),
-                "total_community_complaints": self.community_memory["statistics"]["total_complaints"]
+                "total_community_complaints": self.get_total_complaints(),
+                "stats": final_state["community_stats"]
             },
             "sources": {
                 "laws": final_state["scraped_laws"],
-                "violations": final_state["violation_data"]
+                "violations": to_dicts(final_state["violation_data"])
             }
         }
+        if cancel_token is not None:
+            # Whether the run was cut short and which steps fell back because of it
+            result["deadline"] = cancel_token.get_status()
+        return result
+    
+    def process_complaint(self, user_complaint: str, building_address: str, tenant_info: Dict,
+                          on_stage: Callable[[str], None] = None, profile: bool = None,
+                          deadline: float = None, cancel_token: CancelToken = None) -> Dict:
+        """
+        Main entry point - process a tenant complaint end-to-end
+        on_stage is called with 'scraping', 'analyzing', 'generating' and 'complete' as the run progresses
+        profile=True samples every node (None = sampled at RIGHTSGUARD_PROFILE_RATE)
+        deadline: seconds the run may take (default RIGHTSGUARD_RUN_DEADLINE) - past it the remaining
+        steps use their fallbacks and result["deadline"] lists what was cut short
+        cancel_token: pass one to be able to cancel() the run from another thread
+        """
+        print(f"\n🏛️ Processing complaint for {building_address}...")
+        
+        initial_state = self.create_initial_state(user_complaint, building_address, tenant_info)
+        profiler = run_profiler.start_run(profile)
+        cancel_token = cancel_token or CancelToken(deadline if deadline is not None else DEFAULT_RUN_DEADLINE)
+        
+        # Run the workflow
+        final_state = self.graph.invoke(initial_state, config={"configurable": {"on_stage": on_stage,
+                                                                                "profiler": profiler,
+                                                                                "cancel_token": cancel_token}})
+        if on_stage:
+            on_stage("complete")
+        
+        # Return the complete result
+        result = self.build_result(final_state, cancel_token)
+        if profiler:
+            result["profile"] = profiler.write()
+        return result
+    
+    def stream_complaint(self, user_complaint: str, building_address: str, tenant_info: Dict,
+                         profile: bool = None, deadline: float = None,
+                         cancel_token: CancelToken = None) -> Iterator[Dict]:
+        """
+        Process a complaint and yield progress events as each agent starts and finishes:
+          {"event": "node_start", "node", "stage", "elapsed"}
+          {"event": "node_end", "node", "stage", "elapsed", "duration", "state"}
+          {"event": "complete", "elapsed", "timings", "result"}
+        node_end carries the state so far, so violations and community history
+        can be shown as soon as the scraper is done
+        deadline/cancel_token work as in process_complaint; closing the generator early cancels the run
+        """
+        print(f"\n🏛️ Streaming complaint for {building_address}...")
+        
+        state = dict(self.create_initial_state(user_complaint, building_address, tenant_info))
+        profiler = run_profiler.start_run(profile)
+        cancel_token = cancel_token or CancelToken(deadline if deadline is not None else DEFAULT_RUN_DEADLINE)
+        timings = {}
+        run_started = time.perf_counter()
+        
+        node = NODE_ORDER[0]
+        yield {"event": "node_start", "node": node, "stage": NODE_STAGES[node], "elapsed": 0.0}
+        
+        # stream_mode="updates" gives us one chunk per finished node
+        chunks = self.graph.stream(state, config={"configurable": {"profiler": profiler, "cancel_token": cancel_token}},
+                                   stream_mode="updates")
+        try:
+            yield from self._stream_events(chunks, state, timings, run_started)
+        except GeneratorExit:
+            # Nobody is listening any more - stop spending on this run
+            cancel_token.cancel("stream closed")
+            raise
+        
+        result = self.build_result(state, cancel_token)
+        if profiler:
+            result["profile"] = profiler.write()
+        yield {
+            "event": "complete",
+            "elapsed": time.perf_counter() - run_started,
+            "timings": timings,
+            "result": result
+        }
+    
+    def _stream_events(self, chunks, state: Dict, timings: Dict, run_started: float) -> Iterator[Dict]:
+        """node_end/node_start events for stream_complaint as each graph update arrives"""
+        node_started = run_started
+        for chunk in chunks:
+            for node, update in chunk.items():
+                now = time.perf_counter()
+                timings[node] = now - node_started
+                state.update(update or {})
+                yield {
+                    "event": "node_end",
+                    "node": node,
+                    "stage": NODE_STAGES[node],
+                    "elapsed": now - run_started,
+                    "duration": timings[node],
+                    "state": dict(state)
+                }
+                
+                # The graph is a straight line, so the next node starts right away
+                next_index = NODE_ORDER.index(node) + 1
+                if next_index < len(NODE_ORDER):
+                    next_node = NODE_ORDER[next_index]
+                    node_started = time.perf_counter()
+                    yield {"event": "node_start", "node": next_node, "stage": NODE_STAGES[next_node],
+                           "elapsed": node_started - run_started}
 
 # Test the workflow
 if __name__ == "__main__":